@@ -0,0 +1,113 @@
+# app/benchmarks/corpus.py
+"""
+Deterministic synthetic documents (txt, md, pdf) for the benchmarks.
+
+Text is drawn from a fixed vocabulary plus part numbers and clause ids,
+so lexical and vector search both have something to find. PDFs are
+written directly (one Helvetica text stream per page) to avoid a PDF
+library dependency; pypdf extracts them like any other text PDF.
+"""
+from __future__ import annotations
+
+import random
+from typing import List, Tuple
+
+_WORDS = (
+    "policy staff contractor access badge server backup retention invoice supplier audit "
+    "incident report manager approval budget quarter release deploy rollback network vendor "
+    "training safety equipment warranty license renewal customer ticket escalation review "
+    "storage encryption password rotation schedule maintenance pump valve seal inspection"
+).split()
+
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+
+
+def sentence(rng: random.Random, words: int = WORDS_PER_LINE) -> str:
+    out = [rng.choice(_WORDS) for _ in range(words)]
+    if rng.random() < 0.3:
+        out[rng.randrange(words)] = f"PN-{rng.randrange(10000):04d}"
+    if rng.random() < 0.2:
+        out[rng.randrange(words)] = f"{rng.randrange(1, 20)}.{rng.randrange(1, 10)}.{rng.randrange(1, 10)}"
+    out[0] = out[0][:1].upper() + out[0][1:]
+    return " ".join(out) + "."
+
+
+def pages(rng: random.Random, count: int) -> List[List[str]]:
+    return [[sentence(rng) for _ in range(LINES_PER_PAGE)] for _ in range(count)]
+
+
+def make_document(kind: str, n_pages: int, seed: int) -> Tuple[str, bytes]:
+    """
+    One synthetic document.
+
+    Parameters
+    ----------
+    kind : str
+        "txt", "md" or "pdf".
+    n_pages : int
+        PDF pages; txt/md documents get the same amount of text.
+    seed : int
+        Makes the content (and its hash) reproducible and distinct per seed.
+
+    Returns
+    -------
+    tuple[str, bytes]
+        Filename and content.
+    """
+    rng = random.Random(seed)
+    body = pages(rng, n_pages)
+    name = f"synthetic-{seed:05d}.{kind}"
+    if kind == "pdf":
+        return name, pdf_bytes(body)
+    if kind == "md":
+        parts = []
+        for i, lines in enumerate(body):
+            parts.append(f"## Section {i + 1}\n\n" + "\n".join(lines))
+        return name, (f"# Document {seed}\n\n" + "\n\n".join(parts)).encode()
+    if kind == "txt":
+        return name, "\n\n".join("\n".join(lines) for lines in body).encode()
+    raise ValueError(f"Unknown document kind: {kind}")
+
+
+def pdf_bytes(page_lines: List[List[str]]) -> bytes:
+    """Minimal PDF 1.4 with one text page per entry of `page_lines`."""
+    objects: List[bytes] = []
+    n = len(page_lines)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, lines in enumerate(page_lines):
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text} ET".encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def questions(count: int, seed: int = 0) -> List[str]:
+    """Distinct questions, so neither the retrieval nor the query-embedding cache is hit."""
+    rng = random.Random(seed)
+    return [f"{i}: what does the {rng.choice(_WORDS)} {rng.choice(_WORDS)} say about "
+            f"{rng.choice(_WORDS)} PN-{rng.randrange(10000):04d}?" for i in range(count)]
+
+
+#########* helpers
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
@@ -0,0 +1,98 @@
+# app/benchmarks/fake_llm.py
+"""
+Local stand-in for the OpenRouter `/chat/completions` endpoint.
+
+Answers after `latency_ms` (time to first token), then emits `tokens`
+tokens `token_ms` apart, either as one JSON response or as an SSE stream
+in OpenRouter's format (including the keep-alive comment and a final
+usage chunk), so /ask can be measured end to end without network access.
+
+    python -m app.benchmarks.fake_llm --port 18080 --latency-ms 300
+"""
+from __future__ import annotations
+
+import json
+import time
+import asyncio
+import argparse
+import threading
+from dataclasses import dataclass
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeLLMConfig:
+    latency_ms: float = 200.0
+    tokens: int = 40
+    token_ms: float = 5.0
+    model: str = "fake/benchmark"
+
+
+def build_app(conf: FakeLLMConfig) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        words = [f"word{i}" for i in range(conf.tokens)]
+        usage = {"prompt_tokens": sum(len(m.get("content", "")) // 4 for m in body.get("messages", [])),
+                 "completion_tokens": conf.tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            async def events():
+                yield ": OPENROUTER PROCESSING\n\n"
+                await asyncio.sleep(conf.latency_ms / 1000)
+                for w in words:
+                    chunk = {"model": conf.model, "choices": [{"delta": {"content": w + " "}}]}
+                    yield "data: " + json.dumps(chunk) + "\n\n"
+                    if conf.token_ms:
+                        await asyncio.sleep(conf.token_ms / 1000)
+                yield "data: " + json.dumps({"model": conf.model, "choices": [], "usage": usage}) + "\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep((conf.latency_ms + conf.tokens * conf.token_ms) / 1000)
+        return JSONResponse({
+            "model": conf.model,
+            "choices": [{"message": {"role": "assistant", "content": " ".join(words)}}],
+            "usage": usage,
+        })
+
+    return app
+
+
+def serve_in_thread(app, port: int, host: str = "127.0.0.1"):
+    """Runs an ASGI app with uvicorn on a daemon thread; returns (server, thread) once it accepts connections."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="error", lifespan="on"))
+    thread = threading.Thread(target=server.run, name=f"uvicorn-{port}", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"server on port {port} did not start")
+        time.sleep(0.02)
+    return server, thread
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--port", type=int, default=18080)
+    p.add_argument("--latency-ms", type=float, default=200.0)
+    p.add_argument("--tokens", type=int, default=40)
+    p.add_argument("--token-ms", type=float, default=5.0)
+    args = p.parse_args()
+
+    import uvicorn
+
+    conf = FakeLLMConfig(args.latency_ms, args.tokens, args.token_ms)
+    uvicorn.run(build_app(conf), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
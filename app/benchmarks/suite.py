@@ -0,0 +1,294 @@
+# app/benchmarks/suite.py
+"""
+Offline benchmark suite: ingest throughput, retrieval latency and /ask end to end.
+
+    python -m app.benchmarks.suite --sizes 10,50,200 --out bench.json
+    python -m app.benchmarks.suite --compare old.json new.json
+
+Runs in a throwaway data directory with a local fake /chat/completions
+server (see fake_llm.py), so nothing touches the real index or network.
+For each cumulative corpus size it ingests synthetic txt/md/pdf documents
+through `indexer.ingest_upload` (pages/s, chunks/s) and measures
+`get_context` p50/p95/p99 for several k; after the last size it serves
+the app with uvicorn and drives `/ask` and `/ask/stream` at several
+concurrency levels. Questions are all distinct, so caches don't flatter
+the numbers. `--embeddings fake` swaps the model for a deterministic
+stand-in, to measure the pipeline itself where the model isn't available.
+"""
+from __future__ import annotations
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+_LOWER_IS_BETTER = ("_ms", "seconds")
+_HIGHER_IS_BETTER = ("_per_s",)
+
+
+def percentiles(samples_ms: list[float]) -> dict:
+    if not samples_ms:
+        return {}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "mean_ms": round(float(np.mean(samples_ms)), 2), "n": len(samples_ms)}
+
+
+def compare(old: dict, new: dict, path: str = "") -> list[str]:
+    """Lines describing how every numeric metric changed between two reports."""
+    lines = []
+    for key, value in new.items():
+        if key == "meta":
+            continue
+        before = old.get(key) if isinstance(old, dict) else None
+        name = f"{path}.{key}" if path else key
+        if isinstance(value, list) and isinstance(before, list):
+            value, before = dict(enumerate(value)), dict(enumerate(before))
+        if isinstance(value, dict) and isinstance(before, dict):
+            lines.extend(compare(before, value, name))
+        elif isinstance(value, (int, float)) and isinstance(before, (int, float)) and before and key != "n":
+            change = (value - before) / before * 100
+            worse = (change > 0 and key.endswith(_LOWER_IS_BETTER)) or (change < 0 and key.endswith(_HIGHER_IS_BETTER))
+            flag = "  <-- regression" if worse and abs(change) >= 10 else ""
+            lines.append(f"{name}: {before} -> {value} ({change:+.1f}%){flag}")
+    return lines
+
+
+def main(argv: list[str] | None = None) -> dict:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", default="10,50,200", help="cumulative corpus sizes, in documents")
+    p.add_argument("--pages", type=int, default=5, help="pages per document (txt/md get as much text)")
+    p.add_argument("--kinds", default="txt,md,pdf")
+    p.add_argument("--ks", default="2,4,8", help="k values for get_context")
+    p.add_argument("--queries", type=int, default=100, help="get_context calls per size and k")
+    p.add_argument("--concurrency", default="1,4,16", help="concurrent /ask clients")
+    p.add_argument("--requests", type=int, default=64, help="/ask requests per concurrency level")
+    p.add_argument("--llm-latency-ms", type=float, default=200.0, help="fake upstream time to first token")
+    p.add_argument("--llm-tokens", type=int, default=40)
+    p.add_argument("--llm-token-ms", type=float, default=5.0)
+    p.add_argument("--embeddings", choices=["model", "fake"], default="model")
+    p.add_argument("--skip-ask", action="store_true", help="only ingest and retrieval")
+    p.add_argument("--workdir", help="keep data here instead of a temporary directory")
+    p.add_argument("--out", help="write the JSON report here instead of stdout")
+    p.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two reports and exit")
+    args = p.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            print("\n".join(compare(json.load(f_old), json.load(f_new))))
+        return {}
+
+    # settings are read at import time, so point them at the sandbox first
+    if "app.config" in sys.modules:
+        raise SystemExit("run the suite in a fresh interpreter: python -m app.benchmarks.suite")
+    work = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    llm_port = _free_port()
+    os.environ.update({
+        "DATA_DIR": os.path.join(work, "docs"),
+        "CHROMA_DIR": os.path.join(work, "chroma"),
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "OPENROUTER_API_KEY": "benchmark",
+        "WARMUP_ON_STARTUP": "false",
+    })
+
+    from app import config as cfg
+    from app.services import indexer, jobs
+
+    if args.embeddings == "fake":
+        _use_fake_embeddings(indexer, cfg)
+
+    report = {"meta": _meta(cfg, args), "sizes": []}
+    try:
+        # model load and parse-pool spawn are startup costs, not ingest throughput
+        report["warm_up"] = indexer.warm_up()
+        asyncio.run(_ingest_and_retrieve(args, report))
+        if not args.skip_ask:
+            report["ask"] = _ask_end_to_end(args, llm_port)
+    finally:
+        jobs.shutdown()
+        indexer.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+#########* helpers
+
+async def _ingest_and_retrieve(args, report: dict) -> None:
+    from starlette.datastructures import UploadFile
+    from app.benchmarks.corpus import make_document, questions
+    from app.routes import ask
+    from app.services import indexer
+
+    kinds = args.kinds.split(",")
+    ks = [int(k) for k in args.ks.split(",")]
+    ingested = 0
+    doc_ids: list[str] = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        latencies, started = [], time.perf_counter()
+        for seed in range(ingested, size):
+            name, data = make_document(kinds[seed % len(kinds)], args.pages, seed)
+            t = time.perf_counter()
+            res = await indexer.ingest_upload(UploadFile(io.BytesIO(data), filename=name))
+            latencies.append((time.perf_counter() - t) * 1000)
+            doc_ids.append(res["doc_id"])
+        elapsed = time.perf_counter() - started
+        new = [indexer.get_document(d) for d in doc_ids[ingested:]]
+        pages, chunks = sum(d["pages"] for d in new), sum(d["chunks"] for d in new)
+        entry = {
+            "documents": size,
+            "chunks_total": indexer._db().count(),
+            "ingest": {
+                "documents": len(new),
+                "pages": pages,
+                "chunks": chunks,
+                "seconds": round(elapsed, 3),
+                "pages_per_s": round(pages / elapsed, 2) if elapsed else None,
+                "chunks_per_s": round(chunks / elapsed, 2) if elapsed else None,
+                "per_document": percentiles(latencies),
+            },
+            "get_context": {},
+        }
+        ingested = size
+
+        for k in ks:
+            samples = []
+            for q in questions(args.queries, seed=size * 1000 + k):
+                t = time.perf_counter()
+                await ask.get_context(q, k)
+                samples.append((time.perf_counter() - t) * 1000)
+            entry["get_context"][f"k={k}"] = percentiles(samples)
+        report["sizes"].append(entry)
+        print(f"size {size}: {entry['ingest']['pages_per_s']} pages/s, "
+              f"get_context k={ks[-1]} p50 {entry['get_context'][f'k={ks[-1]}']['p50_ms']} ms", file=sys.stderr)
+
+
+def _ask_end_to_end(args, llm_port: int) -> dict:
+    import httpx
+    from app.main import app
+    from app.benchmarks.corpus import questions
+    from app.benchmarks.fake_llm import FakeLLMConfig, build_app, serve_in_thread
+
+    llm, llm_thread = serve_in_thread(
+        build_app(FakeLLMConfig(args.llm_latency_ms, args.llm_tokens, args.llm_token_ms)), llm_port
+    )
+    api_port = _free_port()
+    api, api_thread = serve_in_thread(app, api_port)
+    base = f"http://127.0.0.1:{api_port}"
+
+    async def run_level(concurrency: int, seed: int) -> dict:
+        sem = asyncio.Semaphore(concurrency)
+        plain, stream_ttft, stream_total, errors = [], [], [], 0
+        limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+        async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as client:
+
+            async def one(i: int, q: str):
+                nonlocal errors
+                async with sem:
+                    t = time.perf_counter()
+                    if i % 2 == 0:
+                        r = await client.post("/ask/", json={"question": q})
+                        if r.status_code != 200:
+                            errors += 1
+                            return
+                        plain.append((time.perf_counter() - t) * 1000)
+                        return
+                    first = None
+                    async with client.stream("POST", "/ask/stream", json={"question": q}) as r:
+                        if r.status_code != 200:
+                            errors += 1
+                            return
+                        async for line in r.aiter_lines():
+                            if first is None and line.startswith("event: token"):
+                                first = (time.perf_counter() - t) * 1000
+                            if line.startswith("event: error"):
+                                errors += 1
+                    if first is not None:
+                        stream_ttft.append(first)
+                    stream_total.append((time.perf_counter() - t) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i, q) for i, q in enumerate(questions(args.requests, seed=seed))))
+            elapsed = time.perf_counter() - started
+        return {
+            "requests": args.requests,
+            "errors": errors,
+            "requests_per_s": round(args.requests / elapsed, 2),
+            "ask": percentiles(plain),
+            "stream_first_token": percentiles(stream_ttft),
+            "stream_total": percentiles(stream_total),
+        }
+
+    try:
+        out = {"llm_latency_ms": args.llm_latency_ms, "llm_tokens": args.llm_tokens,
+               "llm_token_ms": args.llm_token_ms, "levels": {}}
+        for level in [int(c) for c in args.concurrency.split(",")]:
+            out["levels"][f"c={level}"] = asyncio.run(run_level(level, seed=90_000 + level))
+            print(f"/ask c={level}: {out['levels'][f'c={level}']['requests_per_s']} req/s", file=sys.stderr)
+        return out
+    finally:
+        api.should_exit = llm.should_exit = True
+        api_thread.join(timeout=10)
+        llm_thread.join(timeout=10)
+
+
+def _use_fake_embeddings(indexer, cfg) -> None:
+    """Deterministic 768-d vectors in place of the model, wrapped like the real one (minus the disk cache)."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.services.batcher import EmbedBatcher
+    from app.services.cache import LRUCache
+    from app.services.embed_cache import CachedEmbeddings
+
+    inner = DeterministicFakeEmbedding(size=768)
+    batcher = EmbedBatcher(inner.embed_documents, cfg.QUERY_BATCH_MAX, cfg.QUERY_BATCH_WAIT_MS) \
+        if cfg.QUERY_BATCH_MAX > 1 else None
+    indexer._embeddings = CachedEmbeddings(inner, None, "fake", query_cache=LRUCache(cfg.QUERY_EMBED_CACHE_SIZE),
+                                           batcher=batcher)
+
+
+def _meta(cfg, args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "config": {
+            "embed_model": "fake" if args.embeddings == "fake" else cfg.EMBED_MODEL,
+            "vector_backend": cfg.VECTOR_BACKEND,
+            "hybrid_search": cfg.HYBRID_SEARCH,
+            "retrieval_k": cfg.RETRIEVAL_K,
+            "chunk_size": cfg.SPLIT_CHUNK_SIZE,
+            "embed_batch_size": cfg.EMBED_BATCH_SIZE,
+            "parse_workers": cfg.PARSE_WORKERS,
+        },
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# app/benchmarks/vector_stores.py
+"""
+Chroma vs the memory-mapped NumPy store (exact and IVF) on synthetic embeddings.
+
+    python -m app.benchmarks.vector_stores --rows 100000 --dim 768 --ivf-lists 256
+
+Vectors are drawn around random cluster centres (real embeddings are far
+from uniform, and IVF depends on that), written in ingestion-sized batches,
+then queried one at a time. Prints one JSON object: insert throughput,
+query latency percentiles, recall@k against exact search and disk usage
+per backend.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from app.services.vectorstore import ChromaStore, NumpyStore, VectorStore
+
+
+def synthetic(rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vecs = centers[rng.integers(clusters, size=rows)] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def run(store: VectorStore, vecs: np.ndarray, queries: np.ndarray, k: int, batch: int,
+        truth: list | None = None) -> tuple[dict, list]:
+    ids = [f"doc:{i}" for i in range(len(vecs))]
+    metas = [{"doc_id": f"doc{i // 100}", "ord": i % 100} for i in range(len(vecs))]
+    t = time.perf_counter()
+    for i in range(0, len(vecs), batch):
+        store.add(ids[i:i + batch], ids[i:i + batch], metas[i:i + batch], vecs[i:i + batch])
+    insert_s = time.perf_counter() - t
+
+    store.query(queries[0], k)  # first query pays for lazy loading
+    latencies, results = [], []
+    for q in queries:
+        t = time.perf_counter()
+        results.append(store.query(q, k).ids)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    out = {
+        "insert_seconds": round(insert_s, 3),
+        "insert_rows_per_s": round(len(vecs) / insert_s, 1),
+        "query_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "query_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "query_ms_p99": round(float(np.percentile(latencies, 99)), 3),
+    }
+    if truth is not None:
+        out[f"recall_at_{k}"] = round(float(np.mean([len(set(a) & set(b)) / k for a, b in zip(truth, results)])), 4)
+    return out, results
+
+
+def dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=20_000)
+    p.add_argument("--dim", type=int, default=768)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=16, help="candidates fetched per query (RETRIEVAL_K * MMR_FETCH_MULTIPLIER)")
+    p.add_argument("--batch", type=int, default=64, help="rows per add call (EMBED_BATCH_SIZE)")
+    p.add_argument("--clusters", type=int, default=200)
+    p.add_argument("--ivf-lists", type=int, default=0, help="0 picks ~sqrt(rows)")
+    p.add_argument("--nprobe", type=int, default=8)
+    p.add_argument("--backends", default="numpy,ivf,chroma")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    vecs = synthetic(args.rows, args.dim, args.clusters, args.seed)
+    queries = synthetic(args.queries, args.dim, args.clusters, args.seed + 1)
+    lists = args.ivf_lists or max(1, int(np.sqrt(args.rows)))
+    root = tempfile.mkdtemp(prefix="vector-bench-")
+    report = {"rows": args.rows, "dim": args.dim, "k": args.k, "queries": args.queries, "backends": {}}
+    try:
+        exact, truth = run(NumpyStore(os.path.join(root, "numpy")), vecs, queries, args.k, args.batch)
+        backends = args.backends.split(",")
+        if "numpy" in backends:
+            report["backends"]["numpy"] = {**exact, f"recall_at_{args.k}": 1.0, "bytes": dir_bytes(os.path.join(root, "numpy"))}
+        if "ivf" in backends:
+            store = NumpyStore(os.path.join(root, "ivf"), ivf_lists=lists, nprobe=args.nprobe)
+            res, _ = run(store, vecs, queries, args.k, args.batch, truth)
+            report["backends"]["numpy_ivf"] = {**res, "lists": lists, "nprobe": args.nprobe,
+                                               "bytes": dir_bytes(os.path.join(root, "ivf"))}
+        if "chroma" in backends:
+            store = ChromaStore(os.path.join(root, "chroma"), "bench")
+            res, _ = run(store, vecs, queries, args.k, args.batch, truth)
+            report["backends"]["chroma"] = {**res, "bytes": dir_bytes(os.path.join(root, "chroma"))}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,12 @@ def _as_float(name: str, default: float) -> float:
     except ValueError:
         return default
 
+def _as_bool(name: str, default: bool) -> bool:
+    val = os.getenv(name)
+    if val is None:
+        return default
+    return val.strip().lower() in {"1", "true", "yes", "on"}
+
 def _as_list(name: str, default_list: list[str]) -> list[str]:
     val = os.getenv(name)
     if not val:
@@ -45,25 +51,99 @@ OPENROUTER_MODEL: str = os.getenv("OPENROUTER_MODEL", "tngtech/deepseek-r1t2-chi
 
 # Retrieval
 RETRIEVAL_K: int = _as_int("RETRIEVAL_K", 4)
+MAX_RETRIEVAL_K: int = _as_int("MAX_RETRIEVAL_K", 20)              # largest `k` a request may ask for
+QUERY_EMBED_CACHE_SIZE: int = _as_int("QUERY_EMBED_CACHE_SIZE", 1024)  # in-process LRU of question vectors
+QUERY_BATCH_MAX: int = _as_int("QUERY_BATCH_MAX", 16)                   # questions per batched encode, <= 1 disables batching
+QUERY_BATCH_WAIT_MS: float = _as_float("QUERY_BATCH_WAIT_MS", 3.0)      # how long the first question waits for company
+RETRIEVAL_CACHE_SIZE: int = _as_int("RETRIEVAL_CACHE_SIZE", 1024)      # in-process LRU of search results, 0 disables
+HYBRID_SEARCH: bool = _as_bool("HYBRID_SEARCH", True)                   # fuse BM25 hits with vector hits
+HYBRID_FETCH_MULTIPLIER: int = _as_int("HYBRID_FETCH_MULTIPLIER", 4)    # candidates per side = k * this
+RRF_K: int = _as_int("RRF_K", 60)
+MMR_FETCH_MULTIPLIER: int = _as_int("MMR_FETCH_MULTIPLIER", 4)         # MMR candidate pool = k * this
+MMR_LAMBDA: float = _as_float("MMR_LAMBDA", 0.7)                        # 1.0 = relevance only, lower = more diverse
+DEDUP_COSINE: float = _as_float("DEDUP_COSINE", 0.95)                   # drop candidates this similar to a picked chunk
+CONTEXT_TOKEN_BUDGET: int = _as_int("CONTEXT_TOKEN_BUDGET", 3000)      # estimated tokens of context per prompt
+ANSWER_CACHE_SIZE: int = _as_int("ANSWER_CACHE_SIZE", 0)                # semantic answer cache entries (services/answer_cache.py), 0 disables
+ANSWER_CACHE_TTL: float = _as_float("ANSWER_CACHE_TTL", 3600.0)         # seconds a cached answer may be served
+ANSWER_CACHE_THRESHOLD: float = _as_float("ANSWER_CACHE_THRESHOLD", 0.95)  # question cosine needed to reuse an answer
 
 # Data + Vector store
 DATA_DIR: str = _path_from_env("DATA_DIR", default="app/data/docs")
 CHROMA_DIR: str = _path_from_env("CHROMA_DIR", "CHROMA_PERSIST_DIR", default="app/data/chroma")
 CHROMA_COLLECTION: str = os.getenv("CHROMA_COLLECTION", "docs")
+VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" or "numpy" (memory-mapped, see services/vectorstore.py)
+VECTOR_DIR: str = _path_from_env("VECTOR_DIR", default=str(Path(CHROMA_DIR).parent / "vectors"))
+IVF_LISTS: int = _as_int("IVF_LISTS", 0)     # numpy backend: IVF partitions, 0 = exact search only
+IVF_NPROBE: int = _as_int("IVF_NPROBE", 8)   # partitions scanned per query
+HNSW_M: int = _as_int("HNSW_M", 0)                              # chroma backend: graph degree of new collections, 0 = Chroma's default (16)
+HNSW_CONSTRUCTION_EF: int = _as_int("HNSW_CONSTRUCTION_EF", 0)  # candidate list while building, 0 = default (100)
+HNSW_SEARCH_EF: int = _as_int("HNSW_SEARCH_EF", 0)              # candidate list per query, 0 = default (100); recall vs latency
+MAINTENANCE_SAMPLE: int = _as_int("MAINTENANCE_SAMPLE", 100)    # queries behind the recall/latency report of /admin/index/rebuild
+INDEX_SERVICE_SOCKET: str = os.getenv("INDEX_SERVICE_SOCKET", "")           # Unix socket of a shared index service, empty = in-process
+INDEX_SERVICE_TIMEOUT: float = _as_float("INDEX_SERVICE_TIMEOUT", 300.0)   # seconds per call (large embed batches on CPU)
+DEFAULT_TENANT: str = os.getenv("DEFAULT_TENANT", "default")     # tenant of requests without X-Tenant-ID; its shard uses the paths above
+SHARD_FANOUT_WORKERS: int = _as_int("SHARD_FANOUT_WORKERS", 8)   # threads searching shards in parallel when a question spans tenants
+MAX_TENANTS_PER_QUERY: int = _as_int("MAX_TENANTS_PER_QUERY", 16)
+SHARD_STATS_WINDOW: int = _as_int("SHARD_STATS_WINDOW", 1000)     # recent searches per shard behind the p50/p95 in /admin/shards
+SNAPSHOT_DIR: str = _path_from_env("SNAPSHOT_DIR", default=str(Path(CHROMA_DIR).parent / "snapshots"))  # /admin/snapshot/* names live here
+SNAPSHOT_BATCH: int = _as_int("SNAPSHOT_BATCH", 4096)            # rows per bulk read/write when exporting or importing a snapshot
 
 # Embeddings and splitting
 EMBED_MODEL: str = os.getenv("EMBED_MODEL", "intfloat/e5-base-v2")
 SPLIT_CHUNK_SIZE: int = _as_int("SPLIT_CHUNK_SIZE", 1000)
 SPLIT_CHUNK_OVERLAP: int = _as_int("SPLIT_CHUNK_OVERLAP", 150)
 
+# Embedding cache (lives next to the Chroma directory unless overridden)
+EMBED_CACHE_PATH: str = _path_from_env("EMBED_CACHE_PATH", default=str(Path(CHROMA_DIR).parent / "embed_cache.sqlite"))
+LEXICAL_INDEX_PATH: str = _path_from_env("LEXICAL_INDEX_PATH", default=str(Path(CHROMA_DIR).parent / "lexical.sqlite"))
+CATALOG_PATH: str = _path_from_env("CATALOG_PATH", default=str(Path(CHROMA_DIR).parent / "catalog.sqlite"))
+EMBED_CACHE_MAX_ENTRIES: int = _as_int("EMBED_CACHE_MAX_ENTRIES", 50_000)  # 0 disables the cache
+
 # Upload constraints
 ALLOWED_EXTS: list[str] = _as_list("ALLOWED_EXTS", [".txt", ".md", ".pdf"])
 MAX_UPLOAD_MB: int = _as_int("MAX_UPLOAD_MB", 25)
+UPLOAD_BLOCK_BYTES: int = _as_int("UPLOAD_BLOCK_BYTES", 1024 * 1024)  # read/write block size when saving uploads
 
-# HTTP client
+# Startup
+WARMUP_ON_STARTUP: bool = _as_bool("WARMUP_ON_STARTUP", False)  # load model + open collection before /ready passes
+
+# Background ingestion
+PARSE_WORKERS: int = _as_int("PARSE_WORKERS", 2)      # processes for text extraction + splitting
+INGEST_WORKERS: int = _as_int("INGEST_WORKERS", 1)    # threads for embedding + upsert
+EMBED_BATCH_SIZE: int = _as_int("EMBED_BATCH_SIZE", 64)         # chunks per embed + upsert call
+PARSE_PAGES_PER_TASK: int = _as_int("PARSE_PAGES_PER_TASK", 8)  # PDF pages per parse task
+PARSE_WINDOW: int = _as_int("PARSE_WINDOW", 2 * PARSE_WORKERS)  # parse tasks in flight per document
+JOB_HISTORY: int = _as_int("JOB_HISTORY", 200)        # finished jobs kept for GET /files/jobs/{id}
+
+# HTTP client (one pooled client per process, see services/upstream.py)
 HTTP_TIMEOUT_SECONDS: float = _as_float("HTTP_TIMEOUT_SECONDS", 60.0)
+HTTP_CONNECT_TIMEOUT: float = _as_float("HTTP_CONNECT_TIMEOUT", 5.0)
+HTTP_READ_TIMEOUT: float = _as_float("HTTP_READ_TIMEOUT", HTTP_TIMEOUT_SECONDS)  # also the max gap between streamed chunks
+HTTP_WRITE_TIMEOUT: float = _as_float("HTTP_WRITE_TIMEOUT", 10.0)
+HTTP_POOL_TIMEOUT: float = _as_float("HTTP_POOL_TIMEOUT", 5.0)                   # wait for a free pooled connection
+HTTP_MAX_CONNECTIONS: int = _as_int("HTTP_MAX_CONNECTIONS", 100)
+HTTP_MAX_KEEPALIVE: int = _as_int("HTTP_MAX_KEEPALIVE", 20)
+HTTP_KEEPALIVE_EXPIRY: float = _as_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+HTTP2: bool = _as_bool("HTTP2", False)  # needs the optional 'h2' package
 HTTP_REFERER: str = os.getenv("HTTP_REFERER", "http://localhost")
 HTTP_TITLE: str = os.getenv("HTTP_TITLE", "Simple-RAG-Ask")
 
+# Admission control (see services/admission.py): full queues answer 503 + Retry-After
+EMBED_CONCURRENCY: int = _as_int("EMBED_CONCURRENCY", 1)              # embedding model calls at once; each already uses every core
+EMBED_QUEUE_MAX: int = _as_int("EMBED_QUEUE_MAX", 256)                # questions waiting to be embedded
+EMBED_QUEUE_TIMEOUT: float = _as_float("EMBED_QUEUE_TIMEOUT", 10.0)   # seconds a question waits for the model
+VECTOR_WRITE_CONCURRENCY: int = _as_int("VECTOR_WRITE_CONCURRENCY", 1)  # ingest upserts at once
+UPSTREAM_CONCURRENCY: int = _as_int("UPSTREAM_CONCURRENCY", 32)       # chat completion calls in flight
+UPSTREAM_QUEUE_MAX: int = _as_int("UPSTREAM_QUEUE_MAX", 64)           # questions waiting for an upstream slot
+UPSTREAM_QUEUE_TIMEOUT: float = _as_float("UPSTREAM_QUEUE_TIMEOUT", 15.0)
+INGEST_QUEUE_MAX: int = _as_int("INGEST_QUEUE_MAX", 100)              # queued ingestion jobs before uploads are refused
+UPSTREAM_RETRY_AFTER: int = _as_int("UPSTREAM_RETRY_AFTER", 5)        # Retry-After on an upstream 429 that doesn't send one
+
+# Debugging and admin
+DEBUG_TIMINGS: bool = _as_bool("DEBUG_TIMINGS", False)           # allow X-Debug-Timings: 1 / ?debug=1 timing breakdowns
+ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")                  # X-Admin-Token for /admin endpoints, empty disables them
+PROFILE_INTERVAL_MS: float = _as_float("PROFILE_INTERVAL_MS", 5.0)  # sampling profiler interval
+PROFILE_MAX_SECONDS: float = _as_float("PROFILE_MAX_SECONDS", 60.0)  # longest capture, also the limit for ?requests=N
+
 # Convenience: bytes from MB
 MAX_UPLOAD_BYTES: int = MAX_UPLOAD_MB * 1024 * 1024
@@ -1,16 +1,73 @@
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from app import config as cfg
-from fastapi import FastAPI
-from app.routes import files, ask
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.routes import admin, files, ask
+from app.services import admission, indexer, jobs, metrics, profiling, retrieval, upstream
+
+IMPORT_SECONDS = round(time.perf_counter() - _import_started, 3)
+
+log = logging.getLogger(__name__)
+
+# readiness: "starting" -> ("warming" -> ) "ready" | "failed"
+_readiness = {"state": "starting", "import_seconds": IMPORT_SECONDS, "warmup": None}
+
+
+async def _warm_up():
+    _readiness["state"] = "warming"
+    try:
+        _readiness["warmup"] = await asyncio.to_thread(indexer.warm_up)
+        _readiness["state"] = "ready"
+        log.info("warm-up finished: %s", _readiness["warmup"])
+    except Exception as e:
+        _readiness["state"] = "failed"
+        _readiness["error"] = str(e)
+        log.exception("warm-up failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.startup()
+    warm = None
+    if cfg.WARMUP_ON_STARTUP:
+        # in the background, so /health answers while the model loads
+        warm = asyncio.create_task(_warm_up())
+    else:
+        _readiness["state"] = "ready"
+    yield
+    if warm is not None and not warm.done():
+        warm.cancel()
+    await upstream.shutdown()
+    # let running ingestion jobs finish before the parse pool goes away
+    jobs.shutdown()
+    retrieval.shutdown()
+    indexer.shutdown()
 
 
 app = FastAPI(
     title="RAG Chatbot API",
     description="RAG with document upload and query endpoints.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+app.add_middleware(metrics.InflightMiddleware)
+app.add_middleware(profiling.RequestCounterMiddleware)
 app.include_router(files.router, prefix="/files", tags=["files"])
 app.include_router(ask.router, prefix="/ask", tags=["ask"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
+
+@app.exception_handler(admission.OverloadedError)
+async def overloaded_handler(request: Request, exc: admission.OverloadedError):
+    """A full admission queue (embedding, upstream, ingest jobs) fails fast instead of queueing without bound."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
 
 
 @app.get("/")
@@ -19,4 +76,14 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness for load balancers: 503 until warm-up (if enabled) has finished."""
+    return JSONResponse(status_code=200 if _readiness["state"] == "ready" else 503, content=_readiness)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus exposition of the stage histograms, counters and gauges in app.services.metrics."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,3 +1,5 @@
+from datetime import datetime
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 class UploadResponse(BaseModel):
@@ -5,15 +7,57 @@ class UploadResponse(BaseModel):
     filename: str
     chunks: int
     status: str
+    added: Optional[int] = None      # updates only: chunks embedded for the new version
+    removed: Optional[int] = None
+    unchanged: Optional[int] = None
+    timings: Optional[Dict[str, float]] = None   # debug mode: milliseconds per ingest stage
+
+class JobStatus(BaseModel):
+    job_id: str
+    doc_id: str
+    filename: str
+    tenant: Optional[str] = None
+    status: str
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    first_chunk_indexed_ms: Optional[float] = None
+    result: Optional[UploadResponse] = None
+    error: Optional[str] = None
     
+class DocumentInfo(BaseModel):
+    doc_id: str
+    filename: str
+    content_hash: str
+    bytes: int
+    pages: int
+    chunks: int
+    ingested_at: Optional[str] = None
+    first_chunk_ms: Optional[float] = None
+    index_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    chunk_ids: Optional[List[str]] = None
+
+class DocumentList(BaseModel):
+    items: List[DocumentInfo]
+    next_cursor: Optional[str] = None
+
 class DeleteResponse(BaseModel):
     doc_id: str
     deleted: bool
 
 class AskRequest(BaseModel):
     question: str = Field(...,json_schema_extra={"title": "Question", "description": "The question to ask", "type": "string", "default": "", "examples": ["How many moon does earth have?"]})
+    k: Optional[int] = Field(None, ge=1, description="Chunks to retrieve (RETRIEVAL_K if omitted, at most MAX_RETRIEVAL_K)")
+    doc_ids: Optional[List[str]] = Field(None, description="Only search these documents")
+    filenames: Optional[List[str]] = Field(None, description="Only search documents whose filename matches one of these glob patterns, e.g. 'manual-*.pdf'")
+    ingested_after: Optional[datetime] = Field(None, description="Only search chunks ingested at or after this time (UTC if no offset is given)")
 
 class AskResponse(BaseModel):
     answer: str
     k: int
-    chunks: int
\ No newline at end of file
+    chunks: int
+    model: Optional[str] = None
+    usage: Optional[dict] = None
+    cached: Optional[bool] = None                # answer reused from a paraphrased question (no upstream call)
+    timings: Optional[Dict[str, float]] = None   # debug mode: milliseconds per stage
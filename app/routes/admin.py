@@ -0,0 +1,216 @@
+import os
+import re
+import hmac
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from app.services import admission, indexer, jobs, maintenance, profiling, retrieval, snapshot, tenants
+from app import config as cfg
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Admin endpoints need ADMIN_TOKEN set on the server and sent back in `X-Admin-Token`."""
+    if not cfg.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, cfg.ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post("/profile", response_class=PlainTextResponse, summary="Capture a sampling profile")
+async def profile(
+    requests: Optional[int] = Query(None, ge=1, description="Profile the next N requests"),
+    seconds: Optional[float] = Query(None, gt=0, description="Profile a time window"),
+    interval_ms: Optional[float] = Query(None, ge=1, description="Sampling interval"),
+    idle: bool = Query(False, description="Keep samples of idle threads"),
+):
+    """
+    Samples the running process and returns a flamegraph-ready profile.
+
+    The call returns once `requests` further requests have completed
+    (admin requests don't count) or after `seconds`, whichever comes
+    first; PROFILE_MAX_SECONDS caps both. The body is in folded-stack
+    format (`thread;outer;...;inner count`), e.g.
+    `flamegraph.pl profile.folded > profile.svg`, or open it in speedscope.
+
+    Parameters
+    ----------
+    requests : int, optional
+        Number of requests to profile.
+    seconds : float, optional
+        Length of the capture window.
+    interval_ms : float, optional
+        Milliseconds between samples, PROFILE_INTERVAL_MS by default.
+    idle : bool, optional
+        Keep samples of threads parked in a wait.
+
+    Returns
+    -------
+    PlainTextResponse
+        The folded stacks, with sample/request counts in `X-Profile-*` headers.
+
+    Raises
+    ------
+    HTTPException
+        If neither `requests` nor `seconds` is given, a 400 error is raised.
+        If another profile is being captured, a 409 error is raised.
+    """
+    if requests is None and seconds is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Give 'requests' or 'seconds'")
+    try:
+        capture, took = await profiling.capture(requests, seconds, interval_ms, idle)
+    except profiling.ProfileBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(
+        capture.profiler.folded(),
+        headers={
+            "Content-Disposition": 'attachment; filename="profile.folded"',
+            "X-Profile-Samples": str(capture.profiler.samples),
+            "X-Profile-Requests": str(capture.completed),
+            "X-Profile-Seconds": f"{took:.3f}",
+        },
+    )
+
+
+@router.get("/shards", summary="Per-tenant shard sizes and search latency")
+def shards():
+    """
+    Size and recent search latency of every tenant's shard.
+
+    Tenants are those with a catalog on disk plus any opened by this
+    process. Latency percentiles cover this process's last
+    SHARD_STATS_WINDOW searches of each shard (null if it hasn't been
+    searched here yet); `rag_shard_search_seconds` in /metrics has the
+    full histograms.
+
+    Returns
+    -------
+    dict
+        `{"shards": {tenant: {"chunks", "documents", "searches", "p50_ms", "p95_ms"}}}`.
+    """
+    latency = retrieval.shard_stats()
+    out = {}
+    for tenant in sorted(set(tenants.discover()) | set(indexer._stores)):
+        out[tenant] = {
+            "chunks": indexer._db(tenant).count(),
+            "documents": indexer._catalog(tenant=tenant).count(),
+            **latency.get(tenant, {"searches": 0, "p50_ms": None, "p95_ms": None}),
+        }
+    return {"shards": out}
+
+
+@router.get("/admission", summary="Admission pool and queue state")
+def admission_state():
+    """
+    Slots in use, queue depths and average slot hold times, for sizing workers.
+
+    Pools appear once used. Wait-time histograms and rejection counts are
+    in /metrics (`rag_admission_wait_seconds`, `rag_admission_rejected_total`).
+    """
+    batcher = getattr(indexer._embeddings, "batcher", None)
+    return {
+        "pools": {name: pool.stats() for name, pool in admission.pools.items()},
+        "question_embed_queue": batcher.queued if batcher is not None else None,
+        "ingest_jobs": jobs.counts(),
+    }
+
+
+@router.post("/index/rebuild", summary="Rebuild the tenant's vector index and report recall")
+async def index_rebuild(
+    sample: Optional[int] = Query(None, ge=0, le=10000, description="Query vectors, MAINTENANCE_SAMPLE by default"),
+    k: int = Query(10, ge=1, le=100, description="Depth of the recall@k comparison"),
+    tenant: str = Depends(tenants.from_header),
+):
+    """
+    Rebuilds the `X-Tenant-ID` tenant's vector index online.
+
+    Chroma copies the live rows into a fresh collection created with the
+    current HNSW_* parameters and swaps it in; the numpy store compacts
+    its tombstones and retrains IVF. Searches and uploads keep working
+    meanwhile. See services/maintenance.py.
+
+    Returns
+    -------
+    dict
+        Build time and the size, query latency and recall@k (against an
+        exact brute-force search) before and after.
+
+    Raises
+    ------
+    HTTPException
+        If another rebuild is running, a 409 error is raised.
+    """
+    try:
+        return await asyncio.to_thread(maintenance.rebuild_index, tenant, sample, k)
+    except maintenance.MaintenanceBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+_SNAPSHOT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$")
+
+
+@router.post("/snapshot/export", summary="Write a snapshot of the tenant's shard")
+async def snapshot_export(
+    name: str = Query(..., description="Snapshot directory under SNAPSHOT_DIR"),
+    float16: bool = Query(False, description="Store embeddings as float16"),
+    tenant: str = Depends(tenants.from_header),
+):
+    """
+    Exports the `X-Tenant-ID` tenant's vectors, chunks and catalog to SNAPSHOT_DIR/`name`.
+
+    See services/snapshot.py for the format; an existing snapshot of the
+    same name is replaced once the new one is complete.
+
+    Returns
+    -------
+    dict
+        The snapshot manifest.
+
+    Raises
+    ------
+    HTTPException
+        If `name` is not a plain directory name, a 400 error is raised.
+    """
+    path = _snapshot_path(name)
+    return await asyncio.to_thread(snapshot.export, path, tenant, "float16" if float16 else "float32")
+
+
+@router.post("/snapshot/import", summary="Replace the tenant's shard with a snapshot")
+async def snapshot_import(
+    name: str = Query(..., description="Snapshot directory under SNAPSHOT_DIR"),
+    tenant: str = Depends(tenants.from_header),
+):
+    """
+    Replaces the `X-Tenant-ID` tenant's shard with SNAPSHOT_DIR/`name`.
+
+    Searches during the import see a partial shard; run it before a
+    replica takes traffic or in a maintenance window.
+
+    Returns
+    -------
+    dict
+        `{"tenant", "chunks", "documents", "seconds"}`.
+
+    Raises
+    ------
+    HTTPException
+        If `name` is not a plain directory name, a 400 error is raised.
+        If there is no such snapshot, a 404 error is raised.
+        If it was built with another EMBED_MODEL or chunk settings, or is corrupt, a 409 error is raised.
+    """
+    path = _snapshot_path(name)
+    try:
+        return await asyncio.to_thread(snapshot.load, path, tenant)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except snapshot.SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+def _snapshot_path(name: str) -> str:
+    if not _SNAPSHOT_NAME.match(name) or ".." in name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid snapshot name")
+    return os.path.join(cfg.SNAPSHOT_DIR, name)
@@ -1,21 +1,60 @@
+from __future__ import annotations
+
 import os
+import json
+import time
+import asyncio
+import logging
+from datetime import timezone
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Optional
 import httpx
-from fastapi import APIRouter, HTTPException
-from app.services.indexer import _db
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from app.services import admission, answer_cache, indexer, metrics, profiling, retrieval, tenants, upstream
+from app.services.cache import LRUCache
+from app.services.packer import pack_context
 from app.models import AskRequest, AskResponse
 from app import config as cfg
 
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+log = logging.getLogger(__name__)
+
 router = APIRouter()
 
+STRICT_REFUSAL = "This information is not available in my current knowledge base."
+
+# (collection generation, tenants, normalized question, k, filters) -> documents
+_retrieval_cache = LRUCache(cfg.RETRIEVAL_CACHE_SIZE)
+
 @router.post("/", response_model=AskResponse)
-async def ask(body: AskRequest):
+async def ask(body: AskRequest, request: Request, tenant_ids: list[str] = Depends(tenants.many_from_header)):
     """
     Ask the RAG to answer a question based on the provided context.
 
+    With DEBUG_TIMINGS on, sending `X-Debug-Timings: 1` (or `?debug=1`)
+    adds per-stage milliseconds (`timings`) to the response. Context comes
+    from the `X-Tenant-ID` tenant's documents; a comma-separated list
+    (`X-Tenant-ID: acme,shared`) searches those shards in parallel.
+
+    `k`, `doc_ids`, `filenames` (glob patterns) and `ingested_after`
+    narrow the search; the filters are evaluated inside the vector and
+    BM25 indexes (see `scoped_retrieve`), so a scoped question only scores
+    the chunks it may use.
+
+    With ANSWER_CACHE_SIZE set, a paraphrase of an earlier question that
+    retrieves the same chunks gets the earlier answer (`cached: true`)
+    without calling OpenRouter; see services/answer_cache.py.
+
     Parameters
     ----------
     body : AskRequest
-        The question to ask and the context to use.
+        The question to ask, the number of chunks and the document scope.
+    request : Request
+        The incoming request (debug flag).
+    tenant_ids : list[str]
+        Tenants from the `X-Tenant-ID` header.
 
     Returns
     -------
@@ -28,8 +67,151 @@ async def ask(body: AskRequest):
         If no OPENROUTER_API_KEY is provided, a 500 error is raised.
         If no OPENROUTER_BASE_URL is provided, a 500 error is raised.
         If the question is empty, a 400 error is raised.
-        If the OpenRouter API returns an error, a 502 error is raised.
+        If `k` is larger than MAX_RETRIEVAL_K, a 400 error is raised.
+        If a tenant id is invalid, or too many are given, a 400 error is raised.
+        If OpenRouter rate-limits us, a 429 error with its Retry-After is raised.
+        If the OpenRouter API returns another error, a 502 error is raised.
+    admission.OverloadedError
+        If the embedding or upstream queue is full (503 with Retry-After, see app.main).
     """
+    started = time.perf_counter()
+    timings = metrics.start_timings() if profiling.wants_timings(request) else None
+    question = validate_request(body)
+
+    k, docs = await scoped_retrieve(question, body, tenant_ids)
+    if not docs:
+        metrics.ask_stage["total"].observe(time.perf_counter() - started)
+        return AskResponse(
+            answer=STRICT_REFUSAL,
+            k=k,
+            chunks=0,
+            model=None,
+            usage=None,
+            timings=metrics.rounded(timings),
+        )
+
+    scope = answer_scope(body, k, tenant_ids)
+    vec, cached = await cached_answer(question, scope, docs)
+    if cached is not None:
+        metrics.ask_stage["total"].observe(time.perf_counter() - started)
+        return AskResponse(
+            answer=cached["answer"],
+            k=k,
+            chunks=len(docs),
+            model=cached["model"],
+            usage=None,
+            cached=True,
+            timings=metrics.rounded(timings),
+        )
+
+    with metrics.ask_stage["build_prompt"].time():
+        payload = build_payload(question, docs, stream=False)
+    async with admission.pool("upstream").aslot():
+        t = time.perf_counter()
+        with metrics.ask_stage["upstream"].time():
+            r = await upstream.client().post(f"{cfg.OPENROUTER_BASE_URL}/chat/completions", headers=upstream_headers(),
+                                             json=payload, extensions=upstream.timing_extensions())
+        upstream_seconds = time.perf_counter() - t
+    metrics.upstream_responses.labels(status=str(r.status_code)).inc()
+    if r.status_code == 429:
+        raise HTTPException(status_code=429, detail=f"OpenRouter rate limit: {r.text}",
+                            headers={"Retry-After": upstream.retry_after(r)})
+    if r.status_code >= 400:
+        
+        raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
+    resp = r.json()
+
+    msg = resp.get("choices", [{}])[0].get("message", {})
+    content = (msg.get("content") or "").strip()
+    if content and vec is not None:
+        answer_cache.cache.put(vec, scope, [d.id for d in docs], {"answer": content, "model": resp.get("model")},
+                               upstream_seconds)
+    content = content or "this information is not available in my current knowledge base." 
+    metrics.record_usage(resp.get("usage"))
+    metrics.ask_stage["total"].observe(time.perf_counter() - started)
+
+    return AskResponse(
+        answer=content,
+        k=k,
+        chunks=len(docs),
+        model=resp.get("model"),
+        usage=resp.get("usage"),
+        timings=metrics.rounded(timings),
+    )
+
+
+@router.post("/stream")
+async def ask_stream(body: AskRequest, request: Request, tenant_ids: list[str] = Depends(tenants.many_from_header)):
+    """
+    Streaming variant of `POST /ask` using Server-Sent Events.
+
+    Tokens are forwarded as they arrive from the upstream
+    `/chat/completions` stream, so the client sees the first words as soon
+    as the model produces them instead of after the full completion.
+    Tenants, `k` and the document scope are selected as for `POST /ask`.
+
+    Events
+    ------
+    reasoning
+        `{"text": ...}` reasoning tokens, for models that emit them.
+    token
+        `{"text": ...}` answer tokens.
+    error
+        `{"status": ..., "detail": ...}` if the upstream fails mid-request
+        (status 429 with `retry_after` seconds when it rate-limits us).
+    done
+        `{"model", "usage", "k", "chunks", "sources"}` sent last; `sources`
+        holds the metadata of the retrieved chunks. In debug mode (see
+        `POST /ask`) it also carries `timings`. A cached answer (see
+        `POST /ask`) arrives as a single token event, and done carries
+        `"cached": true`.
+
+    Raises
+    ------
+    HTTPException
+        Same configuration and validation errors as `POST /ask`, raised
+        before the stream starts.
+    admission.OverloadedError
+        If no upstream slot frees up in time (503), also before the stream starts.
+    """
+    started = time.perf_counter()
+    if profiling.wants_timings(request):
+        # the response stream runs in this request's context, so it keeps adding to the breakdown
+        metrics.start_timings()
+    question = validate_request(body)
+    k, docs = await scoped_retrieve(question, body, tenant_ids)
+    remember = None
+    if docs:
+        scope = answer_scope(body, k, tenant_ids)
+        vec, cached = await cached_answer(question, scope, docs)
+        if cached is not None:
+            return StreamingResponse(
+                stream_cached(cached, docs, k, started),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        if vec is not None:
+            ids = [d.id for d in docs]
+            remember = lambda answer, model, seconds: answer_cache.cache.put(
+                vec, scope, ids, {"answer": answer, "model": model}, seconds)
+    pool = None
+    if docs:
+        # taken before responding so a full queue is still a plain 503; held until the stream ends
+        pool = admission.pool("upstream")
+        await pool.acquire()
+    return _SlotStreamingResponse(
+        stream_answer(question, docs, started, k, remember),
+        pool,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+    
+    
+#########* helpers
+
+def validate_request(body: AskRequest) -> str:
+    """Checks upstream configuration and returns the stripped question, raising HTTPException otherwise."""
     if not cfg.OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="Missing OPENROUTER_API_KEY")
     if not cfg.OPENROUTER_MODEL:
@@ -38,54 +220,167 @@ async def ask(body: AskRequest):
     question = body.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Missing 'question'")
+    return question
 
-
-    docs = await get_context(question, cfg.RETRIEVAL_K)
-    if not docs:
-        return AskResponse(
-            answer="This information is not available in my current knowledge base.",
-            k=cfg.RETRIEVAL_K,
-            chunks=0,
-            model=None,
-            usage=None,
-        )
-
-    headers = {
+def upstream_headers() -> dict:
+    return {
         "Authorization": f"Bearer {cfg.OPENROUTER_API_KEY}", 
         "Content-Type": "application/json",
         "HTTP-Referer": cfg.HTTP_REFERER,
         "X-Title": cfg.HTTP_TITLE,
     }
+
+def build_payload(question: str, docs: list, stream: bool) -> dict:
+    """
+    Chat completion request body.
+
+    Retrieved Documents are packed (adjacent chunks merged, overlap removed,
+    source labels added) to fit CONTEXT_TOKEN_BUDGET; plain strings are
+    used as they are.
+    """
+    if docs and not isinstance(docs[0], str):
+        texts = pack_context(docs)
+    else:
+        texts = list(docs)
     payload = {
         "model": cfg.OPENROUTER_MODEL,
         "messages": [{"role": "system", "content": "Respond in plain text only. Do not use Markdown, bullets, lists, or code formatting."},
-    *build_messages(question, docs)],
+    *build_messages(question, texts)],
         "temperature": 0,
         "top_p": 1,
-        "stream": False, 
+        "stream": stream, 
     }
+    if stream:
+        # ask for a final chunk carrying token usage
+        payload["stream_options"] = {"include_usage": True}
+    return payload
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(cfg.HTTP_TIMEOUT_SECONDS)) as client:
-        r = await client.post(f"{cfg.OPENROUTER_BASE_URL}/chat/completions", headers=headers, json=payload)
-        if r.status_code >= 400:
-            
-            raise HTTPException(status_code=502, detail=f"OpenRouter error {r.status_code}: {r.text}")
-        resp = r.json()
+async def stream_answer(question: str, docs: list[Document], started: Optional[float] = None,
+                        k: Optional[int] = None,
+                        remember: Optional[Callable[[str, Optional[str], float], None]] = None) -> AsyncIterator[str]:
+    """
+    Relays an upstream chat completion stream as SSE events (see `ask_stream`).
 
-    msg = resp.get("choices", [{}])[0].get("message", {})
-    content = (msg.get("content") or "").strip() or "this information is not available in my current knowledge base." 
+    `started` (a perf_counter value) is when the request came in; the
+    "total" stage is observed from it once the done event is sent. `k` is
+    reported in the done event (RETRIEVAL_K if None). `remember` receives
+    the full answer, the model and the upstream seconds once the upstream
+    stream has completed without error.
+    """
+    model, usage, answered = None, None, False
+    parts: list[str] = []
+    started = time.perf_counter() if started is None else started
 
-    return AskResponse(
-        answer=content,
-        k=cfg.RETRIEVAL_K,
-        chunks=len(docs),
-        model=resp.get("model"),
-        usage=resp.get("usage"),
-    )
+    if docs:
+        with metrics.ask_stage["build_prompt"].time():
+            payload = build_payload(question, docs, stream=True)
+        t = time.perf_counter()
+        first_token = True
+        try:
+            async with upstream.client().stream("POST", f"{cfg.OPENROUTER_BASE_URL}/chat/completions",
+                                                headers=upstream_headers(), json=payload,
+                                                extensions=upstream.timing_extensions()) as r:
+                metrics.upstream_responses.labels(status=str(r.status_code)).inc()
+                if r.status_code >= 400:
+                    detail = (await r.aread()).decode("utf-8", errors="replace")
+                    if r.status_code == 429:
+                        yield sse("error", {"status": 429, "detail": f"OpenRouter rate limit: {detail}",
+                                            "retry_after": upstream.retry_after(r)})
+                    else:
+                        yield sse("error", {"status": 502, "detail": f"OpenRouter error {r.status_code}: {detail}"})
+                    return
+                async for line in r.aiter_lines():
+                    # SSE comments (": OPENROUTER PROCESSING") and blank keep-alives are skipped
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    if "error" in chunk:
+                        yield sse("error", {"status": 502, "detail": f"OpenRouter error: {chunk['error']}"})
+                        return
+                    model = chunk.get("model") or model
+                    usage = chunk.get("usage") or usage
+                    delta = ((chunk.get("choices") or [{}])[0].get("delta")) or {}
+                    if delta.get("reasoning"):
+                        yield sse("reasoning", {"text": delta["reasoning"]})
+                    if delta.get("content"):
+                        if first_token:
+                            first_token = False
+                            metrics.ask_stage["upstream_first_token"].observe(time.perf_counter() - t)
+                        answered = True
+                        parts.append(delta["content"])
+                        yield sse("token", {"text": delta["content"]})
+        except httpx.HTTPError as e:
+            # connect/read timeouts and connections dropped mid-stream: end with an error event, not a cut-off body
+            log.warning("Upstream stream failed: %s: %s", type(e).__name__, e)
+            metrics.upstream_responses.labels(status="transport_error").inc()
+            yield sse("error", {"status": 502, "detail": f"OpenRouter request failed: {type(e).__name__}: {e}"})
+            return
+        upstream_seconds = time.perf_counter() - t
+        metrics.ask_stage["upstream"].observe(upstream_seconds)
+        metrics.record_usage(usage)
+        if answered and remember is not None:
+            remember("".join(parts).strip(), model, upstream_seconds)
 
-    
-    
-#########* helpers
+    if not answered:
+        yield sse("token", {"text": STRICT_REFUSAL})
+    metrics.ask_stage["total"].observe(time.perf_counter() - started)
+    done = {
+        "model": model,
+        "usage": usage,
+        "k": k or cfg.RETRIEVAL_K,
+        "chunks": len(docs),
+        "sources": [source_metadata(d) for d in docs],
+    }
+    timings = metrics.current_timings()
+    if timings is not None:
+        done["timings"] = metrics.rounded(timings)
+    yield sse("done", done)
+
+async def stream_cached(cached: dict, docs: list[Document], k: int, started: float) -> AsyncIterator[str]:
+    """SSE events of a cached answer: the whole answer as one token event, then done."""
+    yield sse("token", {"text": cached["answer"]})
+    metrics.ask_stage["total"].observe(time.perf_counter() - started)
+    done = {
+        "model": cached["model"],
+        "usage": None,
+        "k": k,
+        "chunks": len(docs),
+        "sources": [source_metadata(d) for d in docs],
+        "cached": True,
+    }
+    timings = metrics.current_timings()
+    if timings is not None:
+        done["timings"] = metrics.rounded(timings)
+    yield sse("done", done)
+
+class _SlotStreamingResponse(StreamingResponse):
+    """A StreamingResponse that releases an admission slot when it is done, however it ends."""
+
+    def __init__(self, content, pool: Optional[admission.Pool], **kwargs):
+        super().__init__(content, **kwargs)
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.pool is not None:
+                self.pool.release(time.perf_counter() - started)
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def source_metadata(doc: Document) -> dict:
+    """The chunk metadata clients need to cite a source."""
+    meta = doc.metadata or {}
+    return {k: meta[k] for k in ("doc_id", "filename", "ord", "page") if k in meta}
 
 async def get_context(question: str, k: int) -> list[str]:
     """
@@ -103,10 +398,124 @@ async def get_context(question: str, k: int) -> list[str]:
     list[str]
         A list of context documents as strings.
     """
-    db = _db()
-    results = db.similarity_search(question, k)
+    results = await retrieve(question, k)
     return [d.page_content.strip() for d in results if getattr(d, "page_content", "").strip()]
 
+async def scoped_retrieve(question: str, body: AskRequest, tenant_ids: list[str]) -> tuple[int, list[Document]]:
+    """
+    The request's `k` and its non-empty chunks, searched within the request's document scope.
+
+    `doc_ids` and the documents whose filename matches a `filenames`
+    pattern (looked up in each tenant's catalog) become a `doc_id` `$in`
+    filter; `ingested_after` becomes `ingested_ts >= timestamp`. Given
+    both, a document must satisfy both. A scope that matches no document
+    returns no chunks without searching.
+
+    Raises
+    ------
+    HTTPException
+        400 if `k` is larger than MAX_RETRIEVAL_K.
+    """
+    k = body.k or cfg.RETRIEVAL_K
+    if k > cfg.MAX_RETRIEVAL_K:
+        raise HTTPException(status_code=400, detail=f"'k' must be at most {cfg.MAX_RETRIEVAL_K}")
+
+    clauses = []
+    if body.doc_ids is not None or body.filenames is not None:
+        ids = set(body.doc_ids) if body.doc_ids is not None else None
+        if body.filenames is not None:
+            matched = await asyncio.to_thread(_match_filenames, body.filenames, tenant_ids)
+            ids = matched if ids is None else ids & matched
+        if not ids:
+            return k, []
+        clauses.append({"doc_id": {"$in": sorted(ids)}})
+    if body.ingested_after is not None:
+        after = body.ingested_after
+        if after.tzinfo is None:
+            after = after.replace(tzinfo=timezone.utc)
+        clauses.append({"ingested_ts": {"$gte": after.timestamp()}})
+    where = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    docs = await retrieve(question, k, where, tenants=tenant_ids)
+    return k, [d for d in docs if d.page_content.strip()]
+
+def _match_filenames(patterns: list[str], tenant_ids: list[str]) -> set:
+    """doc_ids whose filename matches one of `patterns`, across the tenants' catalogs."""
+    return {d for t in tenant_ids for d in indexer.match_filenames(patterns, t)}
+
+
+def answer_scope(body: AskRequest, k: int, tenant_ids: list[str]) -> tuple:
+    """What besides the question and its chunks shapes an answer: tenants, filters, k and model."""
+    filters = body.model_dump(mode="json", exclude={"question", "k"})
+    return (tuple(sorted(tenant_ids)), _freeze(filters), k, cfg.OPENROUTER_MODEL)
+
+async def cached_answer(question: str, scope: tuple, docs: list[Document]) -> tuple[Optional[list[float]], Optional[dict]]:
+    """
+    The question's embedding and a cached answer for it, if any.
+
+    The embedding comes from the query embedding cache (retrieval just
+    computed it); both are None while the answer cache is disabled.
+    """
+    if not answer_cache.cache.enabled:
+        return None, None
+    vec = await asyncio.to_thread(indexer._emb().embed_query, question)
+    return vec, answer_cache.cache.get(vec, scope, [d.id for d in docs])
+
+async def retrieve(question: str, k: int, where: Optional[dict] = None,
+                   tenants: Optional[list[str]] = None) -> list[Document]:
+    """
+    Top-k chunks for a question, served from the retrieval cache when possible.
+
+    Cache keys include the collection generation they were computed
+    against; any ingest, delete or reset bumps the generation, so stale
+    results (e.g. chunks of a deleted document) are never returned and
+    simply age out of the LRU. With an index service, reading the
+    generation is a socket round trip, so the lookup runs in a worker
+    thread together with the search.
+
+    Parameters
+    ----------
+    question : str
+        The question to find context for.
+    k : int
+        The number of chunks to retrieve.
+    where : dict, optional
+        Chroma-style metadata filter, part of the cache key.
+    tenants : list[str], optional
+        Tenants whose shards to search (DEFAULT_TENANT's by default), part of the cache key.
+
+    Returns
+    -------
+    list[Document]
+        The retrieved chunks with their metadata.
+    """
+    return await asyncio.to_thread(_cached_search, question, k, where, sorted(tenants or [cfg.DEFAULT_TENANT]))
+
+def _cached_search(question: str, k: int, where: Optional[dict], tenants: list[str]) -> list[Document]:
+    """Blocking part of `retrieve`: generation read, cache lookup and, on a miss, the search."""
+    # generation is read before searching so a concurrent write invalidates this entry
+    key = (indexer.generation(), tuple(tenants), normalize_question(question), k, _freeze(where))
+    hit = _retrieval_cache.get(key)
+    if hit is not None:
+        return hit
+
+    with metrics.ask_stage["retrieve"].time():
+        results = retrieval.search(question, k, where, tenants)
+    _retrieval_cache.put(key, results)
+    return results
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, used as a cache key."""
+    return " ".join(question.lower().split())
+
+def _freeze(value):
+    """Hashable form of a (possibly nested) filter dict."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
 def build_messages(question: str, docs: list[str]) -> list[dict]:
     """
     Builds a list of messages in the format required by OpenRouter.
@@ -136,3 +545,16 @@ def build_messages(question: str, docs: list[str]) -> list[dict]:
         {"role": "system", "content": system},
         {"role": "user", "content": user},
     ]
+
+
+@router.get("/debug/cache")
+async def debug_cache():
+    query_cache = getattr(indexer._emb(), "query_cache", None)
+    batcher = getattr(indexer._emb(), "batcher", None)
+    return {
+        "generation": await asyncio.to_thread(indexer.generation),
+        "retrieval": _retrieval_cache.stats(),
+        "answers": answer_cache.cache.stats(),
+        "query_embeddings": query_cache.stats() if query_cache else None,
+        "query_batches": batcher.stats() if batcher else None,
+    }
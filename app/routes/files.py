@@ -1,25 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request, status
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request, status
 import os
-from app.models import UploadResponse, DeleteResponse
-from app.services import indexer
+from app.models import JobStatus, DeleteResponse, DocumentInfo, DocumentList
+from app.services import indexer, jobs, metrics, profiling, tenants
 from app import config as cfg
 router = APIRouter()
 
 
-@router.post("/", response_model=UploadResponse, status_code=status.HTTP_200_OK, summary="Upload a file")
-async def upload_file(file: UploadFile = File(..., description="txt, md, or pdf")):
+@router.post("/", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED, summary="Upload a file")
+async def upload_file(request: Request, file: UploadFile = File(..., description="txt, md, or pdf"),
+                      tenant: str = Depends(tenants.from_header)):
     """
-    Uploads a file to the index.
+    Saves a file and queues it for indexing.
+
+    Parsing, chunking, embedding and upsert run in the background, so the
+    response only confirms the upload was accepted. Poll
+    `GET /files/jobs/{job_id}` for progress and the final result.
+    Re-uploading identical content returns a finished job for the existing
+    document instead of indexing it again, or the pending job if that
+    content is still queued or being indexed. With DEBUG_TIMINGS on, sending
+    `X-Debug-Timings: 1` (or `?debug=1`) adds per-stage milliseconds to
+    the job result. The document goes to the shard of the `X-Tenant-ID`
+    tenant (DEFAULT_TENANT without the header).
 
     Parameters
     ----------
+    request : Request
+        The incoming request (debug flag).
     file : UploadFile
         The file to upload.
+    tenant : str
+        Tenant from the `X-Tenant-ID` header.
 
     Returns
     -------
-    UploadResponse
-        A UploadResponse object indicating the success of the ingestion.
+    JobStatus
+        The queued ingestion job, including the document id it will be indexed under.
 
     Raises
     ------
@@ -28,40 +45,176 @@ async def upload_file(file: UploadFile = File(..., description="txt, md, or pdf"
     HTTPException
         If the file size exceeds the maximum allowed size, a 400 error is raised.
     HTTPException
-        If the ingestion fails for any other reason, a 500 error is raised.
+        If the file is empty, a 422 error is raised.
+    HTTPException
+        If saving the file fails for any other reason, a 500 error is raised.
+    admission.OverloadedError
+        If INGEST_QUEUE_MAX jobs are already pending (503 with Retry-After).
     """
     if not ext_supported(file.filename):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Unsupported file type. Allowed: {sorted(cfg.ALLOWED_EXTS)}",
         )
-        
-    #! checks file size only valid for small files (or it can take too much time)
-    if await exceeds_size_limit(file):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File size too large. Max: {cfg.MAX_UPLOAD_MB}MB",
-        )
 
-    
+    jobs.admit()
+    timings = metrics.start_timings() if profiling.wants_timings(request) else None
+    # size limit and content hash are checked while the upload is written to disk
     try:
-        result = await indexer.ingest_upload(file)
-        return UploadResponse(**result)
+        saved = await indexer.save_upload(file, tenant)
     except indexer.UnsupportedTypeError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except indexer.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except indexer.ExtractionError as e:
         raise HTTPException(status_code=422, detail=str(e))
-    except indexer.EmbeddingError as e:
-        raise HTTPException(status_code=500, detail="Embedding failed")
-    except indexer.UpsertError as e:
-        raise HTTPException(status_code=500, detail="Index upsert failed")
     except Exception:
         raise HTTPException(status_code=500, detail="Unexpected error during ingestion")
+
+    job = jobs.submit(saved, file.filename, timings=timings)
+    return JobStatus(**job.to_dict())
+
+
+@router.get("/", response_model=DocumentList, summary="List documents")
+async def list_files(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                     tenant: str = Depends(tenants.from_header)):
+    """
+    Lists the tenant's indexed documents from its catalog, newest first.
+
+    Parameters
+    ----------
+    limit : int
+        Page size (1-500).
+    cursor : str, optional
+        `next_cursor` from the previous page.
+
+    Returns
+    -------
+    DocumentList
+        The documents of this page and the cursor of the next one
+        (null on the last page).
+
+    Raises
+    ------
+    HTTPException
+        If the cursor is malformed, a 400 error is raised.
+    """
+    try:
+        after = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    items, nxt = await asyncio.to_thread(indexer.list_documents, limit, after, tenant)
+    return DocumentList(items=[DocumentInfo(**d) for d in items], next_cursor=str(nxt) if nxt is not None else None)
+
+
+@router.get("/{doc_id}", response_model=DocumentInfo, summary="Get a document")
+async def get_file(doc_id: str, tenant: str = Depends(tenants.from_header)):
+    """
+    Catalog entry of one document, including its chunk ids.
+
+    Raises
+    ------
+    HTTPException
+        If the document is not in the tenant's index, a 404 error is raised.
+    """
+    doc = await asyncio.to_thread(indexer.get_document, doc_id, tenant)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return DocumentInfo(**doc)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, tenant: str = Depends(tenants.from_header)):
+    """
+    Reports the progress of an ingestion job.
+
+    Parameters
+    ----------
+    job_id : str
+        The id returned by `POST /files`.
+
+    Returns
+    -------
+    JobStatus
+        Status, pages parsed, chunks embedded so far and, once finished,
+        the result or the error.
+
+    Raises
+    ------
+    HTTPException
+        If the job is unknown (pruned from history, or another tenant's), a 404 error is raised.
+    """
+    job = jobs.get(job_id, tenant)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**job.to_dict())
     
    
    
+@router.put("/{doc_id}", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED, summary="Update a file")
+async def update_file(doc_id: str, request: Request, file: UploadFile = File(..., description="txt, md, or pdf"),
+                      tenant: str = Depends(tenants.from_header)):
+    """
+    Replaces a document with a new version, keeping its doc_id.
+
+    The new version is re-parsed and diffed against the stored chunks by
+    content hash; only new chunks are embedded and vanished ones deleted,
+    in the background. Poll `GET /files/jobs/{job_id}` for the result,
+    which reports how many chunks were added, removed and kept. Uploading
+    the current content again returns a finished job with status
+    "unchanged". Debug timings work as for `POST /files`.
+
+    Parameters
+    ----------
+    doc_id : str
+        The document to update.
+    request : Request
+        The incoming request (debug flag).
+    file : UploadFile
+        The new version.
+    tenant : str
+        Tenant from the `X-Tenant-ID` header; it must own the document.
+
+    Returns
+    -------
+    JobStatus
+        The queued update job.
+
+    Raises
+    ------
+    HTTPException
+        If the document is not indexed, a 404 error is raised.
+    HTTPException
+        If the file type is unsupported or the file too large, a 400 error is raised.
+    HTTPException
+        If the file is empty, a 422 error is raised.
+    admission.OverloadedError
+        If INGEST_QUEUE_MAX jobs are already pending (503 with Retry-After).
+    """
+    if not ext_supported(file.filename):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported file type. Allowed: {sorted(cfg.ALLOWED_EXTS)}",
+        )
+    jobs.admit()
+    timings = metrics.start_timings() if profiling.wants_timings(request) else None
+    try:
+        saved = await indexer.save_update(file, doc_id, tenant)
+    except indexer.UnknownDocumentError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (indexer.UnsupportedTypeError, indexer.UploadTooLargeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except indexer.ExtractionError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Unexpected error during update")
+
+    job = jobs.submit(saved, file.filename, update=True, timings=timings)
+    return JobStatus(**job.to_dict())
+
+
 @router.delete("/{doc_id}", response_model=DeleteResponse, status_code=status.HTTP_200_OK)
-async def delete_file(doc_id: str):
+async def delete_file(doc_id: str, tenant: str = Depends(tenants.from_header)):
     """
     Deletes a document from the index.
 
@@ -69,6 +222,8 @@ async def delete_file(doc_id: str):
     ----------
     doc_id : str
         The document id to delete.
+    tenant : str
+        Tenant from the `X-Tenant-ID` header; only its own documents can be deleted.
 
     Returns
     -------
@@ -83,7 +238,7 @@ async def delete_file(doc_id: str):
         If the deletion fails for any other reason, a 500 error is raised.
     """
     try:
-        deleted = await indexer.delete_document(doc_id)
+        deleted = await indexer.delete_document(doc_id, tenant)
         if not deleted:
             raise HTTPException(status_code=404, detail="Document not found")
         return DeleteResponse(deleted=True, doc_id=doc_id)
@@ -111,37 +266,23 @@ def ext_supported(filename: str) -> bool:
     _, ext = os.path.splitext(filename.lower())
     return ext in cfg.ALLOWED_EXTS
     
-async def exceeds_size_limit(file: UploadFile) -> bool:
-    """
-    Reads the file stream incrementally and stops if it exceeds MAX_UPLOAD_BYTES.
-    Avoids loading the whole file in memory.
-    """
-    total = 0
-    while True:
-        chunk = await file.read(cfg.SPLIT_CHUNK_SIZE)
-        if not chunk:
-            break
-        total += len(chunk)
-        if total > cfg.MAX_UPLOAD_BYTES:
-            await file.seek(0)  #
-            return True
-
-    await file.seek(0)  # reset pointer after check
-    return False
-
 
 
+@router.get("/debug/vectors")
 @router.get("/debug/chroma")
-async def debug_chroma():
-    db = indexer._db()
-    count = db._collection.count()
-    sample = db._collection.get(limit=3)
+async def debug_vectors(tenant: str = Depends(tenants.from_header)):
+    db = indexer._db(tenant)
+    sample = db.get(limit=3)
     return {
-        "count": count,
-        "sample_ids": sample["ids"],
-        "sample_meta": sample["metadatas"]
+        **db.stats(),
+        "sample_ids": sample.ids,
+        "sample_meta": sample.metadatas
     }
 
+@router.get("/debug/embed_cache")
+async def debug_embed_cache():
+    return indexer._cache().stats()
+
 @router.delete("/debug/reset_docs")
-async def reset_docs():
-    return await indexer.reset_docs()
\ No newline at end of file
+async def reset_docs(tenant: str = Depends(tenants.from_header)):
+    return await indexer.reset_docs(tenant)
\ No newline at end of file
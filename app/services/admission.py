@@ -0,0 +1,217 @@
+# app/services/admission.py
+"""
+Admission control: bounded concurrency for the expensive resources.
+
+Each `Pool` lets `limit` callers in at once and queues the rest by
+priority (questions ahead of bulk ingestion), FIFO within a priority.
+Interactive callers wait in a bounded queue for a bounded time; when
+either bound is hit they get `OverloadedError`, which the app turns into
+503 with a `Retry-After` estimate, instead of queueing until every
+request times out. Background work (ingestion jobs, already admitted by
+the bounded job queue) blocks instead.
+
+Pools:
+
+* `embed` – calls into the embedding model (EMBED_CONCURRENCY)
+* `vector_write` – bulk vector store upserts and diffs (VECTOR_WRITE_CONCURRENCY)
+* `upstream` – chat completion calls (UPSTREAM_CONCURRENCY)
+"""
+from __future__ import annotations
+
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Optional
+from app.services import metrics
+from app import config as cfg
+
+INTERACTIVE = 0   # a user is waiting on it (questions)
+BULK = 1          # background ingestion
+
+
+class OverloadedError(RuntimeError):
+    """A bounded queue is full or its wait ran out; retry after `retry_after` seconds."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"Server busy ({pool}); retry in {retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+def reject(pool: str, retry_after: float) -> OverloadedError:
+    """Counts a rejection by `pool` and returns the error to raise."""
+    metrics.admission_rejected.labels(pool=pool).inc()
+    return OverloadedError(pool, max(1, min(int(math.ceil(retry_after)), 120)))
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "wake", "queued_at", "granted")
+
+    def __init__(self, priority: int, seq: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.queued_at = time.perf_counter()
+        self.granted = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Pool:
+    """
+    At most `limit` holders at once; waiters admitted by priority.
+
+    Usable from threads (`slot`) and from the event loop (`aslot`, or
+    `acquire`/`release` when the slot outlives a block, e.g. a stream).
+    A released slot is handed straight to the best waiter, so a steady
+    stream of new arrivals can't overtake the queue.
+
+    Parameters
+    ----------
+    name : str
+        Label in metrics and errors.
+    limit : int
+        Concurrent holders.
+    max_queue : int
+        Interactive waiters allowed before new ones are rejected.
+    max_wait : float
+        Seconds an interactive waiter waits before it is rejected.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._hold = 0.0     # moving average of seconds a slot is held, for Retry-After
+
+    @property
+    def queued(self) -> int:
+        return len(self._heap)
+
+    def retry_after(self) -> float:
+        """Rough seconds until the current queue has drained."""
+        return (self._hold or 1.0) * (self.queued + 1) / self.limit
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE, block: bool = False):
+        """Holds a slot for the block; `block=True` waits as long as it takes (background work)."""
+        event = threading.Event()
+        waiter = self._enter(priority, event.set, block)
+        if waiter is not None and not event.wait(None if block else self.max_wait):
+            if not self._abandon(waiter):
+                raise reject(self.name, self.retry_after())
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = INTERACTIVE):
+        await self.acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        """Waits for a slot without blocking the event loop; pair with `release`."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enter(priority, lambda: loop.call_soon_threadsafe(_resolve, future), False)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise reject(self.name, self.retry_after())
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self, held: Optional[float] = None) -> None:
+        with self._lock:
+            if held is not None:
+                self._hold = held if not self._hold else 0.9 * self._hold + 0.1 * held
+            if self._heap:
+                waiter = heapq.heappop(self._heap)
+                waiter.granted = True
+                self.admitted += 1
+                metrics.admission_wait.labels(pool=self.name).observe(time.perf_counter() - waiter.queued_at)
+                waiter.wake()          # the slot passes to it: `active` is unchanged
+            else:
+                self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "avg_hold_ms": round(self._hold * 1000, 1),
+        }
+
+    #########* helpers
+
+    def _enter(self, priority: int, wake: Callable[[], None], block: bool) -> Optional[_Waiter]:
+        """Takes a free slot (returns None) or queues a waiter; raises when the queue is full."""
+        with self._lock:
+            if self.active < self.limit and not self._heap:
+                self.active += 1
+                self.admitted += 1
+                metrics.admission_wait.labels(pool=self.name).observe(0.0)
+                return None
+            full = not block and sum(w.priority == INTERACTIVE for w in self._heap) >= self.max_queue
+            if not full:
+                waiter = _Waiter(priority, next(self._seq), wake)
+                heapq.heappush(self._heap, waiter)
+        if full:
+            raise reject(self.name, self.retry_after())
+        return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraws a waiter that gave up; True if it had been granted the slot meanwhile (the caller owns it)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._heap.remove(waiter)
+            heapq.heapify(self._heap)
+            return False
+
+
+pools: Dict[str, Pool] = {}
+
+
+def pool(name: str) -> Pool:
+    """The named pool, created from config on first use."""
+    found = pools.get(name)
+    if found is None:
+        if name == "embed":
+            found = Pool(name, cfg.EMBED_CONCURRENCY, cfg.EMBED_QUEUE_MAX, cfg.EMBED_QUEUE_TIMEOUT)
+        elif name == "vector_write":
+            found = Pool(name, cfg.VECTOR_WRITE_CONCURRENCY, 0, 0.0)
+        elif name == "upstream":
+            found = Pool(name, cfg.UPSTREAM_CONCURRENCY, cfg.UPSTREAM_QUEUE_MAX, cfg.UPSTREAM_QUEUE_TIMEOUT)
+        else:
+            raise KeyError(name)
+        found = pools.setdefault(name, found)
+    return found
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,173 @@
+# app/services/answer_cache.py
+"""
+Semantic answer cache: reuse an /ask answer for a paraphrased question.
+
+Answers are generated at temperature 0 from the question and the
+retrieved chunks. So when a new question is close to a cached one (cosine of
+the question embeddings >= ANSWER_CACHE_THRESHOLD) *and* retrieval
+returned exactly the same chunks, the upstream call would see the same
+context and a question that means the same thing; the cached answer is
+returned instead of a multi-second round trip.
+
+Requiring the same chunk set means a cached answer is only served while
+every chunk it was grounded on is still in the index. Entries are also
+dropped as soon as one of their chunks is deleted or replaced by a new
+version (`invalidate`), and evicted by LRU and ANSWER_CACHE_TTL.
+"""
+from __future__ import annotations
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, NamedTuple, Optional, Sequence, Set
+import numpy as np
+from app import config as cfg
+
+
+class _Entry(NamedTuple):
+    group: Hashable           # (scope, chunk ids)
+    vector: np.ndarray        # normalized question embedding
+    response: dict
+    upstream_seconds: float
+    expires: float
+
+
+class AnswerCache:
+    """
+    In-process cache of answers keyed by question embedding, scope and grounding chunks.
+
+    Parameters
+    ----------
+    max_entries : int
+        LRU capacity; 0 disables the cache.
+    ttl : float
+        Seconds an answer may be served after it was generated.
+    threshold : float
+        Minimum cosine between the question embeddings.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0    # upstream time not spent thanks to hits
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._groups: Dict[Hashable, Set[int]] = {}
+        self._by_chunk: Dict[str, Set[int]] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, vector: Sequence[float], scope: Hashable, chunk_ids: Iterable[str]) -> Optional[dict]:
+        """
+        The cached response for a close enough question grounded on the same chunks, or None.
+
+        Parameters
+        ----------
+        vector : sequence of float
+            Embedding of the new question.
+        scope : hashable
+            Everything else that shapes the answer (tenants, filters, k, model).
+        chunk_ids : iterable of str
+            Ids of the chunks retrieved for the new question.
+        """
+        if not self.enabled:
+            return None
+        q = _unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            best, best_sim = None, self.threshold
+            for key in list(self._groups.get((scope, frozenset(chunk_ids)), ())):
+                entry = self._entries[key]
+                if entry.expires <= now:
+                    self._drop(key)
+                    continue
+                sim = float(entry.vector @ q)
+                if sim >= best_sim:
+                    best, best_sim = key, sim
+            if best is None:
+                self.misses += 1
+                return None
+            entry = self._entries[best]
+            self._entries.move_to_end(best)
+            self.hits += 1
+            self.saved_seconds += entry.upstream_seconds
+            return dict(entry.response)
+
+    def put(self, vector: Sequence[float], scope: Hashable, chunk_ids: Iterable[str],
+            response: dict, upstream_seconds: float) -> None:
+        """Caches `response`, generated in `upstream_seconds` from the given chunks."""
+        if not self.enabled:
+            return
+        chunks = frozenset(chunk_ids)
+        entry = _Entry((scope, chunks), _unit(vector), dict(response), upstream_seconds, time.monotonic() + self.ttl)
+        with self._lock:
+            self._seq += 1
+            key = self._seq
+            self._entries[key] = entry
+            self._groups.setdefault(entry.group, set()).add(key)
+            for cid in chunks:
+                self._by_chunk.setdefault(cid, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, chunk_ids: Iterable[str]) -> int:
+        """Drops every answer grounded on one of `chunk_ids`; returns how many were dropped."""
+        with self._lock:
+            keys = set()
+            for cid in chunk_ids:
+                keys |= self._by_chunk.get(cid, set())
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._by_chunk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "saved_upstream_seconds": round(self.saved_seconds, 3),
+        }
+
+    #########* helpers
+
+    def _drop(self, key: int) -> None:
+        """Caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        group = self._groups.get(entry.group)
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._groups[entry.group]
+        for cid in entry.group[1]:
+            keys = self._by_chunk.get(cid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[cid]
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
+
+
+cache = AnswerCache(cfg.ANSWER_CACHE_SIZE, cfg.ANSWER_CACHE_TTL, cfg.ANSWER_CACHE_THRESHOLD)
@@ -0,0 +1,133 @@
+# app/services/batcher.py
+from __future__ import annotations
+
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, List, Optional
+from app.services.admission import reject
+
+_STOP = object()
+
+
+class EmbedBatcher:
+    """
+    Dynamic micro-batching for embedding calls from concurrent callers.
+
+    Callers submit single texts and get a Future. A worker thread takes
+    the first waiting text, keeps collecting for up to `max_wait_ms` or
+    until `max_batch` texts are queued, runs one batched encode and
+    resolves every caller's future. On CPU a batch of 16 sentence
+    embeddings costs little more than one, so bursts of questions share
+    the model call instead of queueing behind each other.
+
+    With `max_queue`, a text submitted while that many are already waiting
+    is rejected with OverloadedError; with `timeout`, `embed` gives up
+    (OverloadedError as well) on a text still waiting after that long.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], max_batch: int, max_wait_ms: float,
+                 max_queue: int = 0, timeout: Optional[float] = None):
+        self.embed_fn = embed_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.sizes: Counter = Counter()
+        self._batch_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, text: str) -> Future:
+        if self.max_queue and self._queue.qsize() >= self.max_queue:
+            raise reject("embed_query", self._retry_after())
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """Blocking helper: submit and wait for the vector."""
+        future = self.submit(text)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            if future.cancel():     # still queued: the worker will skip it
+                raise reject("embed_query", self._retry_after())
+            return future.result()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join(timeout=5)
+                self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": (self.items / self.batches) if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.sizes.items())),
+            "queued": self._queue.qsize(),
+        }
+
+    #########* helpers
+
+    def _retry_after(self) -> float:
+        """Seconds until the current queue has been through the model, from the recent batch rate."""
+        per_batch = self._batch_seconds or 0.1
+        return per_batch * (self._queue.qsize() / self.max_batch + 1)
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            live = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if live:
+                started = time.monotonic()
+                try:
+                    vectors = self.embed_fn([t for t, _ in live])
+                    for (_, f), v in zip(live, vectors):
+                        f.set_result(v)
+                except Exception as e:
+                    for _, f in live:
+                        f.set_exception(e)
+                took = time.monotonic() - started
+                self._batch_seconds = took if not self._batch_seconds else 0.9 * self._batch_seconds + 0.1 * took
+                self.batches += 1
+                self.items += len(live)
+                self.sizes[len(live)] += 1
+            if stop:
+                return
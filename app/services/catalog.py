@@ -0,0 +1,163 @@
+# app/services/catalog.py
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+
+class Catalog:
+    """
+    SQLite catalog of indexed documents and the ids of their chunks.
+
+    One row per document (filename, content hash, size, pages, chunk
+    count, ingest timings) plus one row per chunk (id, position, page,
+    sha256 of its text). Lookups by doc_id or content hash are primary-key
+    or index hits, listing pages through `seq` (insertion order) with a
+    keyset cursor, so none of them scan the vector store.
+    """
+
+    _COLUMNS = ("doc_id", "filename", "content_hash", "bytes", "pages", "chunks",
+                "ingested_at", "first_chunk_ms", "index_ms", "total_ms")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA foreign_keys=ON;
+            CREATE TABLE IF NOT EXISTS documents (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT UNIQUE NOT NULL,
+                filename TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                ingested_at TEXT,
+                first_chunk_ms REAL,
+                index_ms REAL,
+                total_ms REAL);
+            CREATE INDEX IF NOT EXISTS documents_hash ON documents(content_hash);
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+                ord INTEGER NOT NULL,
+                page INTEGER,
+                text_hash TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc_id, ord);
+            """
+        )
+        self._conn.commit()
+
+    def record(self, doc: dict, chunks: Iterable[Tuple[str, int, Optional[int], str]]) -> None:
+        """
+        Writes (or replaces) a document and its chunks in one transaction.
+
+        A replaced document keeps its `seq`, so an update doesn't move it
+        past the cursors of clients paging through `list`.
+
+        Parameters
+        ----------
+        doc : dict
+            Values for the document columns; `doc_id`, `filename` and `content_hash` are required.
+        chunks : iterable of (chunk_id, ord, page, text_hash)
+        """
+        row = {c: doc.get(c) for c in self._COLUMNS}
+        updates = ", ".join(f"{c} = excluded.{c}" for c in self._COLUMNS if c != "doc_id")
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO documents ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))}) "
+                f"ON CONFLICT(doc_id) DO UPDATE SET {updates}",
+                [row[c] for c in self._COLUMNS],
+            )
+            self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (row["doc_id"],))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, doc_id, ord, page, text_hash) VALUES (?, ?, ?, ?, ?)",
+                [(cid, row["doc_id"], ord_, page, h) for cid, ord_, page, h in chunks],
+            )
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            cur = self._conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM documents WHERE doc_id = ?", (doc_id,))
+            row = cur.fetchone()
+        return dict(zip(self._COLUMNS, row)) if row else None
+
+    def by_hash(self, content_hash: str) -> Optional[dict]:
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM documents WHERE content_hash = ? ORDER BY seq LIMIT 1",
+                (content_hash,),
+            )
+            row = cur.fetchone()
+        return dict(zip(self._COLUMNS, row)) if row else None
+
+    def doc_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT doc_id FROM documents")]
+
+    def match_filenames(self, patterns: Iterable[str]) -> List[str]:
+        """doc_ids whose filename matches any of the (case-sensitive) glob patterns."""
+        patterns = list(patterns)
+        if not patterns:
+            return []
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                f"SELECT doc_id FROM documents WHERE {' OR '.join(['filename GLOB ?'] * len(patterns))}", patterns
+            )]
+
+    def chunk_ids(self, doc_id: str) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE doc_id = ? ORDER BY ord", (doc_id,)
+            )]
+
+    def chunks(self, doc_id: str) -> List[Tuple[str, int, Optional[int], str]]:
+        """(chunk_id, ord, page, text_hash) of a document, in order."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chunk_id, ord, page, text_hash FROM chunks WHERE doc_id = ? ORDER BY ord", (doc_id,)
+            ).fetchall()
+
+    def list(self, limit: int, cursor: Optional[int] = None) -> Tuple[List[dict], Optional[int]]:
+        """
+        One page of documents, newest first.
+
+        Parameters
+        ----------
+        limit : int
+            Page size.
+        cursor : int, optional
+            `next_cursor` of the previous page; None starts from the newest.
+
+        Returns
+        -------
+        tuple[list[dict], int or None]
+            The documents and the cursor of the next page (None on the last page).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT seq, {', '.join(self._COLUMNS)} FROM documents "
+                "WHERE seq < ? ORDER BY seq DESC LIMIT ?",
+                (cursor if cursor is not None else 2 ** 63 - 1, limit + 1),
+            ).fetchall()
+        items = [dict(zip(self._COLUMNS, r[1:])) for r in rows[:limit]]
+        return items, (rows[limit - 1][0] if len(rows) > limit else None)
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount > 0
+
+    def reset(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM documents")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
@@ -0,0 +1,170 @@
+# app/services/embed_cache.py
+from __future__ import annotations
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional
+from langchain_core.embeddings import Embeddings
+from app.services.cache import LRUCache
+from app.services.batcher import EmbedBatcher
+from app.services.admission import BULK, INTERACTIVE, Pool
+
+
+class EmbeddingCache:
+    """
+    Persistent (model, sha256(text)) -> vector store backed by SQLite.
+
+    Vectors are stored as raw float32 blobs. When the table grows past
+    `max_entries`, the least recently used tenth is evicted in one pass so
+    eviction cost is amortized over many inserts.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return model + ":" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for k, blob in self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part
+                ):
+                    found[k] = array("f", blob).tolist()
+                if found:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})",
+                        [time.time(), *part],
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items or self.max_entries <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec, last_used) VALUES (?, ?, ?)",
+                [(k, array("f", v).tobytes(), now) for k, v in items.items()],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                drop = count - self.max_entries + self.max_entries // 10
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (drop,),
+                )
+                self.evictions += drop
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults caches before the wrapped model.
+
+    Document embeddings go through the persistent EmbeddingCache (identical
+    texts inside one call are embedded once); query embeddings go through
+    an in-process LRU, so repeated questions never reach the model, and
+    misses are coalesced with concurrent questions by an EmbedBatcher.
+    Any of the three may be None to disable it.
+    """
+
+    def __init__(self, inner: Embeddings, cache: Optional[EmbeddingCache], model_name: str,
+                 query_cache: Optional[LRUCache] = None, batcher: Optional[EmbedBatcher] = None):
+        self.inner = inner
+        self.cache = cache
+        self.model_name = model_name
+        self.query_cache = query_cache
+        self.batcher = batcher
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self.inner.embed_documents(texts)
+        keys = [EmbeddingCache.key(self.model_name, t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        vec = self.query_cache.get(text) if self.query_cache is not None else None
+        if vec is None:
+            vec = self.batcher.embed(text) if self.batcher is not None else self.inner.embed_query(text)
+            if self.query_cache is not None:
+                self.query_cache.put(text, vec)
+        return vec
+
+
+class PrioritizedEmbeddings(Embeddings):
+    """
+    Model calls through an admission pool: questions ahead of document batches.
+
+    Document batches (ingestion) wait for the model as long as it takes;
+    questions jump the queue but are turned away (OverloadedError) once
+    the pool's queue or wait limit is hit.
+    """
+
+    def __init__(self, inner: Embeddings, pool: Pool):
+        self.inner = inner
+        self.pool = pool
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.pool.slot(BULK, block=True):
+            return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.pool.slot(INTERACTIVE):
+            return self.inner.embed_query(text)
+
+    def embed_questions(self, texts: List[str]) -> List[List[float]]:
+        """A batch of questions embedded like documents (no query prefix), at question priority."""
+        with self.pool.slot(INTERACTIVE):
+            return self.inner.embed_documents(texts)
@@ -0,0 +1,393 @@
+# app/services/index_service.py
+"""
+Shared embedding and index service for multi-worker deployments.
+
+One process loads the embedding model and owns the embedding cache, the
+vector store and BM25 writes; API workers reach it over a Unix socket
+instead of each loading torch and opening the store:
+
+    python -m app.services.index_service --socket /run/rag/index.sock
+    INDEX_SERVICE_SOCKET=/run/rag/index.sock uvicorn app.main:app --workers 4
+
+Question embeddings from all workers meet in the service's EmbedBatcher,
+so concurrent questions share model calls across processes. Writes
+(vector upserts, metadata updates, deletes, BM25 updates) run one at a
+time under a single lock. BM25 search and the catalog stay in the
+workers: both are SQLite files in WAL mode, which serve concurrent
+readers from several processes. Every call names a tenant; the service
+opens each tenant's shard the first time it is used.
+
+Frames are a 4-byte length followed by a pickle, so the socket is
+created with mode 0600 and must only be reachable by the service's user.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import pickle
+import signal
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from collections import Counter
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from app.services import tenants
+from app.services.admission import OverloadedError
+from app.services.cache import LRUCache
+from app.services.lexical import LexicalIndex
+from app.services.vectorstore import Records, VectorStore, open_store
+from app import config as cfg
+
+log = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+class IndexServiceError(RuntimeError):
+    """The service could not be reached, or the call failed inside it."""
+
+
+class IndexService:
+    """
+    Request dispatcher of the service process.
+
+    Parameters
+    ----------
+    embeddings : Embeddings
+        The local (cached, batched) embedding model.
+    store : VectorStore
+        The default tenant's local vector store.
+    lexical : LexicalIndex
+        The default tenant's BM25 index; only written through the service.
+    open_shard : callable, optional
+        Opens another tenant's (store, lexical index); `open_local_shard` by default.
+    """
+
+    _STORE_READS = {"query", "get", "count", "stats"}
+    _WRITES = {"add", "update_metadata", "delete", "reset", "lexical_add", "lexical_delete", "lexical_reset"}
+    _MAINTENANCE = {"rebuild"}    # leaves the content alone and keeps writes flowing, so no write lock or generation bump
+
+    def __init__(self, embeddings: Embeddings, store: VectorStore, lexical: LexicalIndex,
+                 open_shard: Optional[Callable[[str], Tuple[VectorStore, LexicalIndex]]] = None):
+        self.embeddings = embeddings
+        self.store = store
+        self.lexical = lexical
+        self.open_shard = open_shard or open_local_shard
+        self.generation = 0
+        self.calls: Counter = Counter()
+        self._shards = {cfg.DEFAULT_TENANT: (store, lexical)}
+        self._shard_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def handle(self, method: str, args: tuple, kwargs: dict, tenant: Optional[str] = None) -> Any:
+        self.calls[method] += 1
+        if method in self._WRITES:
+            store, lexical = self.shard(tenant)
+            with self._write_lock:
+                try:
+                    return self._write(store, lexical, method, *args, **kwargs)
+                finally:
+                    self.generation += 1
+        if method == "embed_query":
+            return self.embeddings.embed_query(*args)
+        if method == "embed_documents":
+            return self.embeddings.embed_documents(*args)
+        if method == "generation":
+            return self.generation
+        if method == "service_stats":
+            return self.stats()
+        if method in self._STORE_READS or method in self._MAINTENANCE:
+            return getattr(self.shard(tenant)[0], method)(*args, **kwargs)
+        raise IndexServiceError(f"Unknown method: {method}")
+
+    def shard(self, tenant: Optional[str]) -> Tuple[VectorStore, LexicalIndex]:
+        """A tenant's (store, lexical index), opened on first use."""
+        tenant = tenants.normalize(tenant)
+        shard = self._shards.get(tenant)
+        if shard is None:
+            with self._shard_lock:
+                shard = self._shards.get(tenant)
+                if shard is None:
+                    shard = self._shards[tenant] = self.open_shard(tenant)
+        return shard
+
+    def stats(self) -> dict:
+        batcher = getattr(self.embeddings, "batcher", None)
+        return {
+            "pid": os.getpid(),
+            "generation": self.generation,
+            "calls": dict(self.calls),
+            "tenants": sorted(self._shards),
+            "query_batches": batcher.stats() if batcher else None,
+        }
+
+    def close(self) -> None:
+        for store, _ in self._shards.values():
+            store.close()
+
+    @staticmethod
+    def _write(store: VectorStore, lexical: LexicalIndex, method: str, *args, **kwargs) -> Any:
+        if method == "lexical_add":
+            return lexical.add(*args)
+        if method == "lexical_delete":
+            return lexical.delete(*args)
+        if method == "lexical_reset":
+            return lexical.reset()
+        return getattr(store, method)(*args, **kwargs)
+
+
+def open_local_shard(tenant: str) -> Tuple[VectorStore, LexicalIndex]:
+    """A tenant's local vector store and BM25 index at the configured paths."""
+    return open_store(tenant=tenant), LexicalIndex(tenants.sqlite_path(cfg.LEXICAL_INDEX_PATH, tenant))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        service: IndexService = self.server.service
+        while True:
+            try:
+                method, args, kwargs, tenant = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply = ("ok", service.handle(method, args, kwargs, tenant))
+            except OverloadedError as e:
+                reply = ("busy", e.pool, e.retry_after)
+            except Exception as e:
+                log.exception("index service call %s failed", method)
+                reply = ("err", type(e).__name__, str(e))
+            try:
+                _send(self.request, reply)
+            except OSError:
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(path: str, service: IndexService) -> socketserver.UnixStreamServer:
+    """Binds the service to a Unix socket (replacing a stale socket file); call `serve_forever` on the result."""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)      # left behind by a service that is gone
+        else:
+            raise IndexServiceError(f"An index service is already listening on {path}")
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    server = _Server(path, _Handler)
+    os.chmod(path, 0o600)
+    server.service = service
+    return server
+
+
+class ServiceClient:
+    """
+    Thread-safe client with a pool of persistent connections.
+
+    A call on a pooled connection that turns out to be dead (e.g. the
+    service restarted) is retried once on a fresh one; every call is
+    either a read or an idempotent upsert/delete by id.
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.path = path
+        self.timeout = timeout if timeout is not None else cfg.INDEX_SERVICE_TIMEOUT
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+
+    def call(self, method: str, *args, tenant: Optional[str] = None, **kwargs) -> Any:
+        """Calls `method` in the service, on `tenant`'s shard for store and BM25 methods."""
+        for attempt in (0, 1):
+            sock, reused = self._checkout()
+            try:
+                _send(sock, (method, args, kwargs, tenant))
+                reply = _recv(sock)
+            except (ConnectionError, OSError) as e:
+                sock.close()
+                if reused and attempt == 0 and not isinstance(e, socket.timeout):
+                    continue
+                raise IndexServiceError(f"Index service at {self.path} failed: {e}") from e
+            except BaseException:
+                sock.close()
+                raise
+            self._idle.put(sock)
+            if reply[0] == "busy":
+                raise OverloadedError(reply[1], reply[2])    # the service's queue is full: 503 in this worker too
+            if reply[0] == "err":
+                raise IndexServiceError(f"{reply[1]}: {reply[2]}")
+            return reply[1]
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _checkout(self) -> Tuple[socket.socket, bool]:
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        sock = socket.socket(socket.AF_UNIX)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise IndexServiceError(f"Index service at {self.path} unavailable: {e}") from e
+        return sock, False
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings computed by the service; question vectors are also kept in a local LRU."""
+
+    def __init__(self, client: ServiceClient, query_cache: Optional[LRUCache] = None):
+        self.client = client
+        self.query_cache = query_cache
+        self.batcher = None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_documents", list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        vec = self.query_cache.get(text) if self.query_cache is not None else None
+        if vec is None:
+            vec = self.client.call("embed_query", text)
+            if self.query_cache is not None:
+                self.query_cache.put(text, vec)
+        return vec
+
+
+class RemoteStore(VectorStore):
+    """A tenant's vector store in the service, behind the VectorStore interface."""
+
+    backend = "remote"
+
+    def __init__(self, client: ServiceClient, tenant: Optional[str] = None):
+        self.client = client
+        self.tenant = tenants.normalize(tenant)
+
+    def add(self, ids, documents, metadatas, embeddings) -> None:
+        self.client.call("add", list(ids), list(documents), list(metadatas), embeddings, tenant=self.tenant)
+
+    def query(self, embedding, k, where=None) -> Records:
+        return self.client.call("query", embedding, k, where, tenant=self.tenant)
+
+    def get(self, ids=None, where=None, limit=None, offset=0, embeddings=False) -> Records:
+        return self.client.call("get", ids=ids, where=where, limit=limit, offset=offset, embeddings=embeddings,
+                                tenant=self.tenant)
+
+    def update_metadata(self, ids, metadatas) -> None:
+        self.client.call("update_metadata", list(ids), list(metadatas), tenant=self.tenant)
+
+    def delete(self, ids=None, where=None) -> None:
+        self.client.call("delete", ids=ids, where=where, tenant=self.tenant)
+
+    def count(self) -> int:
+        return self.client.call("count", tenant=self.tenant)
+
+    def reset(self) -> None:
+        self.client.call("reset", tenant=self.tenant)
+
+    def rebuild(self, batch: int = 4096) -> dict:
+        return self.client.call("rebuild", batch, tenant=self.tenant)
+
+    def stats(self) -> dict:
+        return {**self.client.call("stats", tenant=self.tenant),
+                "service": {"socket": self.client.path, **self.client.call("service_stats")}}
+
+
+class RemoteLexicalIndex(LexicalIndex):
+    """A tenant's BM25 index, read from the local SQLite file and written through the service."""
+
+    def __init__(self, path: str, client: ServiceClient, tenant: Optional[str] = None):
+        super().__init__(path)
+        self.client = client
+        self.tenant = tenants.normalize(tenant)
+
+    def add(self, items: Iterable[Tuple[str, str, str]]) -> None:
+        items = list(items)
+        if items:
+            self.client.call("lexical_add", items, tenant=self.tenant)
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        chunk_ids = list(chunk_ids)
+        if chunk_ids:
+            self.client.call("lexical_delete", chunk_ids, tenant=self.tenant)
+
+    def delete_doc(self, doc_id: str) -> None:
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))]
+        self.delete(ids)
+
+    def reset(self) -> None:
+        self.client.call("lexical_reset", tenant=self.tenant)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--socket", default=cfg.INDEX_SERVICE_SOCKET or "/tmp/rag-index.sock")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from app.services import indexer
+
+    # this process is the service: the indexer must use the local model and store, not a socket
+    cfg.INDEX_SERVICE_SOCKET = ""
+    service = IndexService(indexer._emb(), indexer._db(), indexer._lexical(),
+                           open_shard=lambda tenant: (indexer._db(tenant), indexer._lexical(tenant=tenant)))
+    for tenant in tenants.discover():
+        indexer._catalog(tenant=tenant)    # backfill once here rather than in every worker
+    service.embeddings.embed_query("warm-up")
+
+    server = make_server(args.socket, service)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    log.info("index service listening on %s (pid %d)", args.socket, os.getpid())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        indexer.shutdown()
+        service.close()
+
+
+#########* helpers
+
+def _send(sock: socket.socket, obj: Any) -> None:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)))
+    sock.sendall(data)
+
+
+def _recv(sock: socket.socket) -> Any:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return pickle.loads(_recv_exact(sock, size))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if not n:
+            raise ConnectionError("connection closed")
+        got += n
+    return buf
+
+
+if __name__ == "__main__":
+    main()
@@ -2,201 +2,1036 @@
 from __future__ import annotations
 
 import os
+import time
+import logging
 import uuid
 import shutil
-from pathlib import Path
+import hashlib
+import functools
+import threading
+import asyncio
+import multiprocessing
 from datetime import datetime
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict, deque
+from typing import TYPE_CHECKING, Callable, Iterator, List, NamedTuple, Optional
 from fastapi import UploadFile
-from langchain_community.document_loaders import TextLoader
-from langchain_community.document_loaders.pdf import PyPDFLoader
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_huggingface  import HuggingFaceEmbeddings
+from app.services.cache import LRUCache
+from app.services import admission, answer_cache, metrics, tenants
 from app import config as cfg
 
+# langchain, chromadb and torch are imported where they are first used, so
+# importing app.main (tooling, workers that never embed) stays fast.
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from app.services.embed_cache import EmbeddingCache
+    from app.services.lexical import LexicalIndex
+    from app.services.vectorstore import VectorStore
+    from app.services.catalog import Catalog
+    from app.services.index_service import ServiceClient
+
+log = logging.getLogger(__name__)
+
+class IngestError(ValueError):
+    """Base class for ingestion failures (a ValueError so older callers keep working)."""
+
+class UnsupportedTypeError(IngestError):
+    pass
+
+class ExtractionError(IngestError):
+    pass
+
+class UploadTooLargeError(IngestError):
+    pass
+
+class EmbeddingError(IngestError):
+    pass
+
+class UpsertError(IngestError):
+    pass
+
+class UnknownDocumentError(IngestError):
+    pass
+
+class UpdateConflictError(IngestError):
+    pass
+
+
+class SavedUpload(NamedTuple):
+    doc_id: str
+    path: Optional[str]          # None when the upload was a duplicate and nothing was written
+    content_hash: str
+    duplicate: Optional[dict]    # ingest result of the existing document, if any
+    tenant: str = cfg.DEFAULT_TENANT
 
 
 _embeddings = None
-_vectordb = None
+_embed_cache = None
+# per-tenant shards, opened on first use: tenant -> VectorStore / LexicalIndex / Catalog
+_stores: dict = {}
+_lexical_indexes: dict = {}
+_catalogs: dict = {}
+_shard_lock = threading.RLock()   # reentrant: a backfill opens the tenant's store
+_write_locks: dict = {}           # tenant -> lock held while catalogued documents change, see `_shard_write_lock`
+_service_client = None
+_parse_executor = None
+_generation = 0
+_generation_lock = threading.Lock()
 
 def _reset_db():
-    """Reset the cached Chroma vectorstore so the next call re-initializes it.
+    """Reset the cached vector stores so the next call re-initializes them.
     Useful after destructive operations like deleting a collection.
     """
-    global _vectordb
-    _vectordb = None
+    _stores.clear()
 
 def _emb():
     global _embeddings
     if _embeddings is None:
+        query_cache = LRUCache(cfg.QUERY_EMBED_CACHE_SIZE) if cfg.QUERY_EMBED_CACHE_SIZE > 0 else None
+        if cfg.INDEX_SERVICE_SOCKET:
+            from app.services.index_service import RemoteEmbeddings
+
+            _embeddings = RemoteEmbeddings(_service(), query_cache=query_cache)
+            return _embeddings
+
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from app.services.embed_cache import CachedEmbeddings, PrioritizedEmbeddings
+        from app.services.batcher import EmbedBatcher
+        from app.services import admission
+
         _embeddings = HuggingFaceEmbeddings(model_name=cfg.EMBED_MODEL,encode_kwargs={"normalize_embeddings": True} # normalize embeddings added because synonym test was failing
 )
+        # every model call takes an "embed" slot, questions first
+        _embeddings = PrioritizedEmbeddings(_embeddings, admission.pool("embed"))
+        # queries are embedded like documents here (no query prefix), so the batcher can use embed_questions
+        batcher = None
+        if cfg.QUERY_BATCH_MAX > 1:
+            batcher = EmbedBatcher(_embeddings.embed_questions, cfg.QUERY_BATCH_MAX, cfg.QUERY_BATCH_WAIT_MS,
+                                   max_queue=cfg.EMBED_QUEUE_MAX, timeout=cfg.EMBED_QUEUE_TIMEOUT)
+        _embeddings = CachedEmbeddings(
+            _embeddings,
+            _cache() if cfg.EMBED_CACHE_MAX_ENTRIES > 0 else None,
+            cfg.EMBED_MODEL,
+            query_cache=query_cache,
+            batcher=batcher,
+        )
     return _embeddings
 
-def _db():
-    global _vectordb
-    if _vectordb is None:
-        os.makedirs(cfg.CHROMA_DIR, exist_ok=True)
-        _vectordb = Chroma(
-            collection_name=cfg.CHROMA_COLLECTION,
-            persist_directory=cfg.CHROMA_DIR,
-            embedding_function=_emb(),
+def _cache() -> EmbeddingCache:
+    global _embed_cache
+    if _embed_cache is None:
+        from app.services.embed_cache import EmbeddingCache
+
+        _embed_cache = EmbeddingCache(cfg.EMBED_CACHE_PATH, cfg.EMBED_CACHE_MAX_ENTRIES)
+    return _embed_cache
+
+def _db(tenant: Optional[str] = None) -> VectorStore:
+    """A tenant's vector store (VECTOR_BACKEND, or the index service's); chunks are embedded before they reach it."""
+    tenant = tenants.normalize(tenant)
+    store = _stores.get(tenant)
+    if store is None:
+        with _shard_lock:
+            store = _stores.get(tenant)
+            if store is None:
+                if cfg.INDEX_SERVICE_SOCKET:
+                    from app.services.index_service import RemoteStore
+
+                    store = RemoteStore(_service(), tenant)
+                else:
+                    from app.services.vectorstore import open_store
+
+                    store = open_store(tenant=tenant)
+                _stores[tenant] = store
+    return store
+
+def _service() -> ServiceClient:
+    """Connection pool to the shared index service at INDEX_SERVICE_SOCKET."""
+    global _service_client
+    if _service_client is None:
+        from app.services.index_service import ServiceClient
+
+        _service_client = ServiceClient(cfg.INDEX_SERVICE_SOCKET)
+    return _service_client
+
+def _lexical(backfill: bool = True, tenant: Optional[str] = None) -> LexicalIndex:
+    """A tenant's BM25 index, kept in step with its collection; backfilled once if it starts out empty."""
+    tenant = tenants.normalize(tenant)
+    index = _lexical_indexes.get(tenant)
+    if index is None:
+        with _shard_lock:
+            index = _lexical_indexes.get(tenant)
+            if index is None:
+                path = tenants.sqlite_path(cfg.LEXICAL_INDEX_PATH, tenant)
+                if cfg.INDEX_SERVICE_SOCKET:
+                    from app.services.index_service import RemoteLexicalIndex
+
+                    index = RemoteLexicalIndex(path, _service(), tenant)
+                else:
+                    from app.services.lexical import LexicalIndex
+
+                    index = LexicalIndex(path)
+                if backfill and index.count() == 0:
+                    _backfill_lexical(index, tenant)
+                _lexical_indexes[tenant] = index
+    return index
+
+def _backfill_lexical(index: LexicalIndex, tenant: str, batch: int = 1000) -> None:
+    db = _db(tenant)
+    offset = 0
+    while True:
+        got = db.get(limit=batch, offset=offset)
+        if not got.ids:
+            return
+        index.add(
+            (cid, meta.get("doc_id", ""), text or "")
+            for cid, text, meta in zip(got.ids, got.documents, got.metadatas)
         )
-    return _vectordb
+        offset += len(got.ids)
+
+def _catalog(backfill: bool = True, tenant: Optional[str] = None) -> Catalog:
+    """A tenant's document catalog; backfilled once from the vector store metadata if it starts out empty."""
+    tenant = tenants.normalize(tenant)
+    catalog = _catalogs.get(tenant)
+    if catalog is None:
+        with _shard_lock:
+            catalog = _catalogs.get(tenant)
+            if catalog is None:
+                from app.services.catalog import Catalog
 
+                catalog = Catalog(tenants.sqlite_path(cfg.CATALOG_PATH, tenant))
+                if backfill and catalog.count() == 0:
+                    _backfill_catalog(catalog, tenant)
+                _catalogs[tenant] = catalog
+    return catalog
 
-async def ingest_upload(file: UploadFile) -> dict:
+def _backfill_catalog(catalog: Catalog, tenant: str, batch: int = 1000) -> None:
+    db = _db(tenant)
+    docs: dict = {}
+    offset = 0
+    while True:
+        got = db.get(limit=batch, offset=offset)
+        if not got.ids:
+            break
+        for cid, text, meta in zip(got.ids, got.documents, got.metadatas):
+            if "doc_id" in meta:
+                docs.setdefault(meta["doc_id"], []).append((cid, text or "", meta))
+        offset += len(got.ids)
+    for doc_id, rows in docs.items():
+        rows.sort(key=lambda r: r[2].get("ord", 0))
+        meta = rows[0][2]
+        pages = [m["page"] for _, _, m in rows if isinstance(m.get("page"), int)]
+        path = meta.get("source", "")
+        catalog.record(
+            {
+                "doc_id": doc_id,
+                "filename": meta.get("filename", ""),
+                "content_hash": meta.get("content_hash", ""),
+                "bytes": os.path.getsize(path) if path and os.path.isfile(path) else 0,
+                "pages": max(pages) + 1 if pages else 1,
+                "chunks": len(rows),
+                "ingested_at": meta.get("ingested_at"),
+            },
+            [(cid, m.get("ord", i), m.get("page"), text_hash(text)) for i, (cid, text, m) in enumerate(rows)],
+        )
 
+def text_hash(text: str) -> str:
+    """sha256 of a chunk's text, as recorded in the catalog."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def generation() -> int:
     """
-    Ingests a file to the index.
-    
-    Save file -> extract text -> chunk -> embed -> upsert to Chroma.
-    
+    Collection generation; changes whenever chunks are added or removed.
+
+    With an index service the service's counter is used, so writes made
+    through any worker invalidate every worker's caches.
+    """
+    if cfg.INDEX_SERVICE_SOCKET:
+        return _service().call("generation")
+    return _generation
+
+def _shard_write_lock(tenant: Optional[str] = None) -> threading.Lock:
+    """
+    Held while a tenant's catalogued documents change (delete, update, reset, snapshot import).
+
+    Ingestion of a new document doesn't take it: each embedded batch is
+    searchable (vector store and BM25) before the catalog records the
+    document, but it touches no catalogued rows. A snapshot export holds
+    it to read a catalog and vectors that agree; it skips an in-progress
+    ingest because it copies only the chunks the catalog lists. Per
+    process: writes made by other workers are not excluded.
+    """
+    tenant = tenants.normalize(tenant)
+    with _shard_lock:
+        return _write_locks.setdefault(tenant, threading.Lock())
+
+def _bump_generation() -> None:
+    """Invalidate everything cached against the previous collection contents."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+def _parse_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound text extraction and splitting (spawned, so no torch state is forked)."""
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ProcessPoolExecutor(
+            max_workers=cfg.PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_executor
+
+def warm_up() -> dict:
+    """
+    Loads the embedding model, runs a dummy encode, opens the collection and
+    starts the parse workers, so the first real request doesn't pay for it.
+
+    Returns
+    -------
+    dict
+        Seconds spent in each step.
+    """
+    timings = {}
+    t = time.perf_counter()
+    _emb().embed_query("warm-up")
+    timings["embeddings_seconds"] = round(time.perf_counter() - t, 3)
+
+    t = time.perf_counter()
+    _db().count()
+    timings["collection_seconds"] = round(time.perf_counter() - t, 3)
+
+    t = time.perf_counter()
+    pool = _parse_pool()
+    for f in [pool.submit(_preload_parsers) for _ in range(cfg.PARSE_WORKERS)]:
+        f.result()
+    timings["parse_pool_seconds"] = round(time.perf_counter() - t, 3)
+    return timings
+
+def _preload_parsers() -> None:
+    """Runs in a parse worker: import the parsers once so the first upload doesn't."""
+    import pypdf  # noqa: F401
+    import langchain_text_splitters  # noqa: F401
+
+def shutdown() -> None:
+    """Stop the parse pool and the query batcher, close index service connections. Called from the app lifespan on shutdown."""
+    global _parse_executor
+    batcher = getattr(_embeddings, "batcher", None)
+    if batcher is not None:
+        batcher.stop()
+    if _service_client is not None:
+        _service_client.close()
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+
+
+async def save_upload(file: UploadFile, tenant: Optional[str] = None) -> SavedUpload:
+    """
+    Persists an upload under DATA_DIR/<doc_id>/ without parsing it.
+
+    The stream is read once, in UPLOAD_BLOCK_BYTES blocks, straight to disk:
+    the size limit is enforced and the sha256 computed on the way, so the
+    upload never sits fully in memory. Identical content that is already
+    indexed is not kept; the existing document is returned in `duplicate`.
+
     Parameters
     ----------
     file : UploadFile
-        The file to ingest.
+        The file to save.
+    tenant : str, optional
+        Whose shard the document goes to; duplicates are looked up there only.
 
     Returns
     -------
-    dict
-        A dictionary indicating the success of the ingestion, containing
-        the document id, original filename, the number of chunks produced,
-        and the status of the ingestion.
+    SavedUpload
+        The document id, the path of the saved original, the sha256 of the
+        content and, for a re-upload, the existing document's ingest result.
 
     Raises
     ------
-    ValueError
-        If the file type is unsupported, a ValueError is raised.
-        If the file size is empty, a ValueError is raised.
-        If no chunks are produced, a ValueError is raised.
+    UnsupportedTypeError
+        If the file extension is not one we can extract text from.
+    UploadTooLargeError
+        If the upload exceeds MAX_UPLOAD_BYTES.
+    ExtractionError
+        If the file is empty.
     """
-    os.makedirs(cfg.DATA_DIR, exist_ok=True)
+    ext = os.path.splitext(file.filename.lower())[1]
+    if ext not in {".txt", ".md", ".pdf"}:
+        raise UnsupportedTypeError("Unsupported file type")
+    tenant = tenants.normalize(tenant)
 
     # ids and paths
+    os.makedirs(cfg.DATA_DIR, exist_ok=True)
     doc_id = str(uuid.uuid4())
     folder = os.path.join(cfg.DATA_DIR, doc_id)
     os.makedirs(folder, exist_ok=True)
-    original_path = os.path.join(folder, file.filename)
+    original_path = os.path.join(folder, os.path.basename(file.filename))
+
+    try:
+        with metrics.ingest_stage["save"].time():
+            content_hash = await _write_upload(file, original_path)
+        existing = await asyncio.to_thread(find_duplicate, content_hash, tenant)
+    except BaseException:
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    if existing is not None:
+        shutil.rmtree(folder, ignore_errors=True)
+        metrics.documents.labels(event="duplicate").inc()
+        return SavedUpload(existing["doc_id"], None, content_hash, existing, tenant)
+    return SavedUpload(doc_id, original_path, content_hash, None, tenant)
+
+
+async def save_update(file: UploadFile, doc_id: str, tenant: Optional[str] = None) -> SavedUpload:
+    """
+    Persists a new version of an indexed document in a staging folder under its directory.
 
-    # save original
-    raw = await file.read()
-    if not raw:
-        raise ValueError("Empty file")
-    with open(original_path, "wb") as f:
-        f.write(raw)
+    The current original stays in place until `update_file` succeeds.
+    Content identical to the current version is not kept; `duplicate`
+    then carries a result with status "unchanged".
 
-    # extract text
+    Raises
+    ------
+    UnknownDocumentError
+        If `doc_id` is not in the tenant's catalog.
+    UnsupportedTypeError, UploadTooLargeError, ExtractionError
+        As for `save_upload`.
+    """
     ext = os.path.splitext(file.filename.lower())[1]
-    if ext in {".txt", ".md"}:
-        text_path = os.path.join(folder, "text.txt")
-        with open(text_path, "w", encoding="utf-8") as f:
-            f.write(raw.decode("utf-8", errors="replace"))
-        docs = TextLoader(text_path, encoding="utf-8").load()
-    elif ext == ".pdf":
-        loader = PyPDFLoader(original_path)
-        docs = loader.load()  # one Document per page with page metadata
-    else:
-        raise ValueError("Unsupported file type")
-
-    # chunk
+    if ext not in {".txt", ".md", ".pdf"}:
+        raise UnsupportedTypeError("Unsupported file type")
+    tenant = tenants.normalize(tenant)
+    current = await asyncio.to_thread(_catalog(tenant=tenant).get, doc_id)
+    if current is None:
+        raise UnknownDocumentError("Document not found")
+
+    staging = os.path.join(cfg.DATA_DIR, doc_id, f".update-{uuid.uuid4().hex[:8]}")
+    os.makedirs(staging, exist_ok=True)
+    path = os.path.join(staging, os.path.basename(file.filename))
+    try:
+        with metrics.ingest_stage["save"].time():
+            content_hash = await _write_upload(file, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if content_hash == current["content_hash"]:
+        shutil.rmtree(staging, ignore_errors=True)
+        metrics.documents.labels(event="unchanged").inc()
+        return SavedUpload(doc_id, None, content_hash, {
+            "doc_id": doc_id,
+            "filename": current["filename"],
+            "chunks": current["chunks"],
+            "status": "unchanged",
+        }, tenant)
+    return SavedUpload(doc_id, path, content_hash, None, tenant)
+
+
+async def _write_upload(file: UploadFile, path: str) -> str:
+    """Streams an upload to `path` in UPLOAD_BLOCK_BYTES blocks; returns its sha256."""
+    digest = hashlib.sha256()
+    total = 0
+    with open(path, "wb") as f:
+        while True:
+            block = await file.read(cfg.UPLOAD_BLOCK_BYTES)
+            if not block:
+                break
+            total += len(block)
+            if total > cfg.MAX_UPLOAD_BYTES:
+                raise UploadTooLargeError(f"File size too large. Max: {cfg.MAX_UPLOAD_MB}MB")
+            digest.update(block)
+            await asyncio.to_thread(f.write, block)
+    if total == 0:
+        raise ExtractionError("Empty file")
+    return digest.hexdigest()
+
+
+def find_duplicate(content_hash: str, tenant: Optional[str] = None) -> Optional[dict]:
+    """
+    Looks up an indexed document by the sha256 of its original bytes (a catalog index hit).
+
+    Returns
+    -------
+    dict or None
+        An ingest result with status "duplicate" for the existing document,
+        or None if this content has not been indexed.
+    """
+    doc = _catalog(tenant=tenant).by_hash(content_hash)
+    if doc is None:
+        return None
+    return {
+        "doc_id": doc["doc_id"],
+        "filename": doc["filename"],
+        "chunks": doc["chunks"],
+        "status": "duplicate",
+    }
+
+
+def discard_upload(path: Optional[str]) -> None:
+    """Removes the folder of a saved upload that won't be indexed because its content already is (or is being)."""
+    if path:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def get_document(doc_id: str, tenant: Optional[str] = None) -> Optional[dict]:
+    """Catalog entry of a document, with its chunk ids in order, or None if it isn't in the tenant's index."""
+    catalog = _catalog(tenant=tenant)
+    doc = catalog.get(doc_id)
+    if doc is not None:
+        doc["chunk_ids"] = catalog.chunk_ids(doc_id)
+    return doc
+
+
+def list_documents(limit: int, cursor: Optional[int] = None,
+                   tenant: Optional[str] = None) -> tuple[List[dict], Optional[int]]:
+    """One page of a tenant's catalog entries, newest first; see Catalog.list."""
+    return _catalog(tenant=tenant).list(limit, cursor)
+
+
+def match_filenames(patterns: List[str], tenant: Optional[str] = None) -> List[str]:
+    """doc_ids of a tenant's documents whose filename matches one of the glob patterns."""
+    return _catalog(tenant=tenant).match_filenames(patterns)
+
+
+def parse_pages(path: str, start: int, stop: int) -> List[Document]:
+    """
+    Extracts pages [start, stop) of a saved original and splits each page as it is read.
+
+    Plain text files are a single "page".
+
+    Returns
+    -------
+    list[Document]
+        The chunks of those pages in order, with `source` (and `page` for PDFs) metadata.
+    """
+    return _parse_task(path, start, stop)[0]
+
+
+def _parse_task(path: str, start: int, stop: int) -> tuple[List[Document], float, float]:
+    """
+    `parse_pages` plus the seconds spent extracting and splitting, for the stage metrics.
+
+    Runs in the parse process pool, so it must stay a picklable top-level
+    function that does not touch the embeddings or the vector store (nor
+    the metrics registry, which lives in the parent process).
+    """
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=cfg.SPLIT_CHUNK_SIZE, chunk_overlap=cfg.SPLIT_CHUNK_OVERLAP
     )
-    chunks: List[Document] = splitter.split_documents(docs)
-    if not chunks:
-        raise ValueError("No chunks produced")
+    ext = os.path.splitext(path.lower())[1]
+    chunks: List[Document] = []
+    extract_s = split_s = 0.0
+    try:
+        if ext in {".txt", ".md"}:
+            # decoded straight from the saved original, no intermediate copy
+            t = time.perf_counter()
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            extract_s = time.perf_counter() - t
+            chunks.extend(splitter.split_documents([Document(page_content=text, metadata={"source": path})]))
+            split_s = time.perf_counter() - t - extract_s
+        elif ext == ".pdf":
+            from pypdf import PdfReader
 
-    # minimal metadata
-    for i, d in enumerate(chunks):
-        d.metadata.update({
-            "doc_id": doc_id,
-            "filename": file.filename,
-            "ord": i,
-            "ingested_at": datetime.now().isoformat() + "Z",
+            t = time.perf_counter()
+            reader = PdfReader(path)
+            for n in range(start, min(stop, len(reader.pages))):
+                page = Document(
+                    page_content=reader.pages[n].extract_text() or "",
+                    metadata={"source": path, "page": n, "total_pages": len(reader.pages)},
+                )
+                t_split = time.perf_counter()
+                chunks.extend(splitter.split_documents([page]))
+                split_s += time.perf_counter() - t_split
+            extract_s = time.perf_counter() - t - split_s
+        else:
+            raise UnsupportedTypeError("Unsupported file type")
+    except IngestError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f"Could not extract text: {e}") from e
+    return chunks, extract_s, split_s
+
+
+def page_count(path: str) -> int:
+    """Number of pages in a saved original (1 for plain text)."""
+    if os.path.splitext(path.lower())[1] != ".pdf":
+        return 1
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path).pages)
+    except Exception as e:
+        raise ExtractionError(f"Could not extract text: {e}") from e
+
+
+def iter_chunks(path: str, on_pages: Optional[Callable[[int], None]] = None) -> Iterator[Document]:
+    """
+    Yields the chunks of a saved original in document order, parsing ahead in the process pool.
+
+    Pages are parsed PARSE_PAGES_PER_TASK at a time, with at most
+    PARSE_WINDOW tasks in flight, so parsing overlaps with whatever the
+    caller does with the chunks (embedding) while memory stays bounded
+    regardless of page count.
+
+    Parameters
+    ----------
+    path : str
+        Path of the saved original.
+    on_pages : callable, optional
+        Called with the running number of pages parsed.
+    """
+    total = page_count(path)
+    step = max(1, cfg.PARSE_PAGES_PER_TASK)
+    ranges = iter(range(0, total, step))
+    pool = _parse_pool()
+    window: deque = deque()
+
+    def _fill():
+        while len(window) < max(1, cfg.PARSE_WINDOW):
+            start = next(ranges, None)
+            if start is None:
+                return
+            window.append((min(start + step, total), pool.submit(_parse_task, path, start, start + step)))
+
+    try:
+        _fill()
+        while window:
+            pages_done, future = window.popleft()
+            t = time.perf_counter()
+            chunks, extract_s, split_s = future.result()
+            metrics.ingest_stage["parse_wait"].observe(time.perf_counter() - t)
+            metrics.ingest_stage["extract"].observe(extract_s)
+            metrics.ingest_stage["split"].observe(split_s)
+            _fill()
+            if on_pages:
+                on_pages(pages_done)
+            yield from chunks
+    finally:
+        for _, future in window:
+            future.cancel()
+
+
+def index_chunks(chunks: List[Document], on_progress: Optional[Callable[..., None]] = None,
+                 tenant: Optional[str] = None) -> None:
+    """
+    Embeds and upserts chunks into a tenant's shard in EMBED_BATCH_SIZE batches, reporting progress after each.
+
+    Model calls wait behind questions for an "embed" slot and upserts for
+    a "vector_write" slot (see services/admission.py).
+    """
+    db = _db(tenant)
+    lexical = _lexical(tenant=tenant)
+    done = 0
+    try:
+        for start in range(0, len(chunks), cfg.EMBED_BATCH_SIZE):
+            batch = chunks[start:start + cfg.EMBED_BATCH_SIZE]
+            t = time.perf_counter()
+            try:
+                vectors = _emb().embed_documents([d.page_content for d in batch])
+            except Exception as e:
+                raise EmbeddingError(f"Embedding failed: {e}") from e
+            t_upsert = time.perf_counter()
+            metrics.ingest_stage["embed"].observe(t_upsert - t)
+            try:
+                with admission.pool("vector_write").slot(admission.BULK, block=True):
+                    db.add([d.id for d in batch], [d.page_content for d in batch], [d.metadata for d in batch], vectors)
+                    lexical.add((d.id, d.metadata["doc_id"], d.page_content) for d in batch)
+            except Exception as e:
+                raise UpsertError(f"Index upsert failed: {e}") from e
+            metrics.ingest_stage["upsert"].observe(time.perf_counter() - t_upsert)
+            metrics.chunks.labels(event="embedded").inc(len(batch))
+            done += len(batch)
+            if on_progress:
+                on_progress(chunks_embedded=done)
+    finally:
+        if done:
+            _bump_generation()
+
+
+class _Indexing:
+    """
+    What `index_file` and `update_file` share: chunk ids and metadata, batched
+    embedding of new chunks, progress reporting and the catalog record.
+
+    Parameters
+    ----------
+    doc_id, filename, content_hash : str
+        The document version being indexed.
+    source : str
+        Final path of its original, stored as the chunks' `source`.
+    on_progress : callable, optional
+        Receives `pages_parsed`, `chunks_total`, `chunks_embedded` and `first_chunk_indexed_ms`.
+    tenant : str, optional
+        Whose shard the chunks go to.
+    """
+
+    def __init__(self, doc_id: str, filename: str, source: str, content_hash: str,
+                 on_progress: Optional[Callable[..., None]] = None, tenant: Optional[str] = None):
+        self.doc_id, self.filename, self.source, self.content_hash = doc_id, filename, source, content_hash
+        self.progress = on_progress or (lambda **_: None)
+        self.tenant = tenant
+        self.started = time.perf_counter()
+        self.ingested_at, self.ingested_ts = datetime.now().isoformat() + "Z", time.time()
+        self.batch: List[Document] = []
+        self.embedded, self.pages, self.index_s, self.first_chunk_ms = 0, 0, 0.0, None
+
+    def on_pages(self, n: int) -> None:
+        self.pages = n
+        self.progress(pages_parsed=n)
+
+    def new_chunk(self, chunk: Document, ord_: int) -> str:
+        """Gives a parsed chunk its id and metadata; the id is shared by the vector store and the lexical index."""
+        chunk.id = f"{self.doc_id}:{uuid.uuid4().hex[:16]}"
+        chunk.metadata.update({
+            "source": self.source,
+            "doc_id": self.doc_id,
+            "filename": self.filename,
+            "ord": ord_,
+            "content_hash": self.content_hash,
+            "ingested_at": self.ingested_at,
+            "ingested_ts": self.ingested_ts,   # numeric, for `$gte` filters
         })
+        return chunk.id
 
-    # upsert
-    db = _db()
-    db.add_documents(chunks)
+    def add(self, chunk: Document) -> None:
+        """Queues a chunk for embedding, indexing the batch once EMBED_BATCH_SIZE is reached."""
+        self.batch.append(chunk)
+        if len(self.batch) >= cfg.EMBED_BATCH_SIZE:
+            self.flush()
 
-    
+    def flush(self) -> None:
+        if not self.batch:
+            return
+        t = time.perf_counter()
+        index_chunks(self.batch, tenant=self.tenant)
+        self.index_s += time.perf_counter() - t
+        self.embedded += len(self.batch)
+        self.batch.clear()
+        if self.first_chunk_ms is None:
+            self.first_chunk_ms = round((time.perf_counter() - self.started) * 1000, 1)
+            log.info("%s: first chunks indexed after %.1f ms", self.doc_id, self.first_chunk_ms)
+            self.progress(first_chunk_indexed_ms=self.first_chunk_ms)
+        self.progress(chunks_embedded=self.embedded)
+
+    def record(self, catalog: Catalog, path: str, chunks: List[tuple]) -> None:
+        """Writes the document and its (chunk_id, ord, page, text_hash) rows to the catalog."""
+        catalog.record(
+            {
+                "doc_id": self.doc_id,
+                "filename": self.filename,
+                "content_hash": self.content_hash,
+                "bytes": os.path.getsize(path),
+                "pages": self.pages,
+                "chunks": len(chunks),
+                "ingested_at": self.ingested_at,
+                "first_chunk_ms": self.first_chunk_ms,
+                "index_ms": round(self.index_s * 1000, 1),
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            },
+            chunks,
+        )
+
+
+def index_file(doc_id: str, path: str, filename: str, content_hash: str,
+               on_progress: Optional[Callable[..., None]] = None, tenant: Optional[str] = None) -> dict:
+    """
+    Blocking part of ingestion: a streaming parse -> split -> embed -> upsert pipeline.
+
+    Chunks from `iter_chunks` are embedded and upserted in EMBED_BATCH_SIZE
+    batches as soon as a batch fills up, while later pages are still being
+    parsed. Meant to be called from a worker thread, never directly on the
+    event loop. The document is recorded in the catalog once all chunks are
+    in. If anything fails, vectors already written and the document folder
+    are removed so no orphan is left behind. Everything goes to `tenant`'s
+    shard (DEFAULT_TENANT if None).
+    """
+    run = _Indexing(doc_id, filename, path, content_hash, on_progress, tenant)
+    chunks: List[tuple] = []   # (chunk_id, ord, page, text_hash) for the catalog
+
+    try:
+        for chunk in iter_chunks(path, on_pages=run.on_pages):
+            ord_ = len(chunks)
+            cid = run.new_chunk(chunk, ord_)
+            chunks.append((cid, ord_, chunk.metadata.get("page"), text_hash(chunk.page_content)))
+            run.progress(chunks_total=len(chunks))
+            run.add(chunk)
+        run.flush()
+        if not chunks:
+            raise ExtractionError("No chunks produced")
+        run.record(_catalog(tenant=tenant), path, chunks)
+    except Exception:
+        metrics.documents.labels(event="failed").inc()
+        if run.embedded or run.batch:
+            # the failed batch may be partly written, so drop every id handed out
+            ids = [c[0] for c in chunks]
+            _db(tenant).delete(ids=ids)
+            _lexical(tenant=tenant).delete(ids)
+            _bump_generation()
+        shutil.rmtree(os.path.join(cfg.DATA_DIR, doc_id), ignore_errors=True)
+        raise
+
+    metrics.ingest_stage["total"].observe(time.perf_counter() - run.started)
+    metrics.documents.labels(event="indexed").inc()
     return {
         "doc_id": doc_id,
-        "filename": file.filename,
+        "filename": filename,
         "chunks": len(chunks),
         "status": "indexed",
     }
 
 
-async def delete_document(doc_id: str) -> bool:
+def update_file(doc_id: str, path: str, filename: str, content_hash: str,
+                on_progress: Optional[Callable[..., None]] = None, tenant: Optional[str] = None) -> dict:
+    """
+    Blocking part of a document update: re-parse the new version and apply only the chunk diff.
+
+    New chunks are matched against the stored ones by the sha256 of their
+    text. Matches keep their id, vector and BM25 entry (only `ord`, `page`
+    and, after a rename, `filename`/`source` metadata are rewritten when
+    they moved); unmatched new chunks are embedded and upserted exactly as
+    in `index_file`; stored chunks left unmatched are deleted. Embedding
+    work is therefore proportional to the changed text. Per-chunk
+    `content_hash` and `ingested_at`/`ingested_ts` keep the values of the version the
+    chunk was embedded from; the catalog holds the document's current ones.
+
+    Parameters
+    ----------
+    doc_id : str
+        The indexed document to update; its id does not change.
+    path : str
+        Staged new version, as saved by `save_update`.
+    filename : str
+        Filename of the new version.
+    content_hash : str
+        sha256 of the new version.
+    on_progress : callable, optional
+        Receives the same progress fields as for `index_file`.
+    tenant : str, optional
+        The tenant whose shard holds the document.
+
+    Returns
+    -------
+    dict
+        The ingest result with status "updated" and added/removed/unchanged chunk counts.
+
+    Raises
+    ------
+    UnknownDocumentError
+        If the document is not indexed, or was deleted while this version was parsed.
+    UpdateConflictError
+        If another update committed while this version was parsed; the
+        diff would be against chunks that are gone, so nothing is applied.
+    """
+    db, lexical, catalog = _db(tenant), _lexical(tenant=tenant), _catalog(tenant=tenant)
+    current = catalog.get(doc_id)
+    if current is None:
+        raise UnknownDocumentError("Document not found")
+
+    folder = os.path.join(cfg.DATA_DIR, doc_id)
+    final_path = os.path.join(folder, os.path.basename(filename))
+    run = _Indexing(doc_id, filename, final_path, content_hash, on_progress, tenant)
+    renamed = current["filename"] != filename
+    base = catalog.chunks(doc_id)    # the version this update is diffed against
+    stored = defaultdict(deque)
+    for cid, ord_, page, h in base:
+        stored[h].append((cid, ord_, page))
+
+    chunks: List[tuple] = []
+    added: List[str] = []
+    moved: List[tuple] = []    # (chunk_id, new metadata, old metadata)
+
+    applied = committed = False
+    try:
+        for chunk in iter_chunks(path, on_pages=run.on_pages):
+            ord_ = len(chunks)
+            h = text_hash(chunk.page_content)
+            page = chunk.metadata.get("page")
+            if stored[h]:
+                cid, old_ord, old_page = stored[h].popleft()
+                if old_ord != ord_ or old_page != page or renamed:
+                    new = {"ord": ord_, **({"page": page} if page is not None else {})}
+                    old = {"ord": old_ord, **({"page": old_page} if old_page is not None else {})}
+                    if renamed:
+                        new.update(filename=filename, source=final_path)
+                        old.update(filename=current["filename"],
+                                   source=os.path.join(folder, os.path.basename(current["filename"])))
+                    moved.append((cid, new, old))
+            else:
+                cid = run.new_chunk(chunk, ord_)
+                added.append(cid)
+                run.add(chunk)
+            chunks.append((cid, ord_, page, h))
+            run.progress(chunks_total=len(chunks))
+        run.flush()
+        if not chunks:
+            raise ExtractionError("No chunks produced")
+
+        removed = [cid for left in stored.values() for cid, _, _ in left]
+        with _shard_write_lock(tenant):
+            # a delete or another update of this document may have committed while this one parsed
+            latest = catalog.get(doc_id)
+            if latest is None:
+                raise UnknownDocumentError("Document was deleted during the update")
+            if latest["content_hash"] != current["content_hash"] or catalog.chunks(doc_id) != base:
+                raise UpdateConflictError("Document was changed by another update; retry with the latest version")
+            # kept with their vectors until the catalog points at the new version, to put back on failure
+            gone = db.get(ids=removed, embeddings=True) if removed else None
+            applied = True
+            try:
+                with admission.pool("vector_write").slot(admission.BULK, block=True):
+                    if moved:
+                        db.update_metadata([m[0] for m in moved], [m[1] for m in moved])
+                    db.delete(ids=removed)
+                    lexical.delete(removed)
+                answer_cache.cache.invalidate(removed)
+                run.record(catalog, path, chunks)
+            except Exception:
+                if moved:
+                    db.update_metadata([m[0] for m in moved], [m[2] for m in moved])
+                if gone is not None and len(gone.ids):
+                    db.add(gone.ids, gone.documents, gone.metadatas, gone.embeddings)
+                    lexical.add((cid, doc_id, text) for cid, text in zip(gone.ids, gone.documents))
+                raise
+            committed = True
+            # swap the staged original in for the previous one
+            old_path = os.path.join(folder, os.path.basename(current["filename"]))
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+            os.replace(path, final_path)
+    except Exception:
+        metrics.documents.labels(event="failed").inc()
+        if added and not committed:
+            db.delete(ids=added)
+            lexical.delete(added)
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        raise
+    finally:
+        if added or applied:
+            _bump_generation()
+
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    total, kept = len(chunks), len(chunks) - len(added)
+    log.info("%s: updated, %d chunks added, %d removed, %d kept", doc_id, len(added), len(removed), kept)
+    metrics.ingest_stage["total"].observe(time.perf_counter() - run.started)
+    metrics.documents.labels(event="updated").inc()
+    metrics.chunks.labels(event="deleted").inc(len(removed))
+    return {
+        "doc_id": doc_id,
+        "filename": filename,
+        "chunks": total,
+        "status": "updated",
+        "added": len(added),
+        "removed": len(removed),
+        "unchanged": kept,
+    }
+
+
+async def ingest_upload(file: UploadFile, tenant: Optional[str] = None) -> dict:
+
+    """
+    Ingests a file to the index.
+    
+    Save file -> extract text -> chunk -> embed -> upsert to the vector store.
+    Re-uploading content that is already indexed returns the existing
+    document (status "duplicate") without parsing or embedding anything.
+    Parsing runs in the process pool and embedding in a worker thread,
+    so awaiting this does not block the event loop.
+    
+    Parameters
+    ----------
+    file : UploadFile
+        The file to ingest.
+    tenant : str, optional
+        Whose shard to index it in; DEFAULT_TENANT if None.
+
+    Returns
+    -------
+    dict
+        A dictionary indicating the success of the ingestion, containing
+        the document id, original filename, the number of chunks produced,
+        and the status of the ingestion.
+
+    Raises
+    ------
+    ValueError
+        If the file type is unsupported, a ValueError is raised.
+        If the file size is empty, a ValueError is raised.
+        If no chunks are produced, a ValueError is raised.
+    """
+    saved = await save_upload(file, tenant)
+    if saved.duplicate is not None:
+        return saved.duplicate
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(index_file, saved.doc_id, saved.path, file.filename, saved.content_hash,
+                                tenant=saved.tenant)
+    )
+
+
+async def delete_document(doc_id: str, tenant: Optional[str] = None) -> bool:
     """
     Deletes a document from the index.
 
+    The catalog, vector store and BM25 deletes are blocking, so they run
+    in a worker thread.
+
     Parameters
     ----------
     doc_id : str
         The document id to delete.
+    tenant : str, optional
+        The tenant owning it; another tenant's document is left alone.
 
     Returns
     -------
     bool
         True if the document existed and was deleted, False otherwise.
     """
+    return await asyncio.to_thread(_delete_document, doc_id, tenant)
+
 
-    _db().delete(where={"doc_id": doc_id})
+def _delete_document(doc_id: str, tenant: Optional[str]) -> bool:
+    # exact chunk ids from the catalog: no metadata scan in the vector store
+    catalog = _catalog(tenant=tenant)
+    with _shard_write_lock(tenant):
+        if catalog.get(doc_id) is None:
+            return False    # not this tenant's: its folder (if any) is left alone too
+        ids = catalog.chunk_ids(doc_id)
+        _db(tenant).delete(ids=ids)
+        _lexical(tenant=tenant).delete(ids)
+        catalog.delete(doc_id)
+        _bump_generation()
+    answer_cache.cache.invalidate(ids)
+    metrics.documents.labels(event="deleted").inc()
+    metrics.chunks.labels(event="deleted").inc(len(ids))
 
-    # remove folder
     folder = os.path.join(cfg.DATA_DIR, doc_id)
-    existed = os.path.isdir(folder)
-    print("deleting", folder)
-    print("full path", os.path.abspath(folder))
-    if existed:
-        # simple recursive delete
-        for root, dirs, files in os.walk(folder, topdown=False):
-            for name in files:
-                try:
-                    os.remove(os.path.join(root, name))
-                except FileNotFoundError:
-                    pass
-            for name in dirs:
-                try:
-                    os.rmdir(os.path.join(root, name))
-                except OSError:
-                    pass
-        try:
-            os.rmdir(folder)
-        except OSError:
-            pass
-
-    return existed
-
-async def reset_docs() -> bool:
-    """
-    Clear all vectors without deleting sqlite files.
-    Prefers delete_collection; falls back to batched ID deletes; final fallback is where={}.
-    """
-    vs = _db()
-
-    client = getattr(vs, "_client", None)
-    coll   = getattr(vs, "_collection", None)
-    name = None
-    if coll is not None:
-        name = getattr(coll, "name", None) or getattr(coll, "_name", None)
-
-    if client is not None and name:
-        try:
-            client.delete_collection(name)  
-            _reset_db()
-            _ = _db()  # re-initialize to a fresh, empty collection
-            data_dir = Path(cfg.DATA_DIR.strip("/docs"))
-            if data_dir.exists():
-                shutil.rmtree(data_dir, ignore_errors=True)
-            return True
-        except Exception:
-            pass
-
-
-    return False
+    log.debug("%s: removing %s", doc_id, os.path.abspath(folder))
+    shutil.rmtree(folder, ignore_errors=True)
+    return True
+
+async def reset_docs(tenant: Optional[str] = None) -> bool:
+    """
+    Clear one tenant's vectors, BM25 index, catalog and uploaded originals, without deleting sqlite files.
+    The store empties itself (Chroma drops and recreates the tenant's collection);
+    other tenants' shards and folders are not touched.
+    """
+    try:
+        catalog = _catalog(backfill=False, tenant=tenant)
+        with _shard_write_lock(tenant):
+            doc_ids = catalog.doc_ids()
+            _db(tenant).reset()
+            _lexical(backfill=False, tenant=tenant).reset()
+            catalog.reset()
+            _bump_generation()
+        answer_cache.cache.clear()
+        for doc_id in doc_ids:
+            shutil.rmtree(os.path.join(cfg.DATA_DIR, doc_id), ignore_errors=True)
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,192 @@
+# app/services/jobs.py
+from __future__ import annotations
+
+import time
+import uuid
+import threading
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from app.services import admission, indexer, metrics
+from app import config as cfg
+
+
+@dataclass
+class Job:
+    job_id: str
+    doc_id: str
+    filename: str
+    tenant: str = cfg.DEFAULT_TENANT
+    status: str = "queued"  # queued -> parsing -> embedding (parsing continues alongside) -> done | failed
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    first_chunk_indexed_ms: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def update(self, **fields) -> None:
+        with _lock:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            if "chunks_embedded" in fields and self.status == "parsing":
+                self.status = "embedding"
+
+    def to_dict(self) -> dict:
+        with _lock:
+            return asdict(self)
+
+
+_jobs: dict[str, Job] = {}
+_inflight: dict[tuple, Job] = {}   # (tenant, content_hash) -> queued or running job of a new upload
+_lock = threading.Lock()
+_executor = None
+_job_seconds = 0.0    # moving average of a job's run time, for Retry-After
+
+
+def _pool() -> ThreadPoolExecutor:
+    """Bounded worker for the embed + upsert stage (INGEST_WORKERS threads)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=cfg.INGEST_WORKERS, thread_name_prefix="ingest")
+    return _executor
+
+
+def admit() -> None:
+    """
+    Refuses new uploads while INGEST_QUEUE_MAX jobs are queued or running.
+
+    Called before an upload is written to disk, so a refused upload costs nothing.
+
+    Raises
+    ------
+    admission.OverloadedError
+        If the queue is full; `retry_after` estimates when a worker frees up.
+    """
+    with _lock:
+        pending = sum(j.finished_at is None for j in _jobs.values())
+    if pending >= cfg.INGEST_QUEUE_MAX:
+        workers = max(1, cfg.INGEST_WORKERS)
+        raise admission.reject("ingest", (_job_seconds or 5.0) * (pending - workers + 1) / workers)
+
+
+def submit(saved: indexer.SavedUpload, filename: str, update: bool = False,
+           timings: Optional[dict] = None) -> Job:
+    """
+    Queues a saved upload for background indexing.
+
+    Duplicates of already indexed content (and updates that change
+    nothing) get a job that is done on creation, so clients poll the same
+    way either way. A new upload whose content is still queued or being
+    indexed for the same tenant is dropped and gets that pending job.
+
+    Parameters
+    ----------
+    saved : indexer.SavedUpload
+        What `indexer.save_upload` (or `save_update`) returned for the upload.
+    filename : str
+        The original filename.
+    update : bool, optional
+        Apply the upload as a new version of `saved.doc_id` (`indexer.update_file`).
+    timings : dict, optional
+        Debug breakdown started by the upload request; the job adds its
+        stages and attaches it to the result.
+
+    Returns
+    -------
+    Job
+        The queued job (or the pending one with the same content); poll it with `get`.
+    """
+    job = Job(job_id=str(uuid.uuid4()), doc_id=saved.doc_id, filename=filename, tenant=saved.tenant)
+    if saved.duplicate is not None:
+        job.status = "done"
+        job.chunks_total = job.chunks_embedded = saved.duplicate["chunks"]
+        job.result = saved.duplicate if timings is None else {**saved.duplicate, "timings": metrics.rounded(timings)}
+        job.finished_at = time.time()
+    key = (saved.tenant, saved.content_hash) if saved.duplicate is None and not update else None
+    with _lock:
+        pending = _inflight.get(key) if key else None
+        if pending is None:
+            _jobs[job.job_id] = job
+            if key:
+                _inflight[key] = job
+            _prune()
+    if pending is not None:
+        indexer.discard_upload(saved.path)
+        metrics.documents.labels(event="duplicate").inc()
+        return pending
+    if saved.duplicate is None:
+        _pool().submit(_run, job, saved.path, saved.content_hash, update, timings)
+    return job
+
+
+def get(job_id: str, tenant: Optional[str] = None) -> Optional[Job]:
+    """The job, or None if it is unknown or (with `tenant`) belongs to another tenant."""
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is not None and tenant is not None and job.tenant != tenant:
+        return None
+    return job
+
+
+def counts() -> dict[str, int]:
+    """Number of known jobs per status (finished ones until pruned)."""
+    out = dict.fromkeys(("queued", "parsing", "embedding", "done", "failed"), 0)
+    with _lock:
+        for job in _jobs.values():
+            out[job.status] = out.get(job.status, 0) + 1
+    return out
+
+
+def shutdown() -> None:
+    """Stop accepting jobs and let running ones finish. Called from the app lifespan."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+#########* helpers
+
+def _run(job: Job, path: str, content_hash: str, update: bool = False, timings: Optional[dict] = None) -> None:
+    global _job_seconds
+    started = time.perf_counter()
+    job.update(status="parsing")
+    run = indexer.update_file if update else indexer.index_file
+    if timings is not None:
+        metrics.start_timings(timings)
+    try:
+        # the same content may have finished indexing after the upload's own catalog check
+        existing = None if update else indexer.find_duplicate(content_hash, job.tenant)
+        if existing is not None:
+            indexer.discard_upload(path)
+            metrics.documents.labels(event="duplicate").inc()
+            result = existing
+            job.update(doc_id=existing["doc_id"], chunks_total=existing["chunks"], chunks_embedded=existing["chunks"])
+        else:
+            result = run(job.doc_id, path, job.filename, content_hash, on_progress=job.update, tenant=job.tenant)
+        if timings is not None:
+            result["timings"] = metrics.rounded(timings)
+        job.update(status="done", result=result, finished_at=time.time())
+    except Exception as e:
+        job.update(status="failed", error=str(e) or type(e).__name__, finished_at=time.time())
+    finally:
+        # only now is a finished upload's content in the catalog for `find_duplicate`
+        with _lock:
+            if _inflight.get((job.tenant, content_hash)) is job:
+                del _inflight[(job.tenant, content_hash)]
+        # pool threads are reused, don't leak the breakdown into the next job
+        metrics.stop_timings()
+        took = time.perf_counter() - started
+        _job_seconds = took if not _job_seconds else 0.9 * _job_seconds + 0.1 * took
+
+
+def _prune() -> None:
+    """Drop the oldest finished jobs beyond JOB_HISTORY. Caller holds _lock."""
+    finished = [j for j in _jobs.values() if j.finished_at is not None]
+    excess = len(finished) - cfg.JOB_HISTORY
+    if excess > 0:
+        for j in sorted(finished, key=lambda j: j.finished_at)[:excess]:
+            _jobs.pop(j.job_id, None)
@@ -0,0 +1,214 @@
+# app/services/lexical.py
+from __future__ import annotations
+
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# identifiers such as "PN-4711", "7.2.1" or "E_CONN_RESET" stay one token;
+# their parts are indexed as well so "4711" still matches "PN-4711"
+_TOKEN = re.compile(r"[0-9a-z]+(?:[-_./:][0-9a-z]+)*")
+_SPLIT = re.compile(r"[-_./:]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in _TOKEN.findall(text.lower()):
+        tokens.append(tok)
+        parts = _SPLIT.split(tok)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Incremental on-disk BM25 index backed by SQLite.
+
+    Keeps postings (term, chunk_id, tf), per-chunk lengths, per-term
+    document frequencies and corpus totals, so adding or deleting a chunk
+    only touches its own terms and a query only reads the postings of its
+    terms.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, length INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats (key, value) VALUES ('chunks', 0), ('tokens', 0);
+            """
+        )
+        self._conn.commit()
+
+    def add(self, items: Iterable[Tuple[str, str, str]]) -> None:
+        """Indexes (chunk_id, doc_id, text) triples; re-adding a chunk_id replaces it."""
+        items = list(items)
+        with self._lock:
+            self._delete_chunks([cid for cid, _, _ in items])
+            df = Counter()
+            tokens = 0
+            for chunk_id, doc_id, text in items:
+                tf = Counter(tokenize(text))
+                length = sum(tf.values())
+                tokens += length
+                self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, doc_id, length) VALUES (?, ?, ?)",
+                    (chunk_id, doc_id, length),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(t, chunk_id, n) for t, n in tf.items()],
+                )
+                df.update(tf.keys())
+            self._conn.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) "
+                "ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                df.items(),
+            )
+            self._add_stats(len(items), tokens)
+            self._conn.commit()
+
+    def delete_doc(self, doc_id: str) -> None:
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))]
+            self._delete_chunks(ids)
+            self._conn.commit()
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._delete_chunks(list(chunk_ids))
+            self._conn.commit()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conn.executescript(
+                "DELETE FROM postings; DELETE FROM chunks; DELETE FROM terms; UPDATE stats SET value = 0;"
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._stats()[0]
+
+    def search(self, query: str, k: int, max_df_ratio: float = 0.5,
+               doc_ids: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k chunks by BM25 score.
+
+        Terms that occur in more than `max_df_ratio` of all chunks are
+        skipped when the query also has rarer terms: their idf is near zero
+        and their posting lists are the most expensive to read. With
+        `doc_ids`, only postings of those documents' chunks are scored
+        (idf still comes from the whole index).
+
+        Returns
+        -------
+        list[tuple[str, float]]
+            (chunk_id, score), best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0 or (doc_ids is not None and not doc_ids):
+            return []
+        scope, scope_args = "", []
+        if doc_ids is not None:
+            scope_args = list(doc_ids)
+            scope = f" AND c.doc_id IN ({','.join('?' * len(scope_args))})"
+        with self._lock:
+            n, total = self._stats()
+            if not n:
+                return []
+            avgdl = total / n
+            marks = ",".join("?" * len(terms))
+            dfs = dict(self._conn.execute(f"SELECT term, df FROM terms WHERE term IN ({marks})", terms))
+            if not dfs:
+                return []
+            rare = {t: df for t, df in dfs.items() if df <= n * max_df_ratio}
+            use = rare or dfs
+
+            scores: Counter = Counter()
+            for term, df in use.items():
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term = ?" + scope,
+                    (term, *scope_args),
+                ):
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avgdl)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+        return scores.most_common(k)
+
+    #########* helpers
+
+    def _stats(self) -> Tuple[int, int]:
+        rows = dict(self._conn.execute("SELECT key, value FROM stats"))
+        return rows["chunks"], rows["tokens"]
+
+    def _add_stats(self, chunks: int, tokens: int) -> None:
+        self._conn.executemany(
+            "UPDATE stats SET value = value + ? WHERE key = ?", [(chunks, "chunks"), (tokens, "tokens")]
+        )
+
+    def _delete_chunks(self, chunk_ids: List[str]) -> None:
+        """Caller holds the lock and commits."""
+        for i in range(0, len(chunk_ids), 500):
+            part = chunk_ids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            removed, tokens = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE chunk_id IN ({marks})", part
+            ).fetchone()
+            self._add_stats(-removed, -tokens)
+            gone = Counter(
+                r[0] for r in self._conn.execute(f"SELECT term FROM postings WHERE chunk_id IN ({marks})", part)
+            )
+            if not gone:
+                self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", part)
+                continue
+            self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(c, t) for t, c in gone.items()])
+            self._conn.execute("DELETE FROM terms WHERE df <= 0")
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", part)
+
+
+def rrf(rankings: Iterable[List[str]], k: int, rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Reciprocal rank fusion of several best-first id lists.
+
+    Parameters
+    ----------
+    rankings : iterable of list[str]
+        Each list ranks ids best first.
+    k : int
+        Number of fused ids to return.
+    rrf_k : int, optional
+        Damping constant; 60 is the value from the original RRF paper.
+
+    Returns
+    -------
+    list[tuple[str, float]]
+        The top-k (id, fused score), best first.
+    """
+    scores: Counter = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (rrf_k + rank + 1)
+    return scores.most_common(k)
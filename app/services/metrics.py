@@ -0,0 +1,220 @@
+# app/services/metrics.py
+"""
+Prometheus metrics, served by `GET /metrics`.
+
+Stage histograms and event counters are updated inline by the indexer,
+retrieval and /ask code; sizes and cache counters the services already
+keep are read only when scraped (`_StateCollector`).
+
+The same stage observations also feed an opt-in per-request breakdown
+(`start_timings`), returned to the client in debug mode.
+"""
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Stage timings. Children are bound once here so the hot path is a dict
+# lookup plus Histogram.observe (about a microsecond), no label parsing.
+ASK_STAGES = ("retrieve", "embed_query", "vector_search", "lexical_search", "shard_fanout", "rerank",
+              "build_prompt", "upstream_first_token", "upstream", "total")
+INGEST_STAGES = ("save", "extract", "split", "parse_wait", "embed", "upsert", "total")
+
+_ask_seconds = Histogram(
+    "rag_ask_stage_seconds", "Time spent in each stage of /ask and /ask/stream.", ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+_ingest_seconds = Histogram(
+    "rag_ingest_stage_seconds", "Time spent in each stage of ingestion (per batch or parse task; total per document).",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+# per tenant shard: one observation per shard searched (vector + lexical); one series per tenant
+shard_search = Histogram(
+    "rag_shard_search_seconds", "Time to search one tenant's shard for a question.", ["tenant"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+# stage -> milliseconds for the current request, when debug timings were asked for
+_timings: ContextVar[Optional[dict]] = ContextVar("rag_timings", default=None)
+
+
+class _Stage:
+    """A bound histogram child that also adds to the current request's timing breakdown."""
+
+    __slots__ = ("name", "_child")
+
+    def __init__(self, name: str, child):
+        self.name = name
+        self._child = child
+
+    def observe(self, seconds: float) -> None:
+        self._child.observe(seconds)
+        timings = _timings.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + seconds * 1000
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_stage", "_started")
+
+    def __init__(self, stage: _Stage):
+        self._stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stage.observe(time.perf_counter() - self._started)
+
+
+ask_stage = {s: _Stage(s, _ask_seconds.labels(stage=s)) for s in ASK_STAGES}
+ingest_stage = {s: _Stage(s, _ingest_seconds.labels(stage=s)) for s in INGEST_STAGES}
+
+documents = Counter("rag_documents", "Document events.", ["event"])   # indexed, updated, duplicate, unchanged, failed, deleted
+chunks = Counter("rag_chunks", "Chunk events.", ["event"])            # embedded, deleted
+upstream_responses = Counter("rag_upstream_responses", "Responses from the chat completions API.", ["status"])
+upstream_tokens = Counter("rag_upstream_tokens", "Token usage reported by the chat completions API.", ["kind"])
+inflight = Gauge("rag_inflight_requests", "Requests being served.", ["route"])
+admission_wait = Histogram(
+    "rag_admission_wait_seconds", "Time spent queued for an admission pool (0 when admitted at once).", ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+admission_rejected = Counter("rag_admission_rejected", "Requests turned away because a queue was full.", ["pool"])
+
+
+def start_timings(into: Optional[dict] = None) -> dict:
+    """
+    Collects a per-stage breakdown (milliseconds) for the rest of the current context.
+
+    Each request runs in its own task, so calling this from an endpoint
+    covers that request only, including work it hands to `asyncio.to_thread`.
+    Reused worker threads must call `stop_timings` when done.
+
+    Parameters
+    ----------
+    into : dict, optional
+        An existing breakdown to continue, e.g. one started by the upload
+        request and finished by the ingestion job.
+
+    Returns
+    -------
+    dict
+        The breakdown, filled in as stages are observed.
+    """
+    timings = {} if into is None else into
+    _timings.set(timings)
+    return timings
+
+
+def stop_timings() -> None:
+    _timings.set(None)
+
+
+def current_timings() -> Optional[dict]:
+    return _timings.get()
+
+
+def rounded(timings: Optional[dict]) -> Optional[dict]:
+    return {k: round(v, 2) for k, v in timings.items()} if timings is not None else None
+
+
+def record_usage(usage: dict | None) -> None:
+    """Adds an OpenRouter `usage` object to the token counters."""
+    for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = (usage or {}).get(kind)
+        if isinstance(value, (int, float)) and value > 0:
+            upstream_tokens.labels(kind=kind.removesuffix("_tokens")).inc(value)
+
+
+class InflightMiddleware:
+    """Pure ASGI middleware counting in-flight HTTP requests per top-level route (streams included)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._gauges: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = scope["path"].strip("/").split("/", 1)[0] or "root"
+        if route not in ("ask", "files", "admin", "metrics"):
+            route = "other"
+        gauge = self._gauges.get(route)
+        if gauge is None:
+            gauge = self._gauges[route] = inflight.labels(route=route)
+        gauge.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gauge.dec()
+
+
+class _StateCollector:
+    """
+    Reads sizes and cache counters the services already keep, at scrape time.
+
+    Nothing is opened on their behalf: a store or cache that hasn't been
+    used yet is simply not reported.
+    """
+
+    def describe(self):
+        # the registry would otherwise call collect() on registration, mid-import of the services
+        return []
+
+    def collect(self):
+        from app.services import admission, answer_cache, indexer, jobs
+        from app.routes import ask
+
+        sizes = GaugeMetricFamily("rag_collection_chunks", "Chunks in the vector store, per tenant shard.", labels=["tenant"])
+        for tenant, store in list(indexer._stores.items()):
+            sizes.add_metric([tenant], store.count())
+        yield sizes
+        docs = GaugeMetricFamily("rag_collection_documents", "Documents in the catalog, per tenant shard.", labels=["tenant"])
+        for tenant, catalog in list(indexer._catalogs.items()):
+            docs.add_metric([tenant], catalog.count())
+        yield docs
+
+        active = GaugeMetricFamily("rag_admission_active", "Slots in use per admission pool.", labels=["pool"])
+        waiting = GaugeMetricFamily("rag_admission_queued", "Callers waiting per admission pool.", labels=["pool"])
+        for name, pool in list(admission.pools.items()):
+            active.add_metric([name], pool.active)
+            waiting.add_metric([name], pool.queued)
+        batcher = getattr(indexer._embeddings, "batcher", None)
+        if batcher is not None:
+            waiting.add_metric(["embed_query"], batcher.queued)
+        yield active
+        yield waiting
+
+        queued = GaugeMetricFamily("rag_ingest_jobs", "Ingestion jobs by status.", labels=["status"])
+        for status, n in jobs.counts().items():
+            queued.add_metric([status], n)
+        yield queued
+
+        hits = CounterMetricFamily("rag_cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("rag_cache_misses", "Cache misses.", labels=["cache"])
+        caches = {"retrieval": ask._retrieval_cache, "answer": answer_cache.cache}
+        emb = indexer._embeddings
+        if emb is not None:
+            caches["query_embedding"] = getattr(emb, "query_cache", None)
+        caches["embedding"] = indexer._embed_cache
+        for name, cache in caches.items():
+            if cache is not None:
+                hits.add_metric([name], cache.hits)
+                misses.add_metric([name], cache.misses)
+        yield hits
+        yield misses
+        saved = CounterMetricFamily("rag_answer_cache_saved_seconds", "Upstream seconds not spent thanks to answer cache hits.")
+        saved.add_metric([], answer_cache.cache.saved_seconds)
+        yield saved
+
+
+REGISTRY.register(_StateCollector())
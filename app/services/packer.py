@@ -0,0 +1,124 @@
+# app/services/packer.py
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Optional
+from app import config as cfg
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# shortest suffix/prefix match treated as splitter overlap rather than coincidence
+_MIN_OVERLAP = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate (~4 characters per token for English BPE vocabularies).
+
+    Good enough to keep prompts under a budget without loading a tokenizer.
+    """
+    return (len(text) + 3) // 4
+
+
+def merge_overlap(left: str, right: str, max_overlap: int) -> str:
+    """
+    Joins two adjacent chunks, dropping the text the splitter repeated in both.
+
+    Parameters
+    ----------
+    left, right : str
+        Consecutive chunks of the same document.
+    max_overlap : int
+        Longest overlap to look for (the splitter's chunk overlap).
+
+    Returns
+    -------
+    str
+        `left` followed by the part of `right` it doesn't already end with.
+    """
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, _MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def pack_context(docs: List[Document], budget_tokens: Optional[int] = None) -> List[str]:
+    """
+    Turns retrieved chunks into labelled context blocks that fit a token budget.
+
+    Chunks of the same document with consecutive `ord` values are merged
+    into one block with the splitter overlap removed. Blocks are kept in
+    the order of their best-ranked chunk and added until the budget is
+    spent; a block that doesn't fit is skipped in favour of smaller,
+    lower-ranked ones, and only a lone first block is truncated.
+
+    Parameters
+    ----------
+    docs : list[Document]
+        Retrieved chunks, best first.
+    budget_tokens : int, optional
+        Token budget for all blocks together. Defaults to CONTEXT_TOKEN_BUDGET.
+
+    Returns
+    -------
+    list[str]
+        Context blocks, each starting with a `[Source: ...]` label.
+    """
+    budget = cfg.CONTEXT_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+
+    # group adjacent chunks: (doc_id, ord) runs, remembering each run's best rank
+    by_doc: dict = {}
+    loose = []
+    for rank, d in enumerate(docs):
+        text = d.page_content.strip()
+        if not text:
+            continue
+        meta = d.metadata or {}
+        if "doc_id" in meta and "ord" in meta:
+            by_doc.setdefault(meta["doc_id"], []).append((meta["ord"], rank, text, meta))
+        else:
+            loose.append((rank, [(rank, text, meta)]))
+
+    runs = list(loose)
+    for parts in by_doc.values():
+        parts.sort(key=lambda p: p[0])
+        current = [parts[0]]
+        for part in parts[1:]:
+            if part[0] == current[-1][0] + 1:
+                current.append(part)
+            elif part[0] != current[-1][0]:
+                runs.append((min(p[1] for p in current), [(p[1], p[2], p[3]) for p in current]))
+                current = [part]
+        runs.append((min(p[1] for p in current), [(p[1], p[2], p[3]) for p in current]))
+    runs.sort(key=lambda r: r[0])
+
+    blocks: List[str] = []
+    used = 0
+    for _, run in runs:
+        text = run[0][1]
+        for _, nxt, _ in run[1:]:
+            text = merge_overlap(text, nxt, cfg.SPLIT_CHUNK_OVERLAP)
+        block = f"{_label([m for _, _, m in run])}\n{text}"
+        cost = estimate_tokens(block)
+        if used + cost > budget:
+            if not blocks and budget > 0:
+                blocks.append(block[: budget * 4])
+                used = budget
+            continue
+        blocks.append(block)
+        used += cost
+    return blocks
+
+
+#########* helpers
+
+def _label(metas: List[dict]) -> str:
+    meta = metas[0]
+    name = meta.get("filename") or meta.get("source") or "unknown"
+    pages = sorted({m["page"] + 1 for m in metas if isinstance(m.get("page"), int)})
+    if not pages:
+        return f"[Source: {name}]"
+    if len(pages) == 1:
+        return f"[Source: {name}, p. {pages[0]}]"
+    return f"[Source: {name}, pp. {pages[0]}-{pages[-1]}]"
@@ -0,0 +1,192 @@
+# app/services/profiling.py
+"""
+Production debugging aids: opt-in per-request timings and an in-process sampling profiler.
+
+The profiler samples the Python stacks of every thread in this process
+(event loop, ingest workers, `to_thread` workers, the query batcher) at
+a fixed interval and aggregates them in the "folded" format
+(`thread;outer;...;inner count` per line) read by flamegraph.pl,
+speedscope and inferno. Parse pool processes are not sampled.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Optional
+from fastapi import Request
+from app import config as cfg
+
+_TRUTHY = {"1", "true", "yes", "on"}
+
+# innermost frames of threads that are parked, not working ("runners.py", "run": a uvloop loop waiting in C)
+_IDLE = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+         ("queue.py", "get"), ("thread.py", "_worker"), ("runners.py", "run")}
+
+
+def wants_timings(request: Request) -> bool:
+    """True if the request asks for a timing breakdown (`X-Debug-Timings: 1` or `?debug=1`) and DEBUG_TIMINGS allows it."""
+    if not cfg.DEBUG_TIMINGS:
+        return False
+    flag = request.headers.get("x-debug-timings") or request.query_params.get("debug") or ""
+    return flag.strip().lower() in _TRUTHY
+
+
+class SamplingProfiler:
+    """
+    Samples all threads' stacks every `interval` seconds on a background thread.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between samples.
+    idle : bool, optional
+        Keep samples of threads parked in a wait (event loop select, idle
+        pool workers); dropped by default so the graph shows work.
+    """
+
+    def __init__(self, interval: float, idle: bool = False):
+        self.interval = interval
+        self.idle = idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: dict = {}
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def folded(self) -> str:
+        """The collected stacks in folded format, most frequent first."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.idle and self._is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE
+
+
+class Capture:
+    """A running profile that ends after `requests` completed requests or `seconds`, whichever comes first."""
+
+    def __init__(self, requests: Optional[int], seconds: float, interval: float, idle: bool = False):
+        self.requests = requests
+        self.seconds = seconds
+        self.completed = 0
+        self.profiler = SamplingProfiler(interval, idle)
+        self._done = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def request_finished(self) -> None:
+        self.completed += 1
+        if self.requests is not None and self.completed >= self.requests:
+            # requests may finish on another loop or thread than the one waiting in run()
+            self._loop.call_soon_threadsafe(self._done.set)
+
+    async def run(self) -> float:
+        """Samples until done; returns the seconds captured."""
+        self._loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.profiler.start()
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout=self.seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.profiler.stop()
+        return time.perf_counter() - started
+
+
+_active: Optional[Capture] = None
+
+
+class ProfileBusyError(RuntimeError):
+    pass
+
+
+async def capture(requests: Optional[int], seconds: Optional[float], interval_ms: Optional[float] = None,
+                  idle: bool = False) -> tuple[Capture, float]:
+    """
+    Profiles the next `requests` requests (admin requests excluded) or a `seconds` window.
+
+    Parameters
+    ----------
+    requests : int, optional
+        Stop after this many requests have completed.
+    seconds : float, optional
+        Stop after this long; capped at PROFILE_MAX_SECONDS, which is also
+        the limit when only `requests` is given.
+    interval_ms : float, optional
+        Sampling interval, PROFILE_INTERVAL_MS by default.
+    idle : bool, optional
+        Keep samples of parked threads.
+
+    Returns
+    -------
+    tuple[Capture, float]
+        The finished capture and the seconds it ran.
+
+    Raises
+    ------
+    ProfileBusyError
+        If another capture is running.
+    """
+    global _active
+    if _active is not None:
+        raise ProfileBusyError("A profile is already being captured")
+    window = min(seconds or cfg.PROFILE_MAX_SECONDS, cfg.PROFILE_MAX_SECONDS)
+    interval = max(interval_ms or cfg.PROFILE_INTERVAL_MS, 1.0) / 1000
+    current = _active = Capture(requests, window, interval, idle)
+    try:
+        return current, await current.run()
+    finally:
+        _active = None
+
+
+class RequestCounterMiddleware:
+    """Pure ASGI middleware telling a running capture when a (non-admin) request has completed."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _active is None or scope["type"] != "http" or scope["path"].startswith("/admin"):
+            return await self.app(scope, receive, send)
+        current = _active
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current.request_finished()
@@ -0,0 +1,243 @@
+# app/services/retrieval.py
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional, Sequence
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.services import indexer, metrics
+from app.services.lexical import rrf
+from app import config as cfg
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+_fanout_executor = None
+_shard_seconds: dict = {}     # tenant -> recent shard search times, for shard_stats()
+_shard_lock = threading.Lock()
+_MAX_LEXICAL_SCOPE = 900     # doc_ids pushed into the BM25 query
+
+def search(question: str, k: int, where: Optional[dict] = None,
+           tenants: Optional[Sequence[str]] = None) -> list[Document]:
+    """
+    Blocking retrieval: hybrid candidates, then MMR with near-duplicate suppression.
+
+    Dense search alone misses exact identifiers (part numbers, clause ids,
+    error codes); the lexical index catches those, and reciprocal rank
+    fusion merges both rankings without having to calibrate their scores.
+    The top k * MMR_FETCH_MULTIPLIER candidates, with their stored
+    embeddings, then go through maximal marginal relevance so overlapping
+    chunks and near-identical revisions don't fill the prompt with the same
+    text. With HYBRID_SEARCH off the candidates come from vector search only.
+
+    When the question spans several tenants, their shards are searched in
+    parallel (SHARD_FANOUT_WORKERS threads) with the same question
+    embedding, and each shard's candidates are merged by score before the
+    fusion: dense hits by cosine with the question, lexical hits by BM25
+    score (computed with each shard's own term statistics).
+
+    Parameters
+    ----------
+    question : str
+        The question to find context for.
+    k : int
+        Number of chunks to return.
+    where : dict, optional
+        Chroma-style metadata filter, evaluated inside the vector index and
+        applied to lexical hits as well; a `doc_id` `$in` filter also
+        restricts which postings BM25 scores.
+    tenants : sequence of str, optional
+        Tenants whose shards to search; DEFAULT_TENANT's by default.
+
+    Returns
+    -------
+    list[Document]
+        Up to k chunks, in selection order.
+    """
+    from langchain_core.documents import Document
+
+    shards = list(tenants or [cfg.DEFAULT_TENANT])
+    t = time.perf_counter()
+    query = np.asarray(indexer._emb().embed_query(question), dtype=np.float32)
+    metrics.ask_stage["embed_query"].observe(time.perf_counter() - t)
+    pool = max(k, k * cfg.MMR_FETCH_MULTIPLIER)
+    fetch_k = max(pool, k * cfg.HYBRID_FETCH_MULTIPLIER) if cfg.HYBRID_SEARCH else pool
+
+    if len(shards) == 1:
+        dense, lexical, found = _search_shard(shards[0], question, query, fetch_k, where)
+    else:
+        t = time.perf_counter()
+        results = list(_fanout_pool().map(lambda tenant: _search_shard(tenant, question, query, fetch_k, where), shards))
+        metrics.ask_stage["shard_fanout"].observe(time.perf_counter() - t)
+        dense, lexical, found = _merge(results, query, fetch_k)
+
+    if cfg.HYBRID_SEARCH:
+        ranked = rrf([dense, [cid for cid, _ in lexical]], pool, cfg.RRF_K)
+        ids = [cid for cid, _ in ranked]
+        relevance = np.array([score for _, score in ranked], dtype=np.float32)
+        if len(relevance):
+            relevance /= relevance.max()
+    else:
+        ids = dense[:pool]
+        relevance = None
+
+    if not ids:
+        return []
+    t = time.perf_counter()
+    emb = np.asarray([found[cid][2] for cid in ids], dtype=np.float32)
+    picked = mmr(query, emb, k, cfg.MMR_LAMBDA, cfg.DEDUP_COSINE, relevance)
+    metrics.ask_stage["rerank"].observe(time.perf_counter() - t)
+    return [Document(id=ids[i], page_content=found[ids[i]][0], metadata=found[ids[i]][1] or {}) for i in picked]
+
+
+def shard_stats() -> dict[str, dict]:
+    """Searches served and p50/p95 search milliseconds over the last SHARD_STATS_WINDOW searches, per tenant."""
+    with _shard_lock:
+        recent = {tenant: np.array(times) for tenant, times in _shard_seconds.items()}
+    return {
+        tenant: {
+            "searches": len(times),
+            "p50_ms": round(float(np.percentile(times, 50)) * 1000, 2),
+            "p95_ms": round(float(np.percentile(times, 95)) * 1000, 2),
+        }
+        for tenant, times in recent.items() if len(times)
+    }
+
+
+def shutdown() -> None:
+    """Stop the fan-out threads. Called from the app lifespan on shutdown."""
+    global _fanout_executor
+    if _fanout_executor is not None:
+        _fanout_executor.shutdown(wait=False, cancel_futures=True)
+        _fanout_executor = None
+
+
+def mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.7,
+        dedup_cosine: float = 1.0, relevance: Optional[np.ndarray] = None) -> list[int]:
+    """
+    Vectorized maximal marginal relevance over candidate embeddings.
+
+    Each step picks the candidate maximizing
+    `lambda * relevance - (1 - lambda) * max cosine to the already picked`,
+    keeping a running max-similarity vector so a step costs one
+    matrix-vector product. Candidates whose cosine to any picked chunk is
+    at least `dedup_cosine` are dropped as near-duplicates.
+
+    Parameters
+    ----------
+    query : np.ndarray
+        Query embedding, shape (d,).
+    candidates : np.ndarray
+        Candidate embeddings, shape (n, d), best-ranked first.
+    k : int
+        Number of candidates to pick.
+    lambda_mult : float, optional
+        1.0 ranks by relevance only, 0.0 by diversity only.
+    dedup_cosine : float, optional
+        Near-duplicate cutoff; values above 1 disable it.
+    relevance : np.ndarray, optional
+        Precomputed relevance per candidate (e.g. fused scores); defaults
+        to the cosine with the query.
+
+    Returns
+    -------
+    list[int]
+        Indices into `candidates`, in pick order.
+    """
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    cand = candidates / np.maximum(norms, 1e-12)
+    if relevance is None:
+        q = query / max(float(np.linalg.norm(query)), 1e-12)
+        relevance = cand @ q
+
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked: list[int] = []
+    while len(picked) < k and available.any():
+        penalty = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        score = lambda_mult * relevance - (1.0 - lambda_mult) * penalty
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        picked.append(best)
+        available[best] = False
+
+        sim = cand @ cand[best]
+        np.maximum(max_sim, sim, out=max_sim)
+        available &= max_sim < dedup_cosine
+    return picked
+
+
+#########* helpers
+
+def _search_shard(tenant: str, question: str, query: np.ndarray, fetch_k: int,
+                  where: Optional[dict]) -> tuple[list[str], list[tuple[str, float]], dict]:
+    """Dense ids best first, lexical (id, BM25 score) hits and id -> (text, metadata, embedding) of one shard."""
+    started = time.perf_counter()
+    store = indexer._db(tenant)
+    res = store.query(query, fetch_k, where)
+    found = {cid: (text, meta, emb) for cid, text, meta, emb in zip(res.ids, res.documents, res.metadatas, res.embeddings)}
+    dense = list(res.ids)
+    t_lexical = time.perf_counter()
+    metrics.ask_stage["vector_search"].observe(t_lexical - started)
+
+    lexical: list[tuple[str, float]] = []
+    if cfg.HYBRID_SEARCH:
+        lexical = indexer._lexical(tenant=tenant).search(question, fetch_k, doc_ids=_doc_scope(where))
+        missing = [cid for cid, _ in lexical if cid not in found]
+        if missing:
+            # fetching through the store also applies `where` to the lexical hits
+            got = store.get(ids=missing, where=where, embeddings=True)
+            for cid, text, meta, emb in zip(got.ids, got.documents, got.metadatas, got.embeddings):
+                found[cid] = (text, meta, emb)
+        lexical = [(cid, score) for cid, score in lexical if cid in found]
+        metrics.ask_stage["lexical_search"].observe(time.perf_counter() - t_lexical)
+
+    took = time.perf_counter() - started
+    metrics.shard_search.labels(tenant=tenant).observe(took)
+    with _shard_lock:
+        times = _shard_seconds.get(tenant)
+        if times is None:
+            times = _shard_seconds[tenant] = deque(maxlen=cfg.SHARD_STATS_WINDOW)
+        times.append(took)
+    return dense, lexical, found
+
+
+def _merge(results: list, query: np.ndarray, fetch_k: int) -> tuple[list[str], list[tuple[str, float]], dict]:
+    """Top fetch_k dense ids (by cosine) and lexical hits (by score) across shard results."""
+    found: dict = {}
+    for _, _, shard_found in results:
+        found.update(shard_found)
+    dense = [cid for shard_dense, _, _ in results for cid in shard_dense]
+    if dense:
+        emb = np.asarray([found[cid][2] for cid in dense], dtype=np.float32)
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        order = np.argsort(-(emb @ query), kind="stable")[:fetch_k]
+        dense = [dense[i] for i in order]
+    lexical = sorted((hit for _, shard_lexical, _ in results for hit in shard_lexical), key=lambda h: -h[1])
+    return dense, lexical[:fetch_k], found
+
+
+def _fanout_pool() -> ThreadPoolExecutor:
+    global _fanout_executor
+    if _fanout_executor is None:
+        _fanout_executor = ThreadPoolExecutor(max_workers=max(1, cfg.SHARD_FANOUT_WORKERS), thread_name_prefix="shard")
+    return _fanout_executor
+
+
+def _doc_scope(where: Optional[dict]) -> Optional[list[str]]:
+    """The doc_ids a `{"doc_id": {"$in": [...]}}` filter (alone or in a top-level `$and`) allows; None if unscoped."""
+    if not where:
+        return None
+    for cond in where.get("$and", [where]):
+        scope = cond.get("doc_id")
+        if isinstance(scope, dict) and isinstance(scope.get("$in"), list):
+            # past SQLite's bound-parameter limit the store-side filter alone does the job
+            return scope["$in"] if len(scope["$in"]) <= _MAX_LEXICAL_SCOPE else None
+        if isinstance(scope, str):
+            return [scope]
+    return None
@@ -0,0 +1,349 @@
+# app/services/snapshot.py
+"""
+Index snapshots: export a tenant's shard to a directory, import it elsewhere.
+
+A replica loads a snapshot in a few bulk writes instead of re-embedding
+every original under DATA_DIR, and a snapshot is a consistent backup
+that can be taken while the service runs:
+
+    python -m app.services.snapshot export /backups/2025-06-01 [--tenant acme] [--float16]
+    python -m app.services.snapshot import /backups/2025-06-01 [--tenant acme]
+
+or `POST /admin/snapshot/export` / `POST /admin/snapshot/import` with a
+name under SNAPSHOT_DIR. Layout of a snapshot directory:
+
+* `manifest.json` – format version, embedding model, chunk settings,
+  row count, dimension, dtype and the sha256 of every other file
+* `embeddings.f32` / `embeddings.f16` – one contiguous row-major matrix
+  (rows, dim), memory-mapped on import
+* `chunks/<column>.bin` + `chunks/<column>.idx` – the `id`, `document`
+  and `metadata` (JSON) columns: concatenated UTF-8 values and the int64
+  end offset of each row
+* `catalog.json` – the tenant's catalog: documents and their chunk rows
+
+The BM25 index is rebuilt from the chunk texts on import (tokenizing is
+cheap next to embedding). Uploaded originals are not included.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+from app.services import admission, answer_cache, indexer, tenants
+from app import config as cfg
+
+log = logging.getLogger(__name__)
+
+FORMAT = 1
+_COLUMNS = ("id", "document", "metadata")
+_DTYPES = {"float32": "f32", "float16": "f16"}
+
+
+class SnapshotError(RuntimeError):
+    """The snapshot is unusable here, or could not be taken consistently."""
+
+
+def export(path: str, tenant: Optional[str] = None, dtype: str = "float32",
+           batch: Optional[int] = None) -> dict:
+    """
+    Writes a consistent snapshot of a tenant's shard to the directory `path`.
+
+    Only documents recorded in the catalog when the export starts are
+    included. Deletes, updates and resets of the tenant's documents wait
+    for the export (the shard write lock, see
+    `indexer._shard_write_lock`); uploads keep going and are not
+    recorded until it is done. The snapshot is written next to `path` and moved
+    into place once complete, so `path` never holds a partial snapshot.
+
+    Parameters
+    ----------
+    path : str
+        Target directory; an existing snapshot there is replaced.
+    tenant : str, optional
+        Whose shard to export (DEFAULT_TENANT if None).
+    dtype : str, optional
+        "float32" or "float16" (half the size, ~3 significant digits).
+    batch : int, optional
+        Rows read per store call, SNAPSHOT_BATCH by default.
+
+    Returns
+    -------
+    dict
+        The manifest.
+
+    Raises
+    ------
+    ValueError
+        If `dtype` is not supported.
+    """
+    if dtype not in _DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype: {dtype!r} (float32 or float16)")
+    tenant = tenants.normalize(tenant)
+    tmp = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        with indexer._shard_write_lock(tenant):
+            manifest = _write(tmp, tenant, dtype, batch or cfg.SNAPSHOT_BATCH)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _replace(tmp, path)
+    log.info("exported %d chunks of %s to %s", manifest["chunks"], tenant, path)
+    return manifest
+
+
+def load(path: str, tenant: Optional[str] = None, batch: Optional[int] = None) -> dict:
+    """
+    Replaces a tenant's shard with the snapshot in `path`.
+
+    The manifest and file checksums are checked before anything is
+    touched. The tenant's vectors, BM25 index and catalog are then reset
+    and refilled in `batch`-row bulk writes, holding the "vector_write"
+    admission slot so ingestion waits. Meant for a replica that is not
+    serving yet, or a maintenance window: searches during the load see a
+    partial shard.
+
+    Parameters
+    ----------
+    path : str
+        Snapshot directory, as written by `export`.
+    tenant : str, optional
+        Whose shard to replace (DEFAULT_TENANT if None); need not be the
+        tenant the snapshot was taken from.
+    batch : int, optional
+        Rows per bulk write, SNAPSHOT_BATCH by default.
+
+    Returns
+    -------
+    dict
+        `{"tenant", "chunks", "documents", "seconds"}`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If there is no snapshot in `path`.
+    SnapshotError
+        If the snapshot was built with another EMBED_MODEL or other
+        SPLIT_CHUNK_SIZE/SPLIT_CHUNK_OVERLAP, has an unknown format or
+        fails its checksums.
+    """
+    started = time.perf_counter()
+    tenant = tenants.normalize(tenant)
+    manifest = read_manifest(path)
+    _verify(path, manifest)
+    batch = batch or cfg.SNAPSHOT_BATCH
+    rows, dim = manifest["chunks"], manifest["dim"]
+    emb = (np.memmap(os.path.join(path, manifest["embeddings"]), dtype=np.dtype(manifest["dtype"]),
+                     mode="r", shape=(rows, dim)) if rows else np.zeros((0, dim), dtype=np.float32))
+    columns = {name: _Column(os.path.join(path, "chunks", name)) for name in _COLUMNS}
+    with open(os.path.join(path, "catalog.json"), encoding="utf-8") as f:
+        catalog_data = json.load(f)
+
+    store = indexer._db(tenant)
+    lexical = indexer._lexical(backfill=False, tenant=tenant)
+    catalog = indexer._catalog(backfill=False, tenant=tenant)
+    with indexer._shard_write_lock(tenant), admission.pool("vector_write").slot(admission.BULK, block=True):
+        catalog.reset()
+        lexical.reset()
+        store.reset()
+        indexer._bump_generation()
+        for start in range(0, rows, batch):
+            stop = min(start + batch, rows)
+            ids = columns["id"].slice(start, stop)
+            texts = columns["document"].slice(start, stop)
+            metas = [json.loads(m) for m in columns["metadata"].slice(start, stop)]
+            store.add(ids, texts, metas, np.asarray(emb[start:stop], dtype=np.float32))
+            lexical.add((cid, meta.get("doc_id", ""), text) for cid, text, meta in zip(ids, texts, metas))
+        for doc in catalog_data["documents"]:
+            catalog.record(doc, [tuple(c) for c in catalog_data["chunks"].get(doc["doc_id"], [])])
+        indexer._bump_generation()
+    answer_cache.cache.clear()
+
+    took = round(time.perf_counter() - started, 3)
+    log.info("imported %d chunks into %s from %s in %.3f s", rows, tenant, path, took)
+    return {"tenant": tenant, "chunks": rows, "documents": len(catalog_data["documents"]), "seconds": took}
+
+
+def read_manifest(path: str) -> dict:
+    """
+    The manifest of the snapshot in `path`, checked against this deployment's EMBED_MODEL and chunking.
+
+    Chunk settings must match too: `update_file` diffs a new version
+    against the stored chunks by text hash, so chunks split differently
+    would all count as changed, and searches would mix chunk sizes.
+    """
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No snapshot in {path}") from None
+    if manifest.get("format") != FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format')!r} (expected {FORMAT})")
+    if manifest.get("embed_model") != cfg.EMBED_MODEL:
+        raise SnapshotError(
+            f"Snapshot was built with EMBED_MODEL={manifest.get('embed_model')!r}, "
+            f"this deployment uses {cfg.EMBED_MODEL!r}; its vectors can't be searched with this model"
+        )
+    chunking = (manifest.get("split_chunk_size"), manifest.get("split_chunk_overlap"))
+    if chunking != (cfg.SPLIT_CHUNK_SIZE, cfg.SPLIT_CHUNK_OVERLAP):
+        raise SnapshotError(
+            f"Snapshot was split with SPLIT_CHUNK_SIZE/SPLIT_CHUNK_OVERLAP={chunking[0]}/{chunking[1]}, "
+            f"this deployment uses {cfg.SPLIT_CHUNK_SIZE}/{cfg.SPLIT_CHUNK_OVERLAP}; re-export it with matching settings"
+        )
+    return manifest
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("command", choices=["export", "import"])
+    p.add_argument("path", help="snapshot directory")
+    p.add_argument("--tenant", default=None, help="shard to export or replace (DEFAULT_TENANT by default)")
+    p.add_argument("--float16", action="store_true", help="export: store embeddings as float16")
+    p.add_argument("--batch", type=int, default=None, help="rows per bulk read/write (SNAPSHOT_BATCH)")
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    try:
+        if args.command == "export":
+            out = export(args.path, args.tenant, "float16" if args.float16 else "float32", args.batch)
+        else:
+            out = load(args.path, args.tenant, args.batch)
+    except (FileNotFoundError, SnapshotError, tenants.InvalidTenantError) as e:
+        sys.exit(f"error: {e}")
+    finally:
+        indexer.shutdown()
+    print(json.dumps(out, indent=2))
+
+
+#########* helpers
+
+class _Column:
+    """A string column of a snapshot: UTF-8 values back to back, plus int64 end offsets."""
+
+    def __init__(self, base: str):
+        self._data = base + ".bin"
+        self._ends = np.fromfile(base + ".idx", dtype=np.int64)
+        self._buf = np.memmap(self._data, dtype=np.uint8, mode="r") if os.path.getsize(self._data) else b""
+
+    def slice(self, start: int, stop: int) -> List[str]:
+        ends = self._ends[start:stop]
+        begin = int(self._ends[start - 1]) if start else 0
+        raw = bytes(self._buf[begin:int(ends[-1])]) if len(ends) else b""
+        out, pos = [], 0
+        for end in ends - begin:
+            out.append(raw[pos:end].decode("utf-8"))
+            pos = int(end)
+        return out
+
+
+def _write(path: str, tenant: str, dtype: str, batch: int) -> dict:
+    """Writes the snapshot files of `tenant` into a fresh directory `path` and returns the manifest."""
+    os.makedirs(os.path.join(path, "chunks"))
+    store, catalog = indexer._db(tenant), indexer._catalog(tenant=tenant)
+
+    documents: List[dict] = []
+    cursor = None
+    while True:
+        page, cursor = catalog.list(1000, cursor)
+        documents.extend(page)
+        if cursor is None:
+            break
+    documents.reverse()    # oldest first, so the imported catalog lists in the same order
+    chunks: Dict[str, list] = {d["doc_id"]: [list(c) for c in catalog.chunks(d["doc_id"])] for d in documents}
+    wanted = [c[0] for d in documents for c in chunks[d["doc_id"]]]
+
+    emb_name = f"embeddings.{_DTYPES[dtype]}"
+    files = {name: (open(os.path.join(path, "chunks", f"{name}.bin"), "wb"),
+                    open(os.path.join(path, "chunks", f"{name}.idx"), "wb")) for name in _COLUMNS}
+    ends = dict.fromkeys(_COLUMNS, 0)
+    rows, dim = 0, None
+    try:
+        with open(os.path.join(path, emb_name), "wb") as emb_file:
+            for start in range(0, len(wanted), batch):
+                got = store.get(ids=wanted[start:start + batch], embeddings=True)
+                if not got.ids:
+                    continue
+                vecs = np.ascontiguousarray(got.embeddings, dtype=dtype)
+                dim = dim or vecs.shape[1]
+                vecs.tofile(emb_file)
+                values = {"id": got.ids, "document": got.documents,
+                          "metadata": [json.dumps(m, ensure_ascii=False) for m in got.metadatas]}
+                for name, column in values.items():
+                    data, idx = files[name]
+                    offsets = []
+                    for value in column:
+                        raw = value.encode("utf-8")
+                        data.write(raw)
+                        ends[name] += len(raw)
+                        offsets.append(ends[name])
+                    np.asarray(offsets, dtype=np.int64).tofile(idx)
+                rows += len(got.ids)
+    finally:
+        for data, idx in files.values():
+            data.close()
+            idx.close()
+    if rows < len(wanted):
+        log.warning("%s: %d chunks listed in the catalog are missing from the vector store", tenant, len(wanted) - rows)
+
+    with open(os.path.join(path, "catalog.json"), "w", encoding="utf-8") as f:
+        json.dump({"documents": documents, "chunks": chunks}, f, ensure_ascii=False)
+
+    manifest = {
+        "format": FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "tenant": tenant,
+        "backend": store.backend,
+        "embed_model": cfg.EMBED_MODEL,
+        "split_chunk_size": cfg.SPLIT_CHUNK_SIZE,
+        "split_chunk_overlap": cfg.SPLIT_CHUNK_OVERLAP,
+        "chunks": rows,
+        "documents": len(documents),
+        "dim": dim or 0,
+        "dtype": dtype,
+        "embeddings": emb_name,
+        "files": {
+            name: _sha256(os.path.join(path, name))
+            for name in [emb_name, "catalog.json", *(f"chunks/{c}.{ext}" for c in _COLUMNS for ext in ("bin", "idx"))]
+        },
+    }
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _verify(path: str, manifest: dict) -> None:
+    for name, digest in manifest["files"].items():
+        target = os.path.join(path, name)
+        if not os.path.isfile(target) or _sha256(target) != digest:
+            raise SnapshotError(f"Snapshot file {name} is missing or corrupt")
+
+
+def _sha256(path: str, block: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for part in iter(lambda: f.read(block), b""):
+            h.update(part)
+    return h.hexdigest()
+
+
+def _replace(tmp: str, path: str) -> None:
+    """Moves the finished snapshot `tmp` to `path`, removing what was there only once `tmp` is complete."""
+    old = None
+    if os.path.exists(path):
+        old = f"{path.rstrip(os.sep)}.old-{os.getpid()}"
+        os.replace(path, old)
+    os.replace(tmp, path)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# app/services/tenants.py
+"""
+Tenant ids and where each tenant's shard lives.
+
+Every tenant has its own vector collection (Chroma) or directory (numpy
+backend), BM25 index and catalog, so a search only touches that
+tenant's chunks and a reset or delete stays inside it. DEFAULT_TENANT
+keeps the paths configured before tenants existed, so single-tenant
+deployments find their data where it was.
+"""
+from __future__ import annotations
+
+import os
+import re
+import glob
+from typing import List, Optional
+from fastapi import Header, HTTPException, status
+from app import config as cfg
+
+# also keeps "<collection>-<tenant>" a valid Chroma collection name (alphanumeric at both ends)
+_ID = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,46}[a-z0-9])?$")
+
+
+class InvalidTenantError(ValueError):
+    pass
+
+
+def normalize(tenant: Optional[str]) -> str:
+    """The tenant id to use; None or blank means DEFAULT_TENANT."""
+    tenant = (tenant or "").strip().lower() or cfg.DEFAULT_TENANT
+    if not _ID.match(tenant):
+        raise InvalidTenantError("Invalid tenant id (1-48 characters: a-z, 0-9, '-', '_')")
+    return tenant
+
+
+def is_default(tenant: Optional[str]) -> bool:
+    return normalize(tenant) == cfg.DEFAULT_TENANT
+
+
+def collection_name(tenant: Optional[str]) -> str:
+    return cfg.CHROMA_COLLECTION if is_default(tenant) else f"{cfg.CHROMA_COLLECTION}-{normalize(tenant)}"
+
+
+def vector_dir(tenant: Optional[str]) -> str:
+    return cfg.VECTOR_DIR if is_default(tenant) else f"{cfg.VECTOR_DIR}-{normalize(tenant)}"
+
+
+def sqlite_path(path: str, tenant: Optional[str]) -> str:
+    """`lexical.sqlite` -> `lexical-<tenant>.sqlite`; the default tenant keeps `path`."""
+    if is_default(tenant):
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{normalize(tenant)}{ext}"
+
+
+def discover() -> List[str]:
+    """Tenants with a catalog on disk (the default tenant always), sorted."""
+    root, ext = os.path.splitext(cfg.CATALOG_PATH)
+    found = {cfg.DEFAULT_TENANT}
+    for path in glob.glob(f"{glob.escape(root)}-*{ext}"):
+        name = path[len(root) + 1:len(path) - len(ext)]
+        if _ID.match(name):
+            found.add(name)
+    return sorted(found)
+
+
+def from_header(x_tenant_id: Optional[str] = Header(None)) -> str:
+    """FastAPI dependency: the tenant of a request (`X-Tenant-ID`, DEFAULT_TENANT if absent)."""
+    try:
+        return normalize(x_tenant_id)
+    except InvalidTenantError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def many_from_header(x_tenant_id: Optional[str] = Header(None)) -> List[str]:
+    """FastAPI dependency for searches: `X-Tenant-ID: a,b` searches several tenants' shards at once."""
+    try:
+        ids = list(dict.fromkeys(normalize(t) for t in (x_tenant_id or "").split(",")))
+    except InvalidTenantError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if len(ids) > cfg.MAX_TENANTS_PER_QUERY:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {cfg.MAX_TENANTS_PER_QUERY} tenants per question")
+    return ids
@@ -0,0 +1,128 @@
+# app/services/upstream.py
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+from typing import Optional
+import httpx
+from app.services import metrics
+from app import config as cfg
+
+log = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_closing: set = set()    # aclose tasks of replaced clients, referenced until done
+
+
+def _build() -> httpx.AsyncClient:
+    http2 = cfg.HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401  (optional: pip install "httpx[http2]")
+        except ImportError:
+            log.warning("HTTP2=true but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=cfg.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=cfg.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=cfg.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=cfg.HTTP_CONNECT_TIMEOUT,
+            read=cfg.HTTP_READ_TIMEOUT,
+            write=cfg.HTTP_WRITE_TIMEOUT,
+            pool=cfg.HTTP_POOL_TIMEOUT,
+        ),
+    )
+
+
+async def startup() -> None:
+    """Open the shared client. Called from the app lifespan."""
+    client()
+
+
+async def shutdown() -> None:
+    """Close the shared client and its pooled connections. Called from the app lifespan."""
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+
+def client() -> httpx.AsyncClient:
+    """
+    The application-wide pooled client for the LLM upstream.
+
+    Connections are kept alive and reused across requests. The client is
+    bound to the event loop it was created on; if called from another loop
+    (e.g. a TestClient used without its context manager) a fresh client is
+    created for that loop and the previous one is closed, so its pooled
+    connections don't leak.
+
+    Returns
+    -------
+    httpx.AsyncClient
+        The shared client.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        old, old_loop = _client, _client_loop
+        _client, _client_loop = _build(), loop
+        if old is not None:
+            _discard(old, old_loop, loop)
+    return _client
+
+
+def _discard(old: httpx.AsyncClient, old_loop: Optional[asyncio.AbstractEventLoop],
+             loop: asyncio.AbstractEventLoop) -> None:
+    """Closes a client left behind by another loop: on that loop if it still runs, else on this one."""
+    if old_loop is not None and old_loop.is_running():
+        asyncio.run_coroutine_threadsafe(_aclose(old), old_loop)
+        return
+    task = loop.create_task(_aclose(old))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+async def _aclose(old: httpx.AsyncClient) -> None:
+    try:
+        await old.aclose()
+    except Exception as e:    # its connections belonged to a loop that is gone
+        log.debug("Closing a replaced upstream client failed: %s", e)
+
+
+def timing_extensions() -> dict:
+    """
+    httpx request extensions adding upstream connect time and time to first byte to the request's timings.
+
+    Uses httpcore's `trace` hook; empty (no tracing cost) unless the
+    current request collects a timing breakdown. Connect time is 0 when a
+    pooled connection was reused.
+    """
+    timings = metrics.current_timings()
+    if timings is None:
+        return {}
+    started = time.perf_counter()
+    connect = {"started": None, "seconds": 0.0}
+
+    async def trace(event: str, info: dict) -> None:
+        now = time.perf_counter()
+        if event == "connection.connect_tcp.started":
+            connect["started"] = now
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete") and connect["started"]:
+            connect["seconds"] = now - connect["started"]
+        elif event.endswith(".receive_response_headers.complete"):
+            timings["upstream_connect"] = connect["seconds"] * 1000
+            timings["upstream_first_byte"] = (now - started) * 1000
+
+    return {"trace": trace}
+
+
+def retry_after(response: httpx.Response) -> str:
+    """Retry-After to pass on for an upstream 429: the upstream's own, else UPSTREAM_RETRY_AFTER seconds."""
+    return response.headers.get("retry-after") or str(cfg.UPSTREAM_RETRY_AFTER)
@@ -0,0 +1,733 @@
+# app/services/vectorstore.py
+from __future__ import annotations
+
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, List, NamedTuple, Optional, Sequence
+import numpy as np
+from app.services import tenants
+from app import config as cfg
+
+
+class Records(NamedTuple):
+    """Rows returned by a vector store, aligned by position (best first for queries)."""
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[dict]
+    embeddings: Optional[np.ndarray]   # (n, d) float32, None unless requested
+
+
+_EMPTY = Records([], [], [], None)
+_NO_HITS = Records([], [], [], np.zeros((0, 0), dtype=np.float32))
+
+
+class VectorStore(ABC):
+    """
+    What the indexer and retrieval need from a vector store.
+
+    Embeddings are computed by the caller; stores only persist and search
+    them. `where` filters use Chroma's syntax (equality, $eq/$ne/$in/$nin,
+    $gt/$gte/$lt/$lte, $and/$or) so callers don't care which backend runs.
+    """
+
+    backend = ""
+
+    @abstractmethod
+    def add(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[dict],
+            embeddings: Sequence[Sequence[float]]) -> None:
+        """Upserts rows; an existing id is replaced."""
+
+    @abstractmethod
+    def query(self, embedding: Sequence[float], k: int, where: Optional[dict] = None) -> Records:
+        """Top-k rows by cosine similarity, with their embeddings."""
+
+    @abstractmethod
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None,
+            limit: Optional[int] = None, offset: int = 0, embeddings: bool = False) -> Records:
+        """Rows by id and/or filter, in storage order."""
+
+    @abstractmethod
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[dict]) -> None:
+        """Merges the given keys into the metadata of existing rows; text and vectors are untouched."""
+
+    @abstractmethod
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None) -> None:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Removes every row, leaving an empty, usable store."""
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, "count": self.count()}
+
+    @abstractmethod
+    def rebuild(self, batch: int = 4096) -> dict:
+        """
+        Rewrites the index without dead entries and with the configured index parameters.
+
+        Reads keep being served while it runs. Returns backend-specific details.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+def open_store(backend: Optional[str] = None, tenant: Optional[str] = None) -> VectorStore:
+    """
+    Opens the configured vector store.
+
+    Parameters
+    ----------
+    backend : str, optional
+        "chroma" or "numpy"; defaults to VECTOR_BACKEND.
+    tenant : str, optional
+        Whose shard to open: a collection of its own in CHROMA_DIR, or a
+        directory next to VECTOR_DIR. Defaults to DEFAULT_TENANT.
+    """
+    backend = (backend or cfg.VECTOR_BACKEND).lower()
+    if backend == "chroma":
+        return ChromaStore(cfg.CHROMA_DIR, tenants.collection_name(tenant))
+    if backend == "numpy":
+        return NumpyStore(tenants.vector_dir(tenant), ivf_lists=cfg.IVF_LISTS, nprobe=cfg.IVF_NPROBE)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend!r}")
+
+
+class ChromaStore(VectorStore):
+    """
+    Persistent Chroma collection (SQLite + HNSW), used through its public API only.
+
+    New collections get the HNSW parameters from HNSW_M,
+    HNSW_CONSTRUCTION_EF and HNSW_SEARCH_EF (collection metadata).
+    Chroma's HNSW index keeps deleted entries around, so after heavy
+    delete/re-upload churn `rebuild` copies the live rows into a fresh
+    collection and swaps it in under the same name.
+    """
+
+    backend = "chroma"
+
+    def __init__(self, path: str, collection: str):
+        import chromadb
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.name = collection
+        self._client = chromadb.PersistentClient(path=path)
+        self._write_lock = threading.Lock()
+        self._dirty: Optional[set] = None         # ids written while a rebuild copies, None otherwise
+        self._dirty_where: List[dict] = []
+        self._coll = self._open()
+
+    def add(self, ids, documents, metadatas, embeddings) -> None:
+        if len(ids):
+            with self._write_lock:
+                self._touch(ids)
+                self._on_coll(lambda c: c.upsert(
+                    ids=list(ids),
+                    documents=list(documents),
+                    metadatas=list(metadatas),
+                    embeddings=np.asarray(embeddings, dtype=np.float32),
+                ))
+
+    def query(self, embedding, k, where=None) -> Records:
+        if k <= 0:
+            return _NO_HITS
+        res = self._on_coll(lambda c: c.query(
+            query_embeddings=[np.asarray(embedding, dtype=np.float32)],
+            n_results=k,
+            where=where or None,
+            include=["documents", "metadatas", "embeddings"],
+        ))
+        return Records(
+            list(res["ids"][0]),
+            list(res["documents"][0]),
+            [m or {} for m in res["metadatas"][0]],
+            _matrix(res["embeddings"][0]),
+        )
+
+    def get(self, ids=None, where=None, limit=None, offset=0, embeddings=False) -> Records:
+        if ids is not None and not len(ids):
+            return _NO_HITS if embeddings else _EMPTY
+        include = ["documents", "metadatas"] + (["embeddings"] if embeddings else [])
+        res = self._on_coll(lambda c: c.get(
+            ids=list(ids) if ids is not None else None,
+            where=where or None,
+            limit=limit,
+            offset=offset or None,
+            include=include,
+        ))
+        return Records(
+            list(res["ids"]),
+            list(res["documents"]),
+            [m or {} for m in res["metadatas"]],
+            _matrix(res["embeddings"]) if embeddings else None,
+        )
+
+    def update_metadata(self, ids, metadatas) -> None:
+        if len(ids):
+            with self._write_lock:
+                self._touch(ids)
+                self._on_coll(lambda c: c.update(ids=list(ids), metadatas=list(metadatas)))
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._write_lock:
+            if ids is not None:
+                if len(ids):
+                    self._touch(ids)
+                    self._on_coll(lambda c: c.delete(ids=list(ids)))
+            elif where:
+                if self._dirty is not None:
+                    self._dirty_where.append(where)
+                self._on_coll(lambda c: c.delete(where=where))
+
+    def count(self) -> int:
+        return self._on_coll(lambda c: c.count())
+
+    def reset(self) -> None:
+        with self._write_lock:
+            if self._dirty is not None:
+                raise RuntimeError(f"Collection {self.name} is being rebuilt")
+            self._client.delete_collection(self.name)
+            self._coll = self._open()
+
+    def rebuild(self, batch: int = 4096) -> dict:
+        """
+        Copies the live rows into `<name>.rebuild` and swaps it in as `<name>`.
+
+        The copy runs while reads and writes go on against the current
+        collection; ids written meanwhile are recorded and re-copied
+        (or deleted) under the write lock just before the swap, so writers
+        only wait for that catch-up. The swap renames the current
+        collection to `<name>.old`, the new one to `<name>`, then drops
+        the old one; `_open` finishes or rolls back a swap interrupted by a
+        crash. Tenant ids can't contain ".", so these names never collide
+        with another tenant's collection.
+
+        Other processes on the same CHROMA_DIR (uvicorn workers without
+        the index service) hold a handle to the dropped collection; they
+        re-resolve it by name on their next call (`_on_coll`). Their writes
+        made while the copy runs are not tracked here and may be lost, so
+        rebuild while they are idle, or run a single index service.
+        """
+        fresh, stale = f"{self.name}.rebuild", f"{self.name}.old"
+        with self._write_lock:
+            if self._dirty is not None:
+                raise RuntimeError(f"Collection {self.name} is already being rebuilt")
+            self._dirty, self._dirty_where = set(), []
+            old = self._coll
+        try:
+            if fresh in self._collection_names():
+                self._client.delete_collection(fresh)
+            new = self._client.create_collection(fresh, embedding_function=None, metadata=_hnsw_metadata(old.metadata))
+            ids = list(old.get(include=[])["ids"])
+            for i in range(0, len(ids), batch):
+                self._copy(old, new, ids[i:i + batch])
+            with self._write_lock:
+                for where in self._dirty_where:
+                    new.delete(where=where)
+                dirty = list(self._dirty)
+                for i in range(0, len(dirty), batch):
+                    self._copy(old, new, dirty[i:i + batch])
+                old.modify(name=stale)
+                new.modify(name=self.name)
+                self._coll = new
+                self._dirty = None
+        except BaseException:
+            with self._write_lock:
+                self._dirty = None
+            if self._coll is old and fresh in self._collection_names():
+                self._client.delete_collection(fresh)
+            raise
+        self._client.delete_collection(stale)
+        return {"collection": self.name, "copied": len(ids), "caught_up": len(dirty), "hnsw": _hnsw_params(new.metadata)}
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "collection": self.name,
+            "count": self.count(),
+            "hnsw": _hnsw_params(self._coll.metadata),
+            "bytes": _dir_bytes(self.path),    # the whole CHROMA_DIR, every collection in it
+        }
+
+    #########* helpers
+
+    def _open(self):
+        """The collection, created with the configured HNSW parameters if new; finishes an interrupted swap first."""
+        names = self._collection_names()
+        stale = f"{self.name}.old"
+        if stale in names:
+            if self.name in names:
+                self._client.delete_collection(stale)                  # the swap completed
+            else:
+                self._client.get_collection(stale).modify(name=self.name)   # roll back
+                names.add(self.name)
+        if f"{self.name}.rebuild" in names:
+            self._client.delete_collection(f"{self.name}.rebuild")
+        if self.name in names:
+            return self._client.get_collection(self.name, embedding_function=None)
+        return self._client.create_collection(self.name, embedding_function=None, metadata=_hnsw_metadata())
+
+    def _on_coll(self, op):
+        """`op(collection)`, retried once on the collection now named `self.name` if ours was dropped by another process's rebuild."""
+        coll = self._coll
+        try:
+            return op(coll)
+        except Exception as e:
+            if not _collection_missing(e):
+                raise
+        if self._coll is coll:
+            self._coll = self._client.get_collection(self.name, embedding_function=None)
+        return op(self._coll)
+
+    def _collection_names(self) -> set:
+        # Collection objects on chromadb < 0.6 and >= 1.0, plain names in between
+        return {getattr(c, "name", c) for c in self._client.list_collections()}
+
+    def _touch(self, ids) -> None:
+        """Caller holds the write lock."""
+        if self._dirty is not None:
+            self._dirty.update(ids)
+
+    @staticmethod
+    def _copy(old, new, ids: List[str]) -> None:
+        """Makes `ids` in `new` match `old`: copied if present there, deleted if not."""
+        got = old.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+        if len(got["ids"]):
+            new.upsert(ids=list(got["ids"]), documents=list(got["documents"]),
+                       metadatas=[m or None for m in got["metadatas"]], embeddings=_matrix(got["embeddings"]))
+        gone = set(ids) - set(got["ids"])
+        if gone:
+            new.delete(ids=list(gone))
+
+
+class NumpyStore(VectorStore):
+    """
+    In-process vector store: a memory-mapped float32 matrix plus a SQLite sidecar.
+
+    Normalized embeddings live in `vectors.f32` (row-major, grown by
+    doubling), ids, texts and metadata in `meta.sqlite`, keyed by row.
+    Search is an exact matrix-vector product over all live rows (one BLAS
+    call), or, once `ivf_lists` is set and the store is big enough, over
+    the rows of the `nprobe` closest IVF partitions (spherical k-means).
+    Deleted rows are tombstoned and reclaimed by `compact()`, which runs
+    automatically once they outnumber the live ones.
+    """
+
+    backend = "numpy"
+    _MASKS = 32   # cached `where` masks
+
+    def __init__(self, path: str, ivf_lists: int = 0, nprobe: int = 8):
+        self.path = path
+        self.ivf_lists = max(0, ivf_lists)
+        self.nprobe = max(1, nprobe)
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._vec_path = os.path.join(path, "vectors.f32")
+        self._centroid_path = os.path.join(path, "centroids.npy")
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite"), check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL,
+                document TEXT NOT NULL, metadata TEXT NOT NULL, list INTEGER NOT NULL DEFAULT -1);
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._conn.commit()
+        self._load()
+
+    def add(self, ids, documents, metadatas, embeddings) -> None:
+        if not len(ids):
+            return
+        vecs = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self._dim is None:
+                self._dim = vecs.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO info VALUES ('dim', ?)", (str(self._dim),))
+            elif vecs.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vecs.shape[1]} != store dimension {self._dim}")
+
+            placed: dict = {}
+            rows = []
+            for cid in ids:
+                row = self._row.get(cid, placed.get(cid))
+                if row is None:
+                    row = placed[cid] = self._n
+                    self._n += 1
+                rows.append(row)
+            self._grow(self._n)
+            rows_arr = np.asarray(rows, dtype=np.int64)
+            self._vm[rows_arr] = vecs
+            self._vm.flush()   # vectors land before the rows that point at them
+
+            lists = self._nearest(vecs) if self._centroids is not None else np.full(len(rows), -1)
+            metas = [dict(m or {}) for m in metadatas]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, document, metadata, list) VALUES (?, ?, ?, ?, ?)",
+                [(r, cid, doc, json.dumps(m), int(li)) for r, cid, doc, m, li in zip(rows, ids, documents, metas, lists)],
+            )
+            self._conn.commit()
+            for r, cid, m, li in zip(rows, ids, metas, lists):
+                self._row[cid] = r
+                self._ids[r] = cid
+                self._metas[r] = m
+                self._assign[r] = li
+            self._alive[rows_arr] = True
+            self._changed()
+
+            if self.ivf_lists and self.count() >= max(2 * self._trained_rows, 39 * self.ivf_lists):
+                self.build_ivf()
+
+    def query(self, embedding, k, where=None) -> Records:
+        if k <= 0:
+            return _NO_HITS
+        q = _normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        with self._lock:
+            if not self._row:
+                return _NO_HITS
+            mask = self._mask(where)
+            if self._centroids is not None and self.nprobe < len(self._centroids):
+                probes = np.argsort(self._centroids @ q)[-self.nprobe:]
+                mask = mask & np.isin(self._assign[:self._n], probes)
+            live = int(mask.sum())
+            if live == 0:
+                return _NO_HITS
+            if live == self._n:
+                rows = None
+                scores = self._vm[:self._n] @ q
+            else:
+                rows = np.flatnonzero(mask)
+                scores = self._vm[rows] @ q
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            picked = best if rows is None else rows[best]
+            return self._records(picked.tolist(), embeddings=True)
+
+    def get(self, ids=None, where=None, limit=None, offset=0, embeddings=False) -> Records:
+        with self._lock:
+            if ids is not None:
+                rows = [self._row[i] for i in ids if i in self._row]
+                if where:
+                    mask = self._mask(where)
+                    rows = [r for r in rows if mask[r]]
+            else:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            return self._records(rows, embeddings)
+
+    def update_metadata(self, ids, metadatas) -> None:
+        with self._lock:
+            changed = []
+            for cid, meta in zip(ids, metadatas):
+                row = self._row.get(cid)
+                if row is not None:
+                    self._metas[row] = {**self._metas[row], **meta}
+                    changed.append((json.dumps(self._metas[row]), row))
+            self._conn.executemany("UPDATE rows SET metadata = ? WHERE row = ?", changed)
+            self._conn.commit()
+            self._changed()
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._lock:
+            if ids is not None:
+                rows = [self._row[i] for i in ids if i in self._row]
+            elif where:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            else:
+                return
+            if not rows:
+                return
+            for i in range(0, len(rows), 500):
+                part = rows[i:i + 500]
+                self._conn.execute(f"DELETE FROM rows WHERE row IN ({','.join('?' * len(part))})", part)
+            self._conn.commit()
+            for r in rows:
+                del self._row[self._ids[r]]
+                self._ids[r] = None
+                self._metas[r] = None
+            self._alive[rows] = False
+            self._changed()
+            if self._n - len(self._row) > max(1024, len(self._row)):
+                self.compact()
+
+    def count(self) -> int:
+        return len(self._row)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._vm = None
+            for p in (self._vec_path, self._centroid_path):
+                if os.path.exists(p):
+                    os.remove(p)
+            self._conn.executescript("DELETE FROM rows; DELETE FROM info;")
+            self._conn.commit()
+            self._load()
+
+    def rebuild(self, batch: int = 4096) -> dict:
+        """Compacts the tombstones away and retrains the IVF partitions (if enabled), in place under the store lock."""
+        with self._lock:
+            tombstones = self._n - self.count()
+            self.compact()
+            if self.ivf_lists:
+                self.build_ivf()
+            return {"tombstones_removed": tombstones, "ivf_lists": 0 if self._centroids is None else len(self._centroids)}
+
+    def compact(self) -> None:
+        """Moves live rows down over the tombstones and shrinks nothing else on disk."""
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._n])
+            if len(live) == self._n:
+                return
+            # ascending order: every destination is at or below its source
+            # and below every source still to be moved
+            for i in range(0, len(live), 65536):
+                part = live[i:i + 65536]
+                self._vm[i:i + len(part)] = self._vm[part]
+            self._vm.flush()
+            self._conn.executemany(
+                "UPDATE rows SET row = ? WHERE row = ?",
+                [(new, int(old)) for new, old in enumerate(live) if new != old],
+            )
+            self._conn.commit()
+            self._load()
+
+    def build_ivf(self, lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """
+        (Re)trains the IVF partitioning with spherical k-means on a sample of live rows.
+
+        Called automatically when the store first reaches 39 rows per list
+        and whenever it has doubled since the last training.
+        """
+        lists = lists or self.ivf_lists
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._n])
+            if not lists or len(live) < lists:
+                return
+            rng = np.random.default_rng(seed)
+            sample = self._vm[np.sort(rng.choice(live, size=min(len(live), lists * 64), replace=False))]
+            centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+            for _ in range(iterations):
+                nearest = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, nearest, sample)
+                empty = ~np.bincount(nearest, minlength=lists).astype(bool)
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            self._centroids = centroids
+            assign = np.full(self._n, -1, dtype=np.int64)
+            for i in range(0, len(live), 65536):
+                part = live[i:i + 65536]
+                assign[part] = self._nearest(self._vm[part])
+            np.save(self._centroid_path, centroids)
+            self._conn.executemany(
+                "UPDATE rows SET list = ? WHERE row = ?", [(int(assign[r]), int(r)) for r in live]
+            )
+            self._trained_rows = len(live)
+            self._conn.execute("INSERT OR REPLACE INTO info VALUES ('trained_rows', ?)", (str(len(live)),))
+            self._conn.commit()
+            self._assign[:self._n] = assign
+            self._changed()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "count": self.count(),
+                "dim": self._dim,
+                "rows_allocated": int(self._vm.shape[0]) if self._vm is not None else 0,
+                "tombstones": self._n - self.count(),
+                "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+                "nprobe": self.nprobe,
+                "bytes": os.path.getsize(self._vec_path) if os.path.exists(self._vec_path) else 0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._vm is not None:
+                self._vm.flush()
+            self._conn.close()
+
+    #########* helpers
+
+    def _load(self) -> None:
+        """(Re)builds the in-memory row maps from the sidecar; the caller holds the lock if needed."""
+        info = dict(self._conn.execute("SELECT key, value FROM info"))
+        self._dim: Optional[int] = int(info["dim"]) if "dim" in info else None
+        self._trained_rows = int(info.get("trained_rows", 0))
+        self._vm = None
+        self._n = 0
+        self._row: dict = {}
+        self._ids: List[Optional[str]] = []
+        self._metas: List[Optional[dict]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int64)
+        self._mask_cache: OrderedDict = OrderedDict()
+        self._centroids = np.load(self._centroid_path) if os.path.exists(self._centroid_path) else None
+
+        rows = self._conn.execute("SELECT row, id, metadata, list FROM rows ORDER BY row").fetchall()
+        n = rows[-1][0] + 1 if rows else 0
+        self._grow(n)
+        self._n = n
+        for row, cid, meta, li in rows:
+            self._row[cid] = row
+            self._ids[row] = cid
+            self._metas[row] = json.loads(meta)
+            self._alive[row] = True
+            self._assign[row] = li
+
+    def _grow(self, need: int) -> None:
+        """Makes room for `need` rows, doubling the mapped file as needed."""
+        have = len(self._ids)
+        if need > have:
+            extra = max(need, 2 * have, 1024) - have
+            self._ids.extend([None] * extra)
+            self._metas.extend([None] * extra)
+            self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+            self._assign = np.concatenate([self._assign, np.full(extra, -1, dtype=np.int64)])
+        if self._dim is None:
+            return
+        rows = len(self._ids)
+        if self._vm is None or self._vm.shape[0] < rows:
+            if self._vm is not None:
+                self._vm.flush()
+            size = rows * self._dim * 4
+            with open(self._vec_path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            self._vm = np.memmap(self._vec_path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+
+    def _changed(self) -> None:
+        self._mask_cache.clear()
+
+    def _mask(self, where: Optional[dict]) -> np.ndarray:
+        """Live rows matching `where`, as a bool vector over the used rows."""
+        alive = self._alive[:self._n]
+        if not where:
+            return alive
+        key = json.dumps(where, sort_keys=True, default=str)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = np.fromiter(
+                (m is not None and match_where(m, where) for m in self._metas[:self._n]), dtype=bool, count=self._n
+            )
+            self._mask_cache[key] = mask
+            while len(self._mask_cache) > self._MASKS:
+                self._mask_cache.popitem(last=False)
+        return mask & alive
+
+    def _nearest(self, vecs: np.ndarray) -> np.ndarray:
+        return np.argmax(vecs @ self._centroids.T, axis=1)
+
+    def _records(self, rows: List[int], embeddings: bool) -> Records:
+        if not rows:
+            return _NO_HITS if embeddings else _EMPTY
+        docs = {}
+        for i in range(0, len(rows), 500):
+            part = rows[i:i + 500]
+            docs.update(self._conn.execute(
+                f"SELECT row, document FROM rows WHERE row IN ({','.join('?' * len(part))})", part
+            ))
+        return Records(
+            [self._ids[r] for r in rows],
+            [docs[r] for r in rows],
+            [dict(self._metas[r]) for r in rows],
+            np.array(self._vm[rows]) if embeddings else None,
+        )
+
+
+def match_where(meta: dict, where: dict) -> bool:
+    """Evaluates a Chroma-style metadata filter against one metadata dict."""
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                if not _compare(op, value, arg):
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def _compare(op: str, value: Any, arg: Any) -> bool:
+    if op == "$eq":
+        return value == arg
+    if op == "$ne":
+        return value != arg
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > arg
+        if op == "$gte":
+            return value >= arg
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported where operator: {op}")
+
+
+def _hnsw_metadata(base: Optional[dict] = None) -> Optional[dict]:
+    """Collection metadata: `base` (e.g. the distance space of the collection being rebuilt) plus the configured HNSW parameters."""
+    meta = dict(base or {})
+    for key, value in (("hnsw:M", cfg.HNSW_M), ("hnsw:construction_ef", cfg.HNSW_CONSTRUCTION_EF),
+                       ("hnsw:search_ef", cfg.HNSW_SEARCH_EF)):
+        if value > 0:
+            meta[key] = value
+    return meta or None
+
+
+def _collection_missing(e: Exception) -> bool:
+    # NotFoundError on chromadb >= 0.6, InvalidCollectionException or ValueError before
+    return type(e).__name__ in ("NotFoundError", "InvalidCollectionException") or "does not exist" in str(e)
+
+
+def _hnsw_params(meta: Optional[dict]) -> dict:
+    return {k: v for k, v in (meta or {}).items() if k.startswith("hnsw:")}
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return (vecs / np.maximum(norms, 1e-12)).astype(np.float32, copy=False)
+
+
+def _matrix(rows) -> np.ndarray:
+    if rows is None or not len(rows):
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.asarray(rows, dtype=np.float32)
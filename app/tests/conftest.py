@@ -0,0 +1,45 @@
+import io
+import pytest
+from app.services import indexer
+from app import config as cfg
+
+
+def fake_upload(filename: str, data):
+    """Stands in for an UploadFile: `filename` and an async `read`; `data` is bytes or text."""
+    class U: pass
+    u = U()
+    u.filename = filename
+    stream = io.BytesIO(data.encode() if isinstance(data, str) else data)
+    async def _read(size=-1):
+        return stream.read(size)
+    u.read = _read
+    return u
+
+
+class BagOfWords:
+    """Deterministic word-count vectors (32-d by default), enough to tell the test documents apart."""
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        vec = [0.0] * self.dim
+        for word in text.lower().split():
+            vec[sum(map(ord, word.strip(".,"))) % self.dim] += 1.0
+        return vec
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    """Fresh per-test shards on the numpy backend, embedded with `BagOfWords`."""
+    monkeypatch.setattr(cfg, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(cfg, "VECTOR_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setattr(cfg, "LEXICAL_INDEX_PATH", str(tmp_path / "lexical.sqlite"))
+    monkeypatch.setattr(cfg, "CATALOG_PATH", str(tmp_path / "catalog.sqlite"))
+    monkeypatch.setattr(cfg, "DATA_DIR", str(tmp_path / "docs"))
+    monkeypatch.setattr(indexer, "_embeddings", BagOfWords())
+    for name in ("_stores", "_lexical_indexes", "_catalogs"):
+        monkeypatch.setattr(indexer, name, {})
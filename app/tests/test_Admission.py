@@ -0,0 +1,130 @@
+import time
+import asyncio
+import threading
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from app.services import admission, upstream
+from app.services.admission import BULK, INTERACTIVE, OverloadedError, Pool
+from app import config as cfg
+
+
+def _wait_queued(pool, n):
+    deadline = time.monotonic() + 2
+    while pool.queued < n and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_pool_serves_questions_before_bulk_and_fails_fast():
+    pool = Pool("test", limit=1, max_queue=1, max_wait=2.0)
+    order = []
+
+    def take(name, priority, block):
+        with pool.slot(priority, block=block):
+            order.append(name)
+
+    with pool.slot():
+        bulk = threading.Thread(target=take, args=("bulk", BULK, True))
+        bulk.start()
+        _wait_queued(pool, 1)
+        question = threading.Thread(target=take, args=("question", INTERACTIVE, False))
+        question.start()
+        _wait_queued(pool, 2)
+        # one question already waits: the next is turned away at once
+        with pytest.raises(OverloadedError) as e:
+            with pool.slot(INTERACTIVE):
+                pass
+        assert e.value.retry_after >= 1
+    question.join()
+    bulk.join()
+    assert order == ["question", "bulk"]
+    assert pool.active == 0 and pool.queued == 0
+
+
+def test_async_acquire_times_out_and_releases_cleanly():
+    pool = Pool("test", limit=1, max_queue=4, max_wait=0.05)
+
+    async def scenario():
+        await pool.acquire()
+        with pytest.raises(OverloadedError):
+            await pool.acquire()
+        pool.release()
+        async with pool.aslot():
+            assert pool.active == 1
+
+    asyncio.run(scenario())
+    assert pool.active == 0 and pool.queued == 0
+
+
+def test_full_ingest_queue_and_upstream_rate_limit(monkeypatch):
+    from app.main import app
+    from app.routes import ask
+
+    client = TestClient(app)
+    monkeypatch.setattr(cfg, "INGEST_QUEUE_MAX", 0)
+    r = client.post("/files/", files={"file": ("a.txt", b"hello", "text/plain")})
+    assert r.status_code == 503 and int(r.headers["retry-after"]) >= 1
+
+    async def _retrieve(question, k, where=None, tenants=None):
+        return [Document(page_content="Pump seals are inspected quarterly.", metadata={"doc_id": "d"})]
+
+    limited = httpx.MockTransport(lambda request: httpx.Response(429, headers={"Retry-After": "7"}, text="slow down"))
+    monkeypatch.setattr(ask, "retrieve", _retrieve)
+    monkeypatch.setattr(upstream, "client", lambda: httpx.AsyncClient(transport=limited))
+    monkeypatch.setattr(cfg, "OPENROUTER_API_KEY", "key")
+    monkeypatch.setattr(cfg, "OPENROUTER_MODEL", "model")
+    monkeypatch.setattr(cfg, "OPENROUTER_BASE_URL", "http://upstream.test")
+    r = client.post("/ask/", json={"question": "How often are seals inspected?"})
+    assert r.status_code == 429 and r.headers["retry-after"] == "7"
+    assert admission.pool("upstream").active == 0
+
+
+def test_upstream_client_left_on_another_loop_is_closed(monkeypatch):
+    monkeypatch.setattr(upstream, "_client", None)
+    monkeypatch.setattr(upstream, "_client_loop", None)
+
+    async def get(wait=False):
+        c = upstream.client()
+        while wait and upstream._closing:
+            await asyncio.sleep(0.01)
+        return c
+
+    first = asyncio.run(get())
+    second = asyncio.run(get(wait=True))
+    assert second is not first and first.is_closed and not second.is_closed
+    asyncio.run(upstream.shutdown())
+    assert second.is_closed
+
+
+def test_stream_ends_with_error_event_when_upstream_connection_fails(monkeypatch):
+    from app.main import app
+    from app.routes import ask
+
+    async def _retrieve(question, k, where=None, tenants=None):
+        return [Document(page_content="Pump seals are inspected quarterly.", metadata={"doc_id": "d"})]
+
+    class Dropped(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'data: {"choices": [{"delta": {"content": "Every"}}]}\n\n'
+            raise httpx.RemoteProtocolError("peer closed connection")
+
+    def handler(request):
+        if failures.pop(0) == "connect":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, stream=Dropped(), headers={"content-type": "text/event-stream"})
+
+    failures = ["connect", "midstream"]
+    remembered = []
+    monkeypatch.setattr(ask, "retrieve", _retrieve)
+    monkeypatch.setattr(upstream, "client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(ask.answer_cache.cache, "put", lambda *a, **kw: remembered.append(a))
+    monkeypatch.setattr(cfg, "OPENROUTER_API_KEY", "key")
+    monkeypatch.setattr(cfg, "OPENROUTER_MODEL", "model")
+    monkeypatch.setattr(cfg, "OPENROUTER_BASE_URL", "http://upstream.test")
+    client = TestClient(app)
+    for expected in ("ConnectError", "RemoteProtocolError"):
+        body = client.post("/ask/stream", json={"question": "How often are seals inspected?"}).text
+        events = [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+        assert events[-1] == "error" and "done" not in events and expected in body
+    assert remembered == []
@@ -2,6 +2,7 @@
 import os
 import io
 import json
+import time
 import pytest
 from pathlib import Path
 from fastapi import FastAPI
@@ -55,12 +56,19 @@ def _persist_dir() -> Path:
 
 
 def _upload_text_file(client: TestClient, name: str, text: str):
-    """Uploads a text file via /files and returns JSON with doc_id."""
+    """Uploads a text file via /files, waits for its ingestion job and returns JSON with doc_id."""
     file_bytes = io.BytesIO(text.encode("utf-8"))
     r = client.post("/files", files={"file": (name, file_bytes, "text/plain")})
-    assert r.status_code in (200, 201), f"Upload failed: {r.text}"
+    assert r.status_code in (200, 201, 202), f"Upload failed: {r.text}"
     data = r.json()
     assert "doc_id" in data, f"Upload response missing doc_id: {data}"
+
+    deadline = time.time() + 120
+    while data.get("status") not in ("done", "failed"):
+        assert time.time() < deadline, f"Ingestion job did not finish: {data}"
+        time.sleep(0.2)
+        data = client.get(f"/files/jobs/{data['job_id']}").json()
+    assert data["status"] == "done", f"Ingestion failed: {data}"
     return data
 
 
@@ -0,0 +1,146 @@
+from app.services.cache import LRUCache
+from app.services.embed_cache import CachedEmbeddings, EmbeddingCache
+from app.tests.conftest import fake_upload
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def test_cached_embeddings_only_embed_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=100)
+    inner = CountingEmbeddings()
+    emb = CachedEmbeddings(inner, cache, "model-a")
+
+    first = emb.embed_documents(["alpha", "beta", "alpha"])
+    second = emb.embed_documents(["beta", "gamma"])
+
+    assert first == [[5.0, 1.0], [4.0, 1.0], [5.0, 1.0]]
+    assert second == [[4.0, 1.0], [5.0, 1.0]]
+    assert inner.calls == [["alpha", "beta"], ["gamma"]]
+    assert cache.stats()["hits"] == 1
+
+    # another model never sees these vectors
+    other = CachedEmbeddings(inner, cache, "model-b")
+    other.embed_documents(["alpha"])
+    assert inner.calls[-1] == ["alpha"]
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    for i in range(10):
+        cache.put_many({f"k{i}": [float(i)]})
+    cache.get_many(["k0"])  # touch the oldest entry
+
+    cache.put_many({"k10": [10.0]})
+
+    stats = cache.stats()
+    assert stats["entries"] <= 10
+    assert stats["evictions"] >= 1
+    assert "k0" in cache.get_many(["k0"])
+    assert "k1" not in cache.get_many(["k1"])
+
+
+def test_query_embeddings_served_from_lru():
+    inner = CountingEmbeddings()
+    inner.queries = 0
+    def embed_query(text):
+        inner.queries += 1
+        return [float(len(text)), 1.0]
+    inner.embed_query = embed_query
+    emb = CachedEmbeddings(inner, None, "model-a", query_cache=LRUCache(2))
+
+    assert emb.embed_query("q1") == emb.embed_query("q1")
+    emb.embed_query("q2")
+    emb.embed_query("q3")  # evicts q1
+    emb.embed_query("q1")
+
+    assert inner.queries == 4
+    assert emb.query_cache.stats()["hits"] == 1
+
+
+def test_batcher_coalesces_concurrent_queries():
+    import threading
+    from app.services.batcher import EmbedBatcher
+
+    inner = CountingEmbeddings()
+    batcher = EmbedBatcher(inner.embed_documents, max_batch=8, max_wait_ms=200)
+    emb = CachedEmbeddings(inner, None, "model-a", query_cache=LRUCache(16), batcher=batcher)
+    texts = [f"question {i}" * (i + 1) for i in range(6)]
+    results = {}
+    threads = [threading.Thread(target=lambda t=t: results.__setitem__(t, emb.embed_query(t))) for t in texts]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    batcher.stop()
+
+    assert all(results[t] == [float(len(t)), 1.0] for t in texts)
+    assert batcher.stats()["items"] == 6
+    assert batcher.stats()["batches"] < 6
+
+
+def test_answer_cache_needs_a_close_question_and_the_same_chunks():
+    from app.services.answer_cache import AnswerCache
+
+    cache = AnswerCache(2, ttl=60, threshold=0.9)
+    cache.put([1.0, 0.0, 0.0], "scope", ["a", "b"], {"answer": "30 days", "model": "m"}, upstream_seconds=2.0)
+    assert cache.get([0.95, 0.1, 0.0], "scope", ["b", "a"])["answer"] == "30 days"
+    assert cache.get([0.0, 1.0, 0.0], "scope", ["a", "b"]) is None     # another question
+    assert cache.get([1.0, 0.0, 0.0], "scope", ["a", "c"]) is None     # other grounding
+    assert cache.get([1.0, 0.0, 0.0], "other", ["a", "b"]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["saved_upstream_seconds"] == 2.0
+
+    assert cache.invalidate(["b"]) == 1
+    assert cache.get([1.0, 0.0, 0.0], "scope", ["a", "b"]) is None
+
+    for i in range(3):
+        cache.put([1.0, float(i), 0.0], "scope", [f"c{i}"], {"answer": str(i), "model": None}, 1.0)
+    assert cache.get([1.0, 0.0, 0.0], "scope", ["c0"]) is None     # LRU-evicted
+    assert cache.get([1.0, 2.0, 0.0], "scope", ["c2"])["answer"] == "2"
+
+    expired = AnswerCache(2, ttl=0, threshold=0.9)
+    expired.put([1.0], "scope", ["a"], {"answer": "x", "model": None}, 1.0)
+    assert expired.get([1.0], "scope", ["a"]) is None
+
+
+def test_ask_reuses_the_answer_for_a_paraphrase(shards, monkeypatch):
+    import asyncio
+    import httpx
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services import answer_cache, indexer, upstream
+    from app import config as cfg
+
+    calls = []
+
+    def reply(request):
+        calls.append(request)
+        return httpx.Response(200, json={"model": "m", "choices": [{"message": {"content": "Every quarter."}}]})
+
+    transport = httpx.MockTransport(reply)
+    monkeypatch.setattr(upstream, "client", lambda: httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(cfg, "OPENROUTER_API_KEY", "key")
+    monkeypatch.setattr(cfg, "OPENROUTER_BASE_URL", "http://upstream.test")
+    monkeypatch.setattr(answer_cache, "cache", answer_cache.AnswerCache(16, ttl=60, threshold=0.9))
+    doc = asyncio.run(indexer.ingest_upload(fake_upload("pumps.txt", "Pump seals are inspected every quarter.")))
+    client = TestClient(app)
+
+    first = client.post("/ask/", json={"question": "How often are pump seals inspected?"}).json()
+    again = client.post("/ask/", json={"question": "How often are the pump seals inspected?"}).json()
+    assert first["answer"] == again["answer"] == "Every quarter."
+    assert not first["cached"] and again["cached"] and len(calls) == 1
+    assert client.get("/ask/debug/cache").json()["answers"]["hits"] == 1
+    streamed = client.post("/ask/stream", json={"question": "how often are pump seals inspected?"}).text
+    assert '"cached": true' in streamed and "Every quarter." in streamed and len(calls) == 1
+
+    asyncio.run(indexer.delete_document(doc["doc_id"]))
+    assert answer_cache.cache.stats()["entries"] == 0
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.services import indexer, tenants
+from app.services.index_service import (IndexService, IndexServiceError, RemoteEmbeddings, RemoteStore,
+                                        ServiceClient, make_server)
+from app.services.lexical import LexicalIndex
+from app.services.vectorstore import NumpyStore
+from app.tests.conftest import BagOfWords, fake_upload
+from app import config as cfg
+
+
+@pytest.fixture
+def service(tmp_path):
+    lex = str(tmp_path / "lex.sqlite")
+    svc = IndexService(BagOfWords(16), NumpyStore(str(tmp_path / "vectors")), LexicalIndex(lex),
+                       open_shard=lambda t: (NumpyStore(str(tmp_path / f"vectors-{t}")),
+                                             LexicalIndex(tenants.sqlite_path(lex, t))))
+    server = make_server(str(tmp_path / "index.sock"), svc)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield svc, str(tmp_path / "index.sock")
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_store_and_embeddings_round_trip(service):
+    svc, sock = service
+    client = ServiceClient(sock)
+    emb, store = RemoteEmbeddings(client), RemoteStore(client)
+
+    texts = [f"policy clause {i} covers backup retention" for i in range(5)] + ["pump valve seal inspection"]
+    ids = [f"d:{i}" for i in range(len(texts))]
+    store.add(ids, texts, [{"doc_id": "d", "ord": i} for i in range(len(texts))], emb.embed_documents(texts))
+    assert store.count() == len(texts) and svc.generation == 1
+
+    # concurrent questions over pooled connections
+    with ThreadPoolExecutor(8) as pool:
+        hits = list(pool.map(lambda q: store.query(emb.embed_query(q), 1).ids[0],
+                             ["pump valve seal inspection"] * 16))
+    assert set(hits) == {"d:5"}
+
+    store.update_metadata(["d:5"], [{"ord": 9}])
+    assert store.get(ids=["d:5"]).metadatas[0] == {"doc_id": "d", "ord": 9}
+    store.delete(ids=["d:0"])
+    assert store.count() == 5 and client.call("generation") == 3
+
+    with pytest.raises(IndexServiceError):
+        client.call("no_such_method")
+    client.close()
+    with pytest.raises(IndexServiceError):
+        ServiceClient(sock + ".missing").call("count")
+
+
+def test_ingest_through_service(service, monkeypatch, tmp_path):
+    svc, sock = service
+    monkeypatch.setattr(cfg, "INDEX_SERVICE_SOCKET", sock)
+    monkeypatch.setattr(cfg, "LEXICAL_INDEX_PATH", svc.lexical.path)
+    monkeypatch.setattr(cfg, "CATALOG_PATH", str(tmp_path / "catalog.sqlite"))
+    for name in ("_embeddings", "_service_client"):
+        monkeypatch.setattr(indexer, name, None)
+    for name in ("_stores", "_lexical_indexes", "_catalogs"):
+        monkeypatch.setattr(indexer, name, {})
+
+    text = "Pump seals are inspected every quarter. " * 60
+    res = asyncio.run(indexer.ingest_upload(fake_upload("seals.txt", text)))
+    assert res["status"] == "indexed"
+    assert svc.store.count() == res["chunks"] and svc.lexical.count() == res["chunks"]
+    # BM25 search runs on the worker's side of the shared SQLite file
+    assert indexer._lexical().search("inspected quarter", 1)
+    assert indexer.generation() == svc.generation > 0
+
+    # another tenant's upload lands in its own shard of the service
+    other = asyncio.run(indexer.ingest_upload(fake_upload("seals.txt", text), tenant="acme"))
+    acme_store, acme_lexical = svc.shard("acme")
+    assert other["status"] == "indexed" and other["doc_id"] != res["doc_id"]
+    assert acme_store.count() == other["chunks"] and acme_lexical.count() == other["chunks"]
+    assert svc.store.count() == res["chunks"]
+
+    assert asyncio.run(indexer.delete_document(res["doc_id"], tenant="acme")) is False
+    assert asyncio.run(indexer.delete_document(res["doc_id"])) is True
+    assert svc.store.count() == 0 and svc.lexical.count() == 0
+    assert acme_store.count() == other["chunks"]
+    indexer._service().close()
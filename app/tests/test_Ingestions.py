@@ -2,19 +2,14 @@ import os
 import asyncio
 from app.services import indexer
 import pytest
+from app.tests.conftest import fake_upload
 from app import config as cfg
 
 
-
 def _upload_from_path(path: str):
-    class U: pass
-    u = U()
-    u.filename = os.path.basename(path)
-    async def _read():
-        with open(path, "rb") as f:
-            return f.read()
-    u.read = _read
-    return u
+    with open(path, "rb") as f:
+        return fake_upload(os.path.basename(path), f.read())
+
 
 def test_ingest_txt_and_pdf_then_delete(tmp_path):
     #indexer.DATA_DIR = str(tmp_path / "docs")
@@ -59,15 +54,168 @@ def test_ingest_empty_rejected(tmp_path):
     cfg._embeddings = None
     cfg._vectordb = None
 
-    # build an "empty file" 
-    class U: pass
-    u = U()
-    u.filename = "empty.txt"
-    async def _read():
-        return b""
-    u.read = _read
-
-    
     with pytest.raises(ValueError) as e:
-        asyncio.run(indexer.ingest_upload(u))
+        asyncio.run(indexer.ingest_upload(fake_upload("empty.txt", b"")))
     assert "Empty file" in str(e.value)
+
+
+def test_ingest_oversized_rejected_without_leftovers(tmp_path, monkeypatch):
+    monkeypatch.setattr(cfg, "DATA_DIR", str(tmp_path / "docs"))
+    monkeypatch.setattr(cfg, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(cfg, "UPLOAD_BLOCK_BYTES", 256)
+
+    with pytest.raises(indexer.UploadTooLargeError):
+        asyncio.run(indexer.ingest_upload(fake_upload("big.txt", b"x" * 5000)))
+    assert os.listdir(cfg.DATA_DIR) == []
+
+
+def test_catalog_records_lists_and_deletes_by_chunk_ids(tmp_path):
+    here = os.path.dirname(__file__)
+    res = asyncio.run(indexer.ingest_upload(_upload_from_path(os.path.join(here, "test_docs", "sample.pdf"))))
+
+    doc = indexer.get_document(res["doc_id"])
+    assert doc["filename"] == "sample.pdf"
+    assert doc["chunks"] == res["chunks"] == len(doc["chunk_ids"])
+    assert doc["pages"] >= 1 and doc["bytes"] > 0
+    assert indexer._db().get(ids=doc["chunk_ids"]).ids == doc["chunk_ids"]
+
+    items, _ = indexer.list_documents(100)
+    assert res["doc_id"] in [d["doc_id"] for d in items]
+
+    assert asyncio.run(indexer.delete_document(res["doc_id"])) is True
+    assert indexer.get_document(res["doc_id"]) is None
+    assert indexer._db().get(ids=doc["chunk_ids"]).ids == []
+    assert asyncio.run(indexer.delete_document(res["doc_id"])) is False
+
+
+def test_catalog_update_keeps_list_position(tmp_path):
+    from app.services.catalog import Catalog
+
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    sizes = {"bytes": 10, "pages": 1, "chunks": 1}
+    for d in "abc":
+        catalog.record({"doc_id": d, "filename": f"{d}.txt", "content_hash": d, **sizes}, [(f"{d}:1", 0, None, "h1")])
+    page, cursor = catalog.list(2)
+    assert [x["doc_id"] for x in page] == ["c", "b"]
+
+    # a new version of "a" replaces its chunks but stays on the page an open cursor hasn't reached yet
+    catalog.record({"doc_id": "a", "filename": "a-v2.txt", "content_hash": "a2", **sizes}, [("a:2", 0, None, "h2")])
+    page, _ = catalog.list(2, cursor)
+    assert [(x["doc_id"], x["filename"]) for x in page] == [("a", "a-v2.txt")]
+    assert catalog.chunk_ids("a") == ["a:2"]
+
+
+def test_update_reembeds_only_changed_chunks():
+    paras = [f"Section {i}. " + f"policy clause {i} applies to all staff. " * 8 for i in range(30)]
+    v1 = "\n\n".join(paras).encode()
+    paras[12] = paras[12].replace("applies to all staff", "applies to contractor")
+    v2 = "\n\n".join(paras).encode()
+
+    first = asyncio.run(indexer.ingest_upload(fake_upload("policy.txt", v1)))
+    before = indexer.get_document(first["doc_id"])
+
+    same = asyncio.run(indexer.save_update(fake_upload("policy.txt", v1), first["doc_id"]))
+    assert same.duplicate["status"] == "unchanged"
+
+    saved = asyncio.run(indexer.save_update(fake_upload("policy-v2.txt", v2), first["doc_id"]))
+    res = indexer.update_file(saved.doc_id, saved.path, "policy-v2.txt", saved.content_hash)
+
+    assert res["doc_id"] == first["doc_id"] and res["status"] == "updated"
+    assert 1 <= res["added"] <= 2 and res["added"] == res["removed"]
+    after = indexer.get_document(first["doc_id"])
+    assert after["chunks"] == res["chunks"] and after["content_hash"] == saved.content_hash
+    assert len(set(before["chunk_ids"]) & set(after["chunk_ids"])) == res["unchanged"]
+
+    stored = indexer._db().get(where={"doc_id": first["doc_id"]})
+    assert sorted(stored.ids) == sorted(after["chunk_ids"])
+    assert {m["filename"] for m in stored.metadatas} == {"policy-v2.txt"}
+    assert {m["source"] for m in stored.metadatas} == {os.path.join(cfg.DATA_DIR, first["doc_id"], "policy-v2.txt")}
+    assert sorted(m["ord"] for m in stored.metadatas) == list(range(res["chunks"]))
+    assert os.listdir(os.path.join(cfg.DATA_DIR, first["doc_id"])) == ["policy-v2.txt"]
+    asyncio.run(indexer.delete_document(first["doc_id"]))
+
+
+def _versions(n):
+    paras = [f"Section {i}. " + f"policy clause {i} applies to all staff. " * 8 for i in range(10)]
+    out = []
+    for v in range(n):
+        paras[4] = f"Section 4. Version {v} of the remote work rule needs approval {v}. " * 8
+        out.append("\n\n".join(paras).encode())
+    return out
+
+
+def test_overlapping_updates_and_delete_during_update_leave_no_orphans():
+    v1, v2, v3 = _versions(3)
+    doc_id = asyncio.run(indexer.ingest_upload(fake_upload("policy.txt", v1)))["doc_id"]
+    slow = asyncio.run(indexer.save_update(fake_upload("policy.txt", v2), doc_id))
+    fast = asyncio.run(indexer.save_update(fake_upload("policy.txt", v3), doc_id))
+
+    # v3 commits while v2 is still parsing: v2 must not apply its diff against v1
+    def progress(**fields):
+        if fields.get("chunks_total") == 1:
+            indexer.update_file(fast.doc_id, fast.path, "policy.txt", fast.content_hash)
+
+    with pytest.raises(indexer.UpdateConflictError):
+        indexer.update_file(slow.doc_id, slow.path, "policy.txt", slow.content_hash, on_progress=progress)
+    doc = indexer.get_document(doc_id)
+    assert doc["content_hash"] == fast.content_hash
+    assert sorted(indexer._db().get(where={"doc_id": doc_id}).ids) == sorted(doc["chunk_ids"])
+    assert {cid for cid, _ in indexer._lexical().search("version remote work rule", 20)} <= set(doc["chunk_ids"])
+
+    # a delete while an update parses is not undone by the update
+    again = asyncio.run(indexer.save_update(fake_upload("policy.txt", v2), doc_id))
+
+    def delete(**fields):
+        if fields.get("chunks_total") == 1:
+            asyncio.run(indexer.delete_document(doc_id))
+
+    with pytest.raises(indexer.UnknownDocumentError):
+        indexer.update_file(again.doc_id, again.path, "policy.txt", again.content_hash, on_progress=delete)
+    assert indexer.get_document(doc_id) is None
+    assert indexer._db().get(where={"doc_id": doc_id}).ids == []
+    assert not os.path.exists(os.path.join(cfg.DATA_DIR, doc_id))
+
+
+def test_failed_update_keeps_the_old_version_searchable(monkeypatch):
+    from app.services import retrieval
+    from app.services.catalog import Catalog
+
+    paras = [f"Section {i}. " + f"policy clause {i} applies to all staff. " * 8 for i in range(10)]
+    first = asyncio.run(indexer.ingest_upload(fake_upload("policy.txt", "\n\n".join(paras).encode())))
+    before = indexer.get_document(first["doc_id"])
+    paras[4] = "Section 4. Remote work requires written approval from the department head. " * 8
+    saved = asyncio.run(indexer.save_update(fake_upload("policy.txt", "\n\n".join(paras).encode()), first["doc_id"]))
+
+    def fail(self, doc, chunks):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(Catalog, "record", fail)
+    with pytest.raises(RuntimeError):
+        indexer.update_file(saved.doc_id, saved.path, "policy.txt", saved.content_hash)
+    monkeypatch.undo()
+
+    # the catalog, the vectors and BM25 all still hold the old version, replaced chunk included
+    assert indexer.get_document(first["doc_id"]) == before
+    stored = indexer._db().get(where={"doc_id": first["doc_id"]})
+    assert sorted(stored.ids) == sorted(before["chunk_ids"])
+    old = next(cid for cid, text in zip(stored.ids, stored.documents) if "clause 4 applies" in text)
+    assert old in [cid for cid, _ in indexer._lexical().search("clause 4 applies", 5)]
+    assert old in [d.id for d in retrieval.search("Section 4. policy clause 4 applies to all staff", 3)]
+    asyncio.run(indexer.delete_document(first["doc_id"]))
+
+
+def test_metrics_record_ingest_stages():
+    from prometheus_client import REGISTRY, generate_latest
+
+    def count(stage):
+        return REGISTRY.get_sample_value("rag_ingest_stage_seconds_count", {"stage": stage}) or 0
+
+    before = {s: count(s) for s in ("extract", "split", "embed", "upsert", "total")}
+    data = b"Backup retention is thirty days for every server.\n" * 40
+    res = asyncio.run(indexer.ingest_upload(fake_upload("retention.txt", data)))
+    assert all(count(s) > n for s, n in before.items())
+
+    exposed = generate_latest().decode()
+    assert 'rag_documents_total{event="indexed"}' in exposed
+    assert "rag_collection_chunks" in exposed
+    asyncio.run(indexer.delete_document(res["doc_id"]))
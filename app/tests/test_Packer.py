@@ -0,0 +1,42 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.services.packer import estimate_tokens, merge_overlap, pack_context
+
+
+def _chunks(text, doc_id="d1", filename="policy.pdf"):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=60)
+    parts = splitter.split_text(text)
+    return [
+        Document(page_content=p, metadata={"doc_id": doc_id, "filename": filename, "ord": i, "page": 0})
+        for i, p in enumerate(parts)
+    ]
+
+
+def test_adjacent_chunks_are_merged_without_repeated_overlap():
+    text = " ".join(f"Sentence number {i} of the refund policy." for i in range(20))
+    chunks = _chunks(text)
+    assert len(chunks) >= 3
+
+    # retrieved out of order, as a search would return them
+    blocks = pack_context([chunks[1], chunks[0], chunks[2]], budget_tokens=10_000)
+
+    assert len(blocks) == 1
+    assert blocks[0].startswith("[Source: policy.pdf, p. 1]\n")
+    body = blocks[0].split("\n", 1)[1]
+    assert body.count("Sentence number 3 of") == 1
+    assert body.startswith(chunks[0].page_content)
+
+
+def test_budget_keeps_best_ranked_blocks():
+    a = Document(page_content="alpha " * 100, metadata={"doc_id": "a", "ord": 0, "filename": "a.txt"})
+    b = Document(page_content="beta " * 300, metadata={"doc_id": "b", "ord": 0, "filename": "b.txt"})
+    c = Document(page_content="gamma " * 20, metadata={"doc_id": "c", "ord": 0, "filename": "c.txt"})
+
+    blocks = pack_context([a, b, c], budget_tokens=200)
+
+    assert [blk.split("\n", 1)[0] for blk in blocks] == ["[Source: a.txt]", "[Source: c.txt]"]
+    assert sum(estimate_tokens(blk) for blk in blocks) <= 200
+
+
+def test_merge_without_overlap_keeps_both_texts():
+    assert merge_overlap("first part.", "second part.", 60) == "first part.\nsecond part."
@@ -0,0 +1,50 @@
+import time
+import threading
+from fastapi.testclient import TestClient
+from app.services import metrics
+from app.services.profiling import SamplingProfiler
+from app import config as cfg
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sampling_profiler_folds_busy_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="busy")
+    profiler = SamplingProfiler(interval=0.002)
+    worker.start()
+    profiler.start()
+    time.sleep(0.2)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    lines = profiler.folded().splitlines()
+    assert profiler.samples > 10
+    busy = [l for l in lines if l.startswith("busy;")]
+    assert busy and all("_spin (test_Profiling.py:" in l for l in busy)
+    stack, count = busy[0].rsplit(" ", 1)
+    assert int(count) > 0 and "profiler" not in stack
+
+
+def test_timings_breakdown_and_admin_guard(monkeypatch):
+    from app.main import app
+
+    timings = metrics.start_timings()
+    metrics.ingest_stage["embed"].observe(0.004)
+    metrics.ingest_stage["embed"].observe(0.002)
+    metrics.stop_timings()
+    metrics.ingest_stage["embed"].observe(1.0)   # not collected any more
+    assert metrics.rounded(timings) == {"embed": 6.0}
+
+    client = TestClient(app)
+    monkeypatch.setattr(cfg, "ADMIN_TOKEN", "")
+    assert client.post("/admin/profile?seconds=0.1").status_code == 403
+    monkeypatch.setattr(cfg, "ADMIN_TOKEN", "secret")
+    assert client.post("/admin/profile?seconds=0.1", headers={"X-Admin-Token": "nope"}).status_code == 401
+    assert client.post("/admin/profile", headers={"X-Admin-Token": "secret"}).status_code == 400
+    r = client.post("/admin/profile?seconds=0.1&interval_ms=2", headers={"X-Admin-Token": "secret"})
+    assert r.status_code == 200 and int(r.headers["x-profile-samples"]) > 0
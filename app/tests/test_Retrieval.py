@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from app.models import AskRequest
+from app.services import indexer
+from app.services.lexical import LexicalIndex, rrf, tokenize
+from app.tests.conftest import fake_upload
+from app import config as cfg
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("Error E_CONN-42 in clause 7.2!") == [
+        "error", "e_conn-42", "e", "conn", "42", "in", "clause", "7.2", "7", "2",
+    ]
+
+
+def test_bm25_finds_exact_identifier_and_forgets_deleted_chunks(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite"))
+    index.add([
+        ("a:1", "a", "The pump uses part PN-4711 for the seal."),
+        ("a:2", "a", "The pump is serviced every year."),
+        ("b:1", "b", "Valves use part PN-9000."),
+    ])
+
+    hits = index.search("which pump uses PN-4711", k=3)
+    assert hits[0][0] == "a:1"
+
+    index.delete_doc("a")
+    assert index.count() == 1
+    assert all(not cid.startswith("a:") for cid, _ in index.search("PN-4711", k=3))
+    assert index.search("PN-9000", k=3)[0][0] == "b:1"
+    assert index.search("PN-9000", k=3, doc_ids=["a"]) == []
+    assert index.search("pump PN-9000", k=3, doc_ids=[]) == []
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = rrf([["x", "y", "z"], ["y", "w"]], k=3)
+    assert fused[0][0] == "y"
+    assert len(fused) == 3
+    assert {i for i, _ in fused} <= {"x", "y", "z", "w"}
+
+
+def test_mmr_skips_near_duplicates_and_prefers_diverse_chunks():
+    from app.services.retrieval import mmr
+
+    query = np.array([1.0, 0.0, 0.0])
+    candidates = np.array([
+        [0.95, 0.31, 0.0],   # best match
+        [0.95, 0.31, 0.01],  # near-identical revision of it
+        [0.90, 0.0, 0.44],   # relevant, different content
+        [0.0, 1.0, 0.0],     # irrelevant
+    ])
+
+    picked = mmr(query, candidates, k=3, lambda_mult=0.7, dedup_cosine=0.98)
+    assert picked[:2] == [0, 2]
+    assert 1 not in picked
+
+    # no dedup and pure relevance keeps the duplicate
+    assert mmr(query, candidates, k=2, lambda_mult=1.0, dedup_cosine=1.1) == [0, 1]
+
+
+def test_request_scope_is_pushed_into_the_search(shards):
+    from app.routes import ask
+
+    a = asyncio.run(indexer.ingest_upload(fake_upload("manual-pumps.txt", "Pump seals are inspected every quarter.")))
+    b = asyncio.run(indexer.ingest_upload(fake_upload("notes.txt", "Pump seals were replaced in March.")))
+
+    def scoped(**filters):
+        k, docs = asyncio.run(ask.scoped_retrieve("pump seals", AskRequest(question="pump seals", **filters), [cfg.DEFAULT_TENANT]))
+        return k, {d.metadata["doc_id"] for d in docs}
+
+    assert scoped() == (cfg.RETRIEVAL_K, {a["doc_id"], b["doc_id"]})
+    assert scoped(k=1, doc_ids=[b["doc_id"]]) == (1, {b["doc_id"]})
+    assert scoped(filenames=["manual-*"])[1] == {a["doc_id"]}
+    # filters combine: no document is both
+    assert scoped(doc_ids=[b["doc_id"]], filenames=["manual-*"])[1] == set()
+    past = datetime.now(timezone.utc) - timedelta(minutes=5)
+    assert scoped(ingested_after=past)[1] == {a["doc_id"], b["doc_id"]}
+    assert scoped(ingested_after=past + timedelta(hours=1))[1] == set()
+    with pytest.raises(HTTPException) as e:
+        scoped(k=cfg.MAX_RETRIEVAL_K + 1)
+    assert e.value.status_code == 400
@@ -0,0 +1,98 @@
+import json
+import asyncio
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.services import indexer, retrieval, snapshot
+from app.tests.conftest import fake_upload
+from app import config as cfg
+
+
+def test_snapshot_round_trip_into_another_shard(shards, tmp_path):
+    a = asyncio.run(indexer.ingest_upload(fake_upload("pumps.txt", "Pump seals are inspected every quarter. " * 40), "acme"))
+    b = asyncio.run(indexer.ingest_upload(fake_upload("backup.txt", "Backups are retained for ninety days."), "acme"))
+    path = str(tmp_path / "snap")
+
+    manifest = snapshot.export(path, "acme", "float16", batch=2)
+    assert manifest["chunks"] == a["chunks"] + b["chunks"] and manifest["documents"] == 2
+    assert manifest["embed_model"] == cfg.EMBED_MODEL and manifest["dtype"] == "float16"
+    assert (tmp_path / "snap" / "embeddings.f16").stat().st_size == manifest["chunks"] * manifest["dim"] * 2
+
+    # a replica shard: stale content is replaced, catalog and BM25 come back with the vectors
+    asyncio.run(indexer.ingest_upload(fake_upload("old.txt", "Something that should disappear."), "globex"))
+    got = snapshot.load(path, "globex", batch=3)
+    assert got["chunks"] == manifest["chunks"] and got["documents"] == 2
+    assert indexer._db("globex").count() == manifest["chunks"]
+    assert [d["filename"] for d in indexer.list_documents(10, tenant="globex")[0]] == ["backup.txt", "pumps.txt"]
+    assert indexer.get_document(a["doc_id"], "globex")["chunk_ids"] == indexer.get_document(a["doc_id"], "acme")["chunk_ids"]
+    assert indexer._lexical(tenant="globex").search("ninety", 1)[0][0].startswith(b["doc_id"])
+    hits = retrieval.search("backups retained ninety days", 1, tenants=["globex"])
+    assert hits[0].metadata["doc_id"] == b["doc_id"]
+
+    src = indexer._db("acme").get(ids=[hits[0].id], embeddings=True).embeddings
+    dst = indexer._db("globex").get(ids=[hits[0].id], embeddings=True).embeddings
+    assert np.allclose(src, dst, atol=1e-3)
+
+
+def test_snapshot_refuses_other_model_and_corruption(shards, tmp_path, monkeypatch):
+    from app.main import app
+
+    asyncio.run(indexer.ingest_upload(fake_upload("pumps.txt", "Pump seals are inspected every quarter.")))
+    monkeypatch.setattr(cfg, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(cfg, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    client = TestClient(app)
+    headers = {"X-Admin-Token": "secret"}
+    assert client.post("/admin/snapshot/export?name=../x", headers=headers).status_code == 400
+    r = client.post("/admin/snapshot/export?name=nightly", headers=headers)
+    assert r.status_code == 200 and r.json()["chunks"] == 1
+    assert client.post("/admin/snapshot/import?name=missing", headers=headers).status_code == 404
+
+    model = cfg.EMBED_MODEL
+    monkeypatch.setattr(cfg, "EMBED_MODEL", "another/model")
+    r = client.post("/admin/snapshot/import?name=nightly", headers=headers)
+    assert r.status_code == 409 and "EMBED_MODEL" in r.json()["detail"]
+    assert indexer._db().count() == 1    # nothing was touched
+    monkeypatch.setattr(cfg, "EMBED_MODEL", model)
+    monkeypatch.setattr(cfg, "SPLIT_CHUNK_SIZE", cfg.SPLIT_CHUNK_SIZE + 1)
+    r = client.post("/admin/snapshot/import?name=nightly", headers=headers)
+    assert r.status_code == 409 and "SPLIT_CHUNK_SIZE" in r.json()["detail"]
+    monkeypatch.setattr(cfg, "SPLIT_CHUNK_SIZE", cfg.SPLIT_CHUNK_SIZE - 1)
+
+    path = tmp_path / "snapshots" / "nightly"
+    manifest = json.loads((path / "manifest.json").read_text())
+    (path / "chunks" / "document.bin").write_bytes(b"tampered")
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.load(str(path))
+    assert manifest["files"]["chunks/document.bin"] != snapshot._sha256(str(path / "chunks" / "document.bin"))
+
+
+def test_export_is_not_disturbed_by_ingestion_and_holds_back_deletes(shards, tmp_path, monkeypatch):
+    import threading
+
+    keep = asyncio.run(indexer.ingest_upload(fake_upload("keep.txt", "Backups are retained for ninety days."), "acme"))
+    gone = asyncio.run(indexer.ingest_upload(fake_upload("gone.txt", "Pump seals are inspected every quarter."), "acme"))
+    write, started = snapshot._write, threading.Event()
+    release = threading.Event()
+
+    def slow_write(*args):
+        started.set()
+        release.wait(5)
+        return write(*args)
+
+    monkeypatch.setattr(snapshot, "_write", slow_write)
+    exporter = threading.Thread(target=snapshot.export, args=(str(tmp_path / "snap"), "acme"))
+    exporter.start()
+    assert started.wait(5)
+    # another tenant's upload doesn't matter; this tenant's delete waits for the export
+    asyncio.run(indexer.ingest_upload(fake_upload("other.txt", "Something else entirely."), "globex"))
+    deleter = threading.Thread(target=lambda: asyncio.run(indexer.delete_document(gone["doc_id"], "acme")))
+    deleter.start()
+    deleter.join(0.2)
+    assert deleter.is_alive()
+    release.set()
+    exporter.join()
+    deleter.join()
+
+    manifest = snapshot.read_manifest(str(tmp_path / "snap"))
+    assert manifest["documents"] == 2 and manifest["chunks"] == keep["chunks"] + gone["chunks"]
+    assert indexer.get_document(gone["doc_id"], "acme") is None
@@ -0,0 +1,90 @@
+import os
+import time
+import asyncio
+import threading
+from fastapi.testclient import TestClient
+from app.services import indexer, retrieval, tenants
+from app.tests.conftest import fake_upload
+from app import config as cfg
+
+
+def test_tenant_shards_are_isolated_and_fan_out(shards):
+    a = asyncio.run(indexer.ingest_upload(fake_upload("pumps.txt", "Pump seals are inspected every quarter. " * 40), "acme"))
+    b = asyncio.run(indexer.ingest_upload(fake_upload("backup.txt", "Backups are retained for ninety days. " * 40), "globex"))
+    assert tenants.discover() == sorted([cfg.DEFAULT_TENANT, "acme", "globex"])
+
+    # a tenant only ever sees its own chunks
+    only = retrieval.search("pump seals inspected", 3, tenants=["globex"])
+    assert only and {d.metadata["doc_id"] for d in only} == {b["doc_id"]}
+    assert indexer.get_document(a["doc_id"], "globex") is None
+    assert asyncio.run(indexer.delete_document(a["doc_id"], "globex")) is False
+
+    # both shards searched in parallel; the merge ranks the matching shard's chunks first
+    both = retrieval.search("pump seals inspected", 2, tenants=["acme", "globex"])
+    assert both[0].metadata["doc_id"] == a["doc_id"]
+    assert retrieval.shard_stats()["acme"]["searches"] >= 1
+
+    # resetting one tenant leaves the other's index and files alone
+    assert asyncio.run(indexer.reset_docs("acme")) is True
+    assert indexer._db("acme").count() == 0 and indexer._catalog(tenant="acme").count() == 0
+    assert indexer._db("globex").count() == b["chunks"]
+    assert not os.path.isdir(os.path.join(cfg.DATA_DIR, a["doc_id"]))
+    assert os.path.isdir(os.path.join(cfg.DATA_DIR, b["doc_id"]))
+
+
+def test_tenant_header_and_shard_stats(shards, monkeypatch):
+    from app.main import app
+
+    client = TestClient(app)
+    assert client.get("/files/", headers={"X-Tenant-ID": "no/slash"}).status_code == 400
+    assert client.get("/files/", headers={"X-Tenant-ID": "acme-"}).status_code == 400
+    monkeypatch.setattr(cfg, "MAX_TENANTS_PER_QUERY", 2)
+    monkeypatch.setattr(cfg, "OPENROUTER_API_KEY", "")
+    r = client.post("/ask/", json={"question": "q"}, headers={"X-Tenant-ID": "a,b,c"})
+    assert r.status_code == 400
+
+    asyncio.run(indexer.ingest_upload(fake_upload("pumps.txt", "Pump seals are inspected every quarter."), "acme"))
+    assert client.get("/files/", headers={"X-Tenant-ID": "acme"}).json()["items"][0]["filename"] == "pumps.txt"
+    assert client.get("/files/").json()["items"] == []
+
+    monkeypatch.setattr(cfg, "ADMIN_TOKEN", "secret")
+    got = client.get("/admin/shards", headers={"X-Admin-Token": "secret"}).json()["shards"]
+    assert got["acme"]["chunks"] == 1 and got["acme"]["documents"] == 1
+    assert got[cfg.DEFAULT_TENANT]["chunks"] == 0
+
+
+def test_upload_of_content_still_being_indexed_gets_the_pending_job(shards, monkeypatch):
+    from app.services import jobs
+
+    release = threading.Event()
+    index_file = indexer.index_file
+
+    def slow_index_file(*args, **kwargs):
+        release.wait(5)
+        return index_file(*args, **kwargs)
+
+    monkeypatch.setattr(indexer, "index_file", slow_index_file)
+    text = "Pump seals are inspected every quarter. " * 40
+    save = lambda tenant: asyncio.run(indexer.save_upload(fake_upload("pumps.txt", text), tenant))
+
+    first = jobs.submit(save("acme"), "pumps.txt")
+    again = save("acme")
+    assert again.duplicate is None                  # not in the catalog yet
+    assert jobs.submit(again, "pumps.txt") is first
+    assert not os.path.exists(again.path)
+    other = jobs.submit(save("globex"), "pumps.txt")   # the same content in another shard is its own document
+    assert other is not first
+
+    # saved while the first job runs, submitted once it is done: the job itself finds the duplicate
+    late = save("acme")
+    release.set()
+    deadline = time.monotonic() + 5
+    while (first.finished_at is None or other.finished_at is None) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert first.status == "done" and other.status == "done"
+    late_job = jobs.submit(late, "pumps.txt")
+    while late_job.finished_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert late_job.result["status"] == "duplicate" and late_job.doc_id == first.doc_id
+    assert not os.path.exists(late.path)
+    assert indexer._catalog(tenant="acme").count() == 1
@@ -0,0 +1,151 @@
+import asyncio
+import numpy as np
+from fastapi.testclient import TestClient
+from app.services import indexer
+from app.services.vectorstore import NumpyStore, match_where
+from app.tests.conftest import fake_upload
+from app import config as cfg
+
+
+def _clustered(n, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vecs = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_numpy_store_upsert_filter_delete_and_reopen(tmp_path):
+    store = NumpyStore(str(tmp_path / "vectors"))
+    vecs = np.eye(4, dtype=np.float32)
+    store.add(
+        ["a:1", "a:2", "b:1"],
+        ["one", "two", "three"],
+        [{"doc_id": "a", "ord": 0}, {"doc_id": "a", "ord": 1}, {"doc_id": "b", "ord": 0}],
+        vecs[:3],
+    )
+    assert store.query(vecs[1], 1).ids == ["a:2"]
+    assert store.query(vecs[1], 3, where={"doc_id": "b"}).ids == ["b:1"]
+    assert store.get(where={"$and": [{"doc_id": "a"}, {"ord": {"$gte": 1}}]}).documents == ["two"]
+
+    # upsert replaces in place, delete tombstones
+    store.add(["a:2"], ["two again"], [{"doc_id": "a", "ord": 1}], vecs[3:4])
+    store.delete(where={"doc_id": "b"})
+    assert store.count() == 2
+    store.close()
+
+    reopened = NumpyStore(str(tmp_path / "vectors"))
+    hit = reopened.query(vecs[3], 1)
+    assert hit.ids == ["a:2"] and hit.documents == ["two again"]
+    assert np.allclose(hit.embeddings[0], vecs[3])
+    assert reopened.get(ids=["b:1"]).ids == []
+
+
+def test_numpy_store_compaction_keeps_rows_addressable(tmp_path):
+    store = NumpyStore(str(tmp_path / "vectors"))
+    vecs = _clustered(3000, 16, 8)
+    ids = [f"c{i}" for i in range(3000)]
+    store.add(ids, ids, [{"i": i} for i in range(3000)], vecs)
+    store.delete(ids=ids[:2000])   # more tombstones than live rows triggers compact()
+
+    assert store.stats()["tombstones"] == 0
+    assert store.query(vecs[2500], 1).ids == ["c2500"]
+    assert store.get(ids=["c2999"]).metadatas == [{"i": 2999}]
+
+
+def test_numpy_store_ivf_recall(tmp_path):
+    vecs = _clustered(4000, 32, 40, seed=1)
+    ids = [str(i) for i in range(4000)]
+    exact = NumpyStore(str(tmp_path / "exact"))
+    ivf = NumpyStore(str(tmp_path / "ivf"), ivf_lists=32, nprobe=8)
+    for store in (exact, ivf):
+        store.add(ids, ids, [{}] * 4000, vecs)
+    assert ivf.stats()["ivf_lists"] == 32
+
+    queries = _clustered(50, 32, 40, seed=2)
+    recall = np.mean([
+        len(set(exact.query(q, 10).ids) & set(ivf.query(q, 10).ids)) / 10 for q in queries
+    ])
+    assert recall >= 0.9
+
+
+def test_match_where_operators():
+    meta = {"doc_id": "a", "ts": 5, "filename": "x.pdf"}
+    assert match_where(meta, {"doc_id": {"$in": ["a", "b"]}, "ts": {"$gt": 4}})
+    assert match_where(meta, {"$or": [{"doc_id": "z"}, {"filename": {"$ne": "y.pdf"}}]})
+    assert not match_where(meta, {"ts": {"$lt": 5}})
+    assert not match_where(meta, {"missing": {"$gte": 1}})
+
+
+def test_chroma_rebuild_swaps_in_new_params_and_keeps_concurrent_writes(tmp_path, monkeypatch):
+    from app.services.vectorstore import ChromaStore
+
+    vecs = _clustered(300, 16, 4)
+    store = ChromaStore(str(tmp_path / "chroma"), "tst")
+    ids = [f"d{i % 3}:{i}" for i in range(300)]
+    store.add(ids, [f"text {i}" for i in range(300)], [{"doc_id": i.split(":")[0]} for i in ids], vecs)
+    assert store.stats()["hnsw"] == {}
+
+    monkeypatch.setattr(cfg, "HNSW_M", 24)
+    monkeypatch.setattr(cfg, "HNSW_SEARCH_EF", 200)
+    copy = store._copy
+
+    def copy_and_write(old, new, batch):
+        # writes landing while the first batch is copied must survive the swap
+        if not hasattr(copy_and_write, "done"):
+            copy_and_write.done = True
+            store.add(["d9:0"], ["late"], [{"doc_id": "d9"}], vecs[:1])
+            store.delete(ids=["d1:1"])
+            store.delete(where={"doc_id": "d2"})
+            store.update_metadata(["d0:3"], [{"doc_id": "d0", "pinned": True}])
+        copy(old, new, batch)
+
+    store._copy = copy_and_write
+    details = store.rebuild(batch=64)
+    assert details["hnsw"] == {"hnsw:M": 24, "hnsw:search_ef": 200}
+    assert store.stats()["hnsw"] == details["hnsw"]
+    assert store.count() == 100 + 99 + 1
+    assert store.get(ids=["d9:0", "d1:1", "d2:2"]).ids == ["d9:0"]
+    assert store.get(ids=["d0:3"]).metadatas == [{"doc_id": "d0", "pinned": True}]
+    assert store.query(vecs[4], 1).ids == ["d1:4"]
+    assert store._collection_names() == {"tst"}
+
+    # a swap interrupted after the old collection was renamed away is rolled back on open
+    store._client.get_collection("tst").modify(name="tst.old")
+    reopened = ChromaStore(str(tmp_path / "chroma"), "tst")
+    assert reopened._collection_names() == {"tst"} and reopened.count() == 200
+
+
+def test_chroma_handle_follows_a_rebuild_made_by_another_store(tmp_path):
+    from app.services.vectorstore import ChromaStore
+
+    # another worker's store on the same directory keeps using the dropped collection's handle
+    vecs = np.eye(4, dtype=np.float32)
+    ours = ChromaStore(str(tmp_path / "chroma"), "tst")
+    theirs = ChromaStore(str(tmp_path / "chroma"), "tst")
+    ours.add(["a:0", "a:1"], ["zero", "one"], [{"doc_id": "a"}] * 2, vecs[:2])
+    ours.rebuild()
+
+    assert theirs.count() == 2
+    assert theirs.query(vecs[1], 1).ids == ["a:1"]
+    theirs.add(["b:0"], ["two"], [{"doc_id": "b"}], vecs[2:3])
+    assert ours.get(ids=["b:0"]).documents == ["two"]
+
+
+def test_rebuild_endpoint_reports_size_and_recall(shards, monkeypatch):
+    from app.main import app
+
+    docs = [asyncio.run(indexer.ingest_upload(fake_upload(f"doc{i}.txt", f"Topic {i} notes about pumps seals backups. " * 30), "acme"))
+            for i in range(4)]
+    asyncio.run(indexer.delete_document(docs[0]["doc_id"], "acme"))
+    live = sum(d["chunks"] for d in docs[1:])
+    monkeypatch.setattr(cfg, "ADMIN_TOKEN", "secret")
+    client = TestClient(app)
+    r = client.post("/admin/index/rebuild?sample=5&k=3", headers={"X-Admin-Token": "secret", "X-Tenant-ID": "acme"})
+    assert r.status_code == 200
+    report = r.json()
+    assert report["backend"] == "numpy" and report["rebuild"]["tombstones_removed"] == docs[0]["chunks"]
+    assert report["before"]["stats"]["tombstones"] == docs[0]["chunks"] and report["after"]["stats"]["tombstones"] == 0
+    assert report["before"]["count"] == report["after"]["count"] == live
+    assert report["after"]["queries"] == min(5, live) and report["after"]["recall_at_k"] == 1.0    # exact search
+    assert report["after"]["p95_ms"] >= report["after"]["p50_ms"] >= 0
+    assert indexer._db("acme").count() == live